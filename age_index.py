@@ -0,0 +1,292 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: AGE INDEX AND BINNED STATISTICS
+
+#import packages
+import numpy as np
+import pandas as pd
+
+#define functions
+def build_age_index(df, age = 'age_Ma', value = 'Dp17O_5305_corr_mean',
+	group = 'lithology'):
+	'''
+	Builds an age-sorted index over a table
+
+	Rows are sorted once by age, so any age range is one contiguous slice
+	found by binary search. Rows with missing ages are skipped.
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Table to index, e.g. the corrected sulfate compilation
+
+	age : str
+		Age column; defaults to 'age_Ma'
+
+	value : str
+		Value column summarized by `binned_stats` and `rolling_median`;
+		defaults to 'Dp17O_5305_corr_mean'
+
+	group : str or None
+		Grouping column; defaults to 'lithology'. Rows with a missing group
+		get code -1 and are left out of every per-group result.
+
+	Returns
+	-------
+	index : dict
+		Index arrays: 'age', 'value', and 'code' (group code) in age order,
+		'order' (positional rows of `df` in age order), and 'groups' (group
+		name of each code)
+	'''
+
+	a = df[age].to_numpy(dtype = float)
+	rows = np.flatnonzero(np.isfinite(a))
+	o = rows[np.argsort(a[rows], kind = 'stable')]
+
+	if group is None:
+		codes, groups = np.zeros(len(df), dtype = np.int64), np.array([None])
+	else:
+		codes, groups = pd.factorize(df[group], sort = True)
+
+	index = {
+		'age': a[o],
+		'value': df[value].to_numpy(dtype = float)[o],
+		'code': codes[o],
+		'order': o,
+		'groups': np.asarray(groups),
+		}
+
+	return index
+
+def _group_codes(index, groups):
+	'''
+	Codes of the given groups
+	'''
+
+	if isinstance(groups, str):
+		groups = [groups]
+
+	return np.flatnonzero(np.isin(index['groups'], list(groups)))
+
+def _group_mask(index, groups):
+	'''
+	Mask of index entries in the given groups (all if None)
+	'''
+
+	if groups is None:
+		return np.ones(len(index['age']), dtype = bool)
+
+	return np.isin(index['code'], _group_codes(index, groups))
+
+def query_age(index, lo = -np.inf, hi = np.inf, groups = None):
+	'''
+	Rows with lo <= age <= hi
+
+	Parameters
+	----------
+	index : dict
+		Age index, as returned by `build_age_index`
+
+	lo, hi : float
+		Age range, inclusive
+
+	groups : str, list, or None
+		Only return rows in these groups (e.g., lithologies)
+
+	Returns
+	-------
+	rows : np.array
+		Positional row indices, in age order
+	'''
+
+	i = np.searchsorted(index['age'], lo, side = 'left')
+	j = np.searchsorted(index['age'], hi, side = 'right')
+
+	rows = index['order'][i:j]
+
+	if groups is not None:
+		rows = rows[np.isin(index['code'][i:j], _group_codes(index, groups))]
+
+	return rows
+
+def _segment_medians(v, starts, n):
+	'''
+	Medians of sorted segments of v
+	'''
+
+	mid = starts + (n - 1)//2
+	hi = np.minimum(mid + 1, len(v) - 1)
+
+	return np.where(n % 2, v[mid], (v[mid] + v[hi])/2)
+
+def binned_stats(index, edges, by_group = True, groups = None):
+	'''
+	Summary statistics of the indexed values in age bins
+
+	Parameters
+	----------
+	index : dict
+		Age index, as returned by `build_age_index`
+
+	edges : array-like or float
+		Bin edges, in age units; if a single number, bins of that width
+		spanning the indexed ages
+
+	by_group : bool
+		If True, summarizes each group (e.g., lithology) separately
+
+	groups : str, list, or None
+		Only use these groups
+
+	Returns
+	-------
+	stats : pd.DataFrame
+		Table with columns 'age_lo', 'age_hi', 'count', 'median', 'mad'
+		(median absolute deviation), and 'min', indexed by bin number (and
+		group). Empty bins are omitted, as are missing values.
+	'''
+
+	age, v, code = index['age'], index['value'], index['code']
+	keep = np.isfinite(v) & _group_mask(index, groups)
+
+	if by_group:
+		keep &= code >= 0
+
+	age, v, code = age[keep], v[keep], code[keep]
+
+	if np.ndim(edges) == 0:
+		w = float(edges)
+		lo = np.floor(age.min()/w)*w if len(age) else 0
+		hi = age.max() if len(age) else 0
+		edges = lo + w*np.arange(int((hi - lo)//w) + 2)
+
+	edges = np.asarray(edges, dtype = float)
+	nb = len(edges) - 1
+
+	#bin of each entry; ages are sorted, so this is a merge
+	b = np.searchsorted(edges, age, side = 'right') - 1
+	b[age == edges[-1]] = nb - 1
+	ok = (b >= 0) & (b < nb)
+
+	key = b[ok] + (code[ok]*nb if by_group else 0)
+	v = v[ok]
+
+	#sort by bin, then value within bin
+	o = np.lexsort((v, key))
+	key, v = key[o], v[o]
+
+	starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) \
+		else np.zeros(0, dtype = np.int64)
+	n = np.diff(np.r_[starts, len(v)])
+
+	med = _segment_medians(v, starts, n)
+
+	#absolute deviations, re-sorted within each bin
+	dev = np.abs(v - np.repeat(med, n))
+	dev = dev[np.lexsort((dev, key))]
+	mad = _segment_medians(dev, starts, n)
+
+	kb = key[starts] % nb
+
+	stats = pd.DataFrame({
+		'age_lo': edges[kb],
+		'age_hi': edges[kb + 1],
+		'count': n,
+		'median': med,
+		'mad': mad,
+		'min': np.minimum.reduceat(v, starts) if len(v) else [],
+		})
+
+	if by_group:
+		stats.index = pd.MultiIndex.from_arrays(
+			[index['groups'][key[starts] // nb], kb], names = ['group', 'bin'])
+	else:
+		stats.index = pd.Index(kb, name = 'bin')
+
+	return stats
+
+def _range_kth(v, lo, hi, k):
+	'''
+	k-th smallest (from 0) of v[lo:hi] for each query, from a wavelet matrix
+	over the ranks of v; all queries descend one bit level at a time, so the
+	work is O((len(v) + len(lo)) log len(v)). Ranges must be non-empty.
+	'''
+
+	n = len(v)
+	o = np.argsort(v, kind = 'stable')
+	r = np.empty(n, dtype = np.int64)
+	r[o] = np.arange(n)
+
+	lo, hi, k = (np.array(a, dtype = np.int64) for a in (lo, hi, k))
+	res = np.zeros(len(lo), dtype = np.int64)
+
+	for level in range(max(n - 1, 1).bit_length() - 1, -1, -1):
+
+		bit = (r >> level) & 1
+		z = np.r_[0, np.cumsum(bit == 0)]
+		nz = z[-1]
+
+		#zeros before each range end; queries with k below the count of
+		# zeros in range go to the zeros half, the rest to the ones half
+		zl, zr = z[lo], z[hi]
+		left = k < zr - zl
+
+		res |= (~left).astype(np.int64) << level
+		k = np.where(left, k, k - (zr - zl))
+		lo = np.where(left, zl, nz + lo - zl)
+		hi = np.where(left, zr, nz + hi - zr)
+
+		r = np.concatenate((r[bit == 0], r[bit == 1]))
+
+	return v[o[res]]
+
+def rolling_median(index, window, at = None, groups = None):
+	'''
+	Median of the indexed values in a sliding age window
+
+	Window bounds are found for every center at once by binary search; the
+	two middle values of every window are then selected together with a
+	wavelet matrix over the value ranks (see `_range_kth`). With n values
+	and m centers this is O((n + m) log n), independent of the window
+	width.
+
+	Parameters
+	----------
+	index : dict
+		Age index, as returned by `build_age_index`
+
+	window : float
+		Full window width, in age units; each center uses values within
+		+/- window/2
+
+	at : array-like or None
+		Window centers; defaults to the age of each indexed value
+
+	groups : str, list, or None
+		Only use these groups
+
+	Returns
+	-------
+	med : pd.Series
+		Window medians (NaN where the window is empty), indexed by center
+	'''
+
+	keep = np.isfinite(index['value']) & _group_mask(index, groups)
+	age, v = index['age'][keep], index['value'][keep]
+
+	at = age if at is None else np.asarray(at, dtype = float)
+
+	lo = np.searchsorted(age, at - window/2, side = 'left')
+	hi = np.searchsorted(age, at + window/2, side = 'right')
+
+	med = np.full(len(at), np.nan)
+	ok = hi > lo
+
+	if ok.any():
+		lo, hi = lo[ok], hi[ok]
+		m = hi - lo
+
+		#lower and upper middle values; equal for odd counts
+		mid = _range_kth(v, np.r_[lo, lo], np.r_[hi, hi],
+			np.r_[(m - 1)//2, m//2])
+		med[ok] = (mid[:len(m)] + mid[len(m):])/2
+
+	return pd.Series(med, index = pd.Index(at, name = 'age'), name = 'median')
@@ -3,17 +3,85 @@
 ### 11. APRIL 2023
 
 #import packages
-import matplotlib.pyplot as plt
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 
-from scipy.stats import linregress
+from calibration import solve_calibration
+import profiling
+
+from partition import PARTITION_KEYS, dataset, match, select, table_partition, \
+	values
+from regression import bootstrap_groups, regress_groups, york_groups
+
+#NOTE: matplotlib and scipy.stats are imported inside the functions that need
+# them so that importing this module for the conversions stays cheap
 
 #set directory for data
 path = '../00 data/'
 
+#read tables through the binary cache in table_cache.py by default
+use_cache = True
+
+#age window (Ma) of the binned median +/- MAD and rolling median overlaid on
+# FIG. O-MIF5 panel B; None for no overlay
+so4_overlay = None
+
+#point counts above which a group of samples is drawn as a rasterized layer,
+# or as a 2-D density image (None to never switch); axes, text, and reference
+# lines stay vector
+raster_points = 5000
+density_points = 200000
+
+#bins per axis of density images
+density_bins = 256
+
+#render modes, from least to most reduced
+RENDER_MODES = ['vector', 'raster', 'density']
+
+#data tables used by the figures, keyed by name
+TABLES = {
+	'O3_rxn_rates': 'O3_rxn_rates.csv',
+	'exp': 'exp_compilation.csv',
+	'atmos': 'atmos_compilation.csv',
+	'so4': 'so4_compilation.csv',
+	'standards': 'standards.csv',
+}
+
+#text encoding of each table's csv
+ENCODINGS = {
+	'O3_rxn_rates': 'ISO-8859-1',
+	'exp': 'ISO-8859-1',
+	'atmos': 'ISO-8859-1',
+	'so4': 'ISO-8859-1',
+	'standards': 'utf-8',
+}
+
+#laboratory codes of the 'lab' column (see README), with lab names
+LABS = {
+	'B': 'Bao',
+	'Bin': 'Bindeman',
+	'IPGP': 'IPGP',
+	'JN': 'Johnston',
+	'JO': 'Johnston',
+	'K\xf6': 'Cologne',
+	'Sh': 'Sharp',
+	'TT': 'Tokyo Tech',
+	'Th': 'Thiemens',
+}
+
+#other spellings of lab codes; the compilations store the o-umlaut of 'K\xf6'
+# as the Mac Roman byte 0x9a, which reads as '\x9a' in ISO-8859-1
+LAB_ALIASES = {
+	'K\x9a': 'K\xf6',
+}
+
 #define functions
-def Dp_d_to_R(Dp17O, d18O, th = 0.5305):
+def Dp_d_to_R(Dp17O, d18O, th = 0.5305, out = None):
 	'''
 	Converts Dp17O and d18O values to R values
 
@@ -28,6 +96,10 @@ def Dp_d_to_R(Dp17O, d18O, th = 0.5305):
 	th : float
 		Reference line theta; defaults to 0.5305
 
+	out : tuple or None
+		(R17, R18) output arrays; allocated if None. R18 may be `d18O`
+		itself, but R17 cannot share memory with either input.
+
 	Returns
 	-------
 	R17 : np.array
@@ -37,15 +109,25 @@ def Dp_d_to_R(Dp17O, d18O, th = 0.5305):
 		Array of corresponding R18 values
 	'''
 
+	if out is None:
+		out = (_out(None, Dp17O, d18O), _out(None, Dp17O, d18O))
+
+	R17, R18 = out
+
 	#first get R18
-	R18 = d18O/1000 + 1
+	np.multiply(d18O, 1e-3, out = R18)
+	R18 += 1
 
-	#then get R17
-	R17 = np.exp( Dp17O/1000 + th*np.log(R18) )
+	#then get R17 = exp(Dp17O/1000 + th*ln(R18)), all in place
+	np.log(R18, out = R17)
+	R17 *= 1000*th
+	R17 += Dp17O
+	R17 *= 1e-3
+	np.exp(R17, out = R17)
 
 	return R17, R18
 
-def R_to_Dp_d(R17, R18, th = 0.5305):
+def R_to_Dp_d(R17, R18, th = 0.5305, out = None):
 	'''
 	Converts R values to Dp17O and d18O values
 
@@ -60,6 +142,15 @@ def R_to_Dp_d(R17, R18, th = 0.5305):
 	th : float
 		Reference line theta; defaults to 0.5305
 
+	out : tuple or None
+		(Dp17O, d18O) output arrays; allocated if None. Neither may share
+		memory with the inputs.
+
+	Notes
+	-----
+	Round trips through `Dp_d_to_R` are exact to ~1e-13 in float64; in
+	float32, R values near 1 limit Dp17O to ~1e-4 precision.
+
 	Returns
 	-------
 	Dp17O : array-like
@@ -69,849 +160,640 @@ def R_to_Dp_d(R17, R18, th = 0.5305):
 		Array of d18O values
 	'''
 
-	#first get d18O
-	d18O = 1000*(R18 - 1)
+	if out is None:
+		out = (_out(None, R17, R18), _out(None, R17, R18))
+
+	Dp17O, d18O = out
+
+	#get Dp17O = 1000*(ln(R17) - th*ln(R18)), using d18O as scratch
+	np.log(R18, out = d18O)
+	d18O *= th
+	np.log(R17, out = Dp17O)
+	Dp17O -= d18O
+	Dp17O *= 1000
 
-	#then get Dp17O
-	Dp17O = 1000*( np.log(R17) - th*np.log(R17) )
+	#then get d18O
+	np.subtract(R18, 1, out = d18O)
+	d18O *= 1000
 
 	return Dp17O, d18O
 
-def get_line(x,y):
+def _out(out, *args):
 	'''
+	Returns `out`, or a new float array shaped and typed for the inputs
+
+	float32 inputs give float32 outputs; anything else gives float64.
 	'''
-	m = (y[1]-y[0])/(x[1]-x[0])
-	b = y[0] - x[0]*m
 
-	return m, b
+	if out is not None:
+		return out
 
-#================#
-# THEORY FIGURES #
-#================#
+	args = [np.asarray(a) for a in args]
+	shape = np.broadcast_shapes(*[a.shape for a in args])
+	dtype = np.result_type(np.float32, *[a.dtype for a in args])
 
-# FIG. THEO-1: Self-shielding schematic
-#	* following Fig. 6 from Thiemens 2021
+	return np.empty(shape, dtype = dtype)
 
-# FIG. THEO-2: O3 formation rates as a function of symmetry (Janssen et al. 2001)
-#	* following Fig. 9 from Thiemens 2021
+def d_to_dp(d, out = None):
+	'''
+	Converts delta values to delta-prime values, 1000*ln(1 + d/1000)
 
-#import data
-df = pd.read_csv(path+'O3_rxn_rates.csv', encoding='ISO-8859-1')
-df = df.dropna()
+	Parameters
+	----------
+	d : array-like
+		Array of delta values
 
-#make figure
-fig,ax = plt.subplots(1,2,
-	figsize = (7.48,3),
-	sharey = True,
-	)
+	out : np.array or None
+		Output array, which may be `d` itself for an in-place conversion;
+		allocated if None
 
-ax[1].set_box_aspect(1)
+	Returns
+	-------
+	dp : np.array
+		Array of delta-prime values
+	'''
 
-#make color dict
-cs = plt.get_cmap(name = 'Accent', lut = 6)
+	out = _out(out, d)
 
-cd = {'s' : cs.colors[2],
-	  'as' : cs.colors[3]
-	  }
+	np.multiply(d, 1e-3, out = out)
+	np.log1p(out, out = out)
+	out *= 1000
 
-#~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL A: RATE BAR PLOT #
-#~~~~~~~~~~~~~~~~~~~~~~~~#
+	return out
 
-#group data by mass
-gr = df.groupby('mass')
+def dp_to_d(dp, out = None):
+	'''
+	Converts delta-prime values to delta values, 1000*(exp(dp/1000) - 1)
 
-#calculate number of masses and isotopomers
-ni = gr['channel'].count().max()
-nm = len(gr)
+	Parameters
+	----------
+	dp : array-like
+		Array of delta-prime values
 
-#make x array and plot
-#X = np.arange(nm)
+	out : np.array or None
+		Output array, which may be `dp` itself for an in-place conversion;
+		allocated if None
 
+	Returns
+	-------
+	d : np.array
+		Array of delta values
+	'''
 
-for n,g in gr:
+	out = _out(out, dp)
 
-	#make x array
-	x = n + np.arange(len(g))*1/ni
+	np.multiply(dp, 1e-3, out = out)
+	np.expm1(out, out = out)
+	out *= 1000
 
-	#make color array
-	c = [cd[r['sas']] for i,r in g.iterrows()]
+	return out
 
-	#plot bar plot
-	ax[0].bar(
-		x, 
-		g['k_mean']-1, 
-		yerr = g['k_std'],
-		bottom = 1,
-		color = c,
-		edgecolor = 'k',
-		width = 1/ni
-		)
+def dp_to_Dp(dp17O, dp18O, th = 0.5305, out = None):
+	'''
+	Calculates Dp17O from delta-prime values, dp17O - th*dp18O
 
-	#also plot as scatterplot
-	ax[0].scatter(
-		x, 
-		g['k_mean'],
-		facecolor = c, 
-		edgecolor = 'k',
-		linewidth = 0.5,
-		s = 50
-		)
+	Parameters
+	----------
+	dp17O : array-like
+		Array of dp17O values
 
-#add zero line
-ax[0].plot(
-	[47, 55], 
-	[1,1], 
-	linewidth = 2, 
-	color = 'k', 
-	zorder = 0
-	)
-
-#set labels and limits
-# ax[0].set_ylim([-0.1, 0.55])
-ax[0].set_xlim([47.5, 54.5])
-
-ax[0].set_xlabel('mass (amu)')
-ax[0].set_ylabel(r'relative formation rate, $k^x/k^{666}$')
-
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL B: DZPE AND ETA EFFECT #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-
-#calculate regression line
-rdf = df[df['in_reg'] == True]
-res = linregress(rdf['DZPE'],rdf['k_mean'])
-
-#get symmetric and asymmetric colors
-c = [cd[r['sas']] for i,r in df.iterrows()]
-
-# plot data
-
-#first symmetric data
-dat = df[df['sas'] == 's']
-ax[1].errorbar(
-	dat['DZPE'],
-	dat['k_mean'],
-	yerr = dat['k_std'],
-	fmt = 'o',
-	mfc = cd['s'],
-	mec = 'k',
-	ecolor = 'k',
-	markersize = 8,
-	)
-
-
-#next, asymmetric data
-dat = df[df['sas'] == 'as']
-ax[1].errorbar(
-	dat['DZPE'],
-	dat['k_mean'],
-	yerr = dat['k_std'],
-	fmt = 'o',
-	mfc = cd['as'],
-	mec = 'k',
-	ecolor = 'k',
-	markersize = 8,
-	)
-
-#plot regression line
-x = np.linspace(-30,30,10)
-y = x*res.slope + res.intercept
-
-ax[1].plot(x, y, linewidth = 2, color = 'k')
-
-#set limits and labels
-ax[1].set_xlim([-25,25])
-ax[1].set_ylim([0.75,1.55])
-
-ax[1].set_xlabel(r'$\Delta(ZPE)$ (cm$^{-1}$)')
-# ax[1].set_ylabel(r'relative formation rate, $k^x/k^{666}$')
-
-plt.tight_layout()
-
-#save figure
-fig.savefig('Fig_TH_1.pdf',
-	bbox_inches = 0,
-	transparent = True,
-	)
+	dp18O : array-like
+		Array of dp18O values
 
-# FIG. THEO-3: Potential energy curve schematic (Heays et al. 2017)
-#	* following Fig. 14 from Thiemens 2021??
+	th : float
+		Reference line theta; defaults to 0.5305
 
+	out : np.array or None
+		Output array, which may be `dp17O` or `dp18O` itself; allocated if
+		None
 
-#===============#
-# O-MIF FIGURES #
-#===============#
+	Returns
+	-------
+	Dp17O : np.array
+		Array of Dp17O values, using inputted ref line theta value
+	'''
 
-# FIG. O-MIF1: Experimental three-isotope plot
-#	* O3 production
-#	* O3 dissociation
-#	* CO photolysis
-#	* CO2 photolysis
-#	* H2O2 formation
+	out = _out(out, dp17O, dp18O)
 
-#import data
-df = pd.read_csv(path+'exp_compilation.csv', encoding='ISO-8859-1')
-df['dp18O'] = 1000*np.log(df['d18O_mean']/1000 + 1)
-df['dp17O'] = 1000*np.log(df['d17O_mean']/1000 + 1)
-
-#make figure
-fig,ax = plt.subplots(2,3,
-	figsize = (7.48,6)
-	)
-
-#flatten it for iterating
-ax = ax.flatten()
-
-#make all square
-for i in range(len(ax)):
-	ax[i].set_box_aspect(1)
-	
-ax[4].set_xlabel(r"$\delta ' ^{18} O$ (‰ vs. starting)")
-ax[0].set_ylabel(r"$\delta ' ^{17} O$ (‰ vs. starting)")
-
-#make color scheme
-cs = plt.get_cmap(name = 'Accent', lut = 6)
-
-cm = {
-	'electrical': cs.colors[0],
-	'microwave': cs.colors[1],
-	'photo': cs.colors[4],
-	'thermal': cs.colors[3],
-	'recombination': cs.colors[5],
-	'water_electrolysis': cs.colors[2]
-}
+	if th == 0:
+		np.copyto(out, dp17O)
 
-#~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL A: O3 PRODUCTION #
-#~~~~~~~~~~~~~~~~~~~~~~~~#
+	elif np.shares_memory(out, dp17O):
+		#out = -th*(dp17O/-th + dp18O), which needs no temporary
+		out /= -th
+		out += dp18O
+		out *= -th
 
-#plot O3 production
-ozprod = df[df['experiment_type'].str.contains('ozone_generation')]
-ets = set(ozprod['experiment_type'])
+	else:
+		np.multiply(dp18O, -th, out = out)
+		out += dp17O
 
-for i, et in enumerate(ets):
+	return out
 
-	#pull color
-	c = [val for key, val in cm.items() if key in et][0]
+def convert_th(Dp17O, d18O, th_from, th_to = 0.5305, out = None):
+	'''
+	Converts Dp17O values from one reference line theta to another
 
-	#get experiments of that type
-	temp = ozprod[ozprod['experiment_type'] == et]
+	Since Dp17O = dp17O - th*dp18O, the conversion is
+	Dp17O_to = Dp17O_from + (th_from - th_to)*dp18O.
 
-	#now separate into O2 and O3
-	o2 = temp[temp['compound'] == 'O2']
-	o3 = temp[temp['compound'] == 'O3']
+	Parameters
+	----------
+	Dp17O : array-like
+		Array of Dp17O values, using ref line theta `th_from`
 
-	#plot O3
-	ax[0].scatter(o3['dp18O'],o3['dp17O'],
-		facecolor = c,
-		edgecolors = 'k',
-		linewidths = 0.5,
-		s = 50,
-		marker = 'o',
-		label = et+'_O3',
-		)
+	d18O : array-like
+		Array of d18O values (not delta-prime)
 
-	#plot O2
-	ax[0].scatter(o2['dp18O'],o2['dp17O'],
-		facecolor = 'w',
-		edgecolors = c,
-		linewidths = 1,
-		s = 50,
-		marker = 'o',
-		label = et+'_O2',
-		)
+	th_from : float
+		Reference line theta of the inputted Dp17O values
 
-#add MIF and MDF lines
-lx = np.array([-100,200])
+	th_to : float
+		Reference line theta of the returned Dp17O values; defaults to 0.5305
 
-ax[0].plot(lx, lx,
-	linewidth = 2,
-	color = 'k',
-	label = 'MIF (th = 1)',
-	zorder = 0
-	)
+	out : np.array or None
+		Output array, which may be `d18O` itself but not `Dp17O`; allocated
+		if None
 
-ax[0].plot(lx, 0.5305*lx,
-	'k:',
-	linewidth = 2,
-	label = 'MDF (th = 0.5305)',
-	zorder = 0,
-	)
+	Returns
+	-------
+	Dp17O : np.array
+		Array of Dp17O values, using ref line theta `th_to`
+	'''
 
-ax[0].set_xlim([-85,150])
-ax[0].set_ylim([-85,150])
+	out = _out(out, Dp17O, d18O)
 
-ax[0].set_title(r'$O_3$ production')
+	if np.shares_memory(out, Dp17O):
+		raise ValueError('out cannot share memory with Dp17O')
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL B: O3 DISSOCIATION #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	#dp18O into the output, then scale and offset in place
+	d_to_dp(d18O, out = out)
+	out *= th_from - th_to
+	out += Dp17O
 
-#plot O3 production
-ozdiss = df[df['experiment_type'].str.contains('ozone_decomposition')]
-ets = set(ozdiss['experiment_type'])
+	return out
 
-for i, et in enumerate(ets):
+def get_line(x,y):
+	'''
+	Calculates the slope and intercept of the line through two points
 
-	#pull color
-	c = [val for key, val in cm.items() if key in et][0]
+	Parameters
+	----------
+	x : array-like
+		Length-2 array of x values
 
-	#get experiments of that type
-	temp = ozdiss[ozdiss['experiment_type'] == et]
+	y : array-like
+		Length-2 array of y values
 
-	#now separate into O2 and O3
-	o2 = temp[temp['compound'] == 'O2']
-	o3 = temp[temp['compound'] == 'O3']
+	Returns
+	-------
+	m : float
+		Line slope
 
-	#plot O3
-	ax[1].scatter(o3['dp18O'],o3['dp17O'],
-		facecolor = c,
-		edgecolors = 'k',
-		linewidths = 0.5,
-		s = 50,
-		marker = 'o',
-		label = et+'_O3',
-		)
+	b : float
+		Line intercept
+	'''
+	m = (y[1]-y[0])/(x[1]-x[0])
+	b = y[0] - x[0]*m
 
-	#plot O2
-	ax[1].scatter(o2['dp18O'],o2['dp17O'],
-		facecolor = 'w',
-		edgecolors = c,
-		linewidths = 1,
-		s = 50,
-		marker = 'o',
-		label = et+'_O2',
-		)
+	return m, b
+
+#===============#
+# DATA HANDLING #
+#===============#
+
+def fix_labs(df):
+	'''
+	Replaces other spellings of lab codes (see `LAB_ALIASES`) in the 'lab'
+	column of a table, if it has one
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Table
+
+	Returns
+	-------
+	df : pd.DataFrame
+		Table with the lab codes of `LABS`
+	'''
 
-#add MIF and MDF lines
-lx = np.array([-100,200])
+	if 'lab' in df.columns:
+		df['lab'] = df['lab'].replace(LAB_ALIASES)
 
-ax[1].plot(lx, lx,
-	linewidth = 2,
-	color = 'k',
-	label = 'MIF (th = 1)',
-	zorder = 0
-	)
+	return df
 
-ax[1].plot(lx, 0.5305*lx,
-	'k:',
-	linewidth = 2,
-	label = 'MDF (th = 0.5305)',
-	zorder = 0,
-	)
+def read_table(name, path = None):
+	'''
+	Reads a raw data table from the data directory
 
-ax[1].set_xlim([-45,95])
-ax[1].set_ylim([-45,95])
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `TABLES`
 
-ax[1].set_title(r'$O_3$ dissociation')
+	path : str or None
+		Data directory; defaults to the module-level `path`
 
+	Returns
+	-------
+	df : pd.DataFrame
+		Raw table, as stored in the csv file except for lab codes, which
+		are spelled as in `LABS` (see `fix_labs`)
+	'''
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL C: H2O2 FORMATION #
-#~~~~~~~~~~~~~~~~~~~~~~~~~#
+	if path is None:
+		path = globals()['path']
 
-#plot O3 production
-perform = df[df['experiment_type'].str.contains('peroxide_formation')]
-ets = set(perform['experiment_type'])
+	fname = os.path.join(path, TABLES[name])
 
-for i, et in enumerate(ets):
+	with profiling.stage('read_csv', table = name):
 
-	#pull color
-	c = [val for key, val in cm.items() if key in et][0]
+		#standards are indexed by standard name
+		if name == 'standards':
+			return fix_labs(pd.read_csv(fname, index_col = 0,
+				encoding = ENCODINGS[name]))
 
-	#get experiments of that type
-	temp = perform[perform['experiment_type'] == et]
+		return fix_labs(pd.read_csv(fname, encoding = ENCODINGS[name]))
 
-	#now separate into O2 and H2O2
-	o2 = temp[temp['compound'] == 'O2']
-	h2o2 = temp[temp['compound'] == 'H2O2']
+def derive_table(name, df):
+	'''
+	Adds the derived delta-prime columns used by the figures to a raw table
 
-	#plot H2O2
-	ax[2].scatter(h2o2['dp18O'],h2o2['dp17O'],
-		facecolor = c,
-		edgecolors = 'k',
-		linewidths = 0.5,
-		s = 50,
-		marker = 'o',
-		label = et+'_O3',
-		)
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `TABLES`
 
-	#plot O2
-	ax[2].scatter(o2['dp18O'],o2['dp17O'],
-		facecolor = 'w',
-		edgecolors = c,
-		linewidths = 1,
-		s = 50,
-		marker = 'o',
-		label = et+'_O2',
-		)
+	df : pd.DataFrame
+		Raw table, as returned by `read_table`
 
-#add MIF and MDF lines
-lx = np.array([-100,200])
+	Returns
+	-------
+	df : pd.DataFrame
+		Table with derived columns added
+	'''
 
-ax[2].plot(lx, lx,
-	linewidth = 2,
-	color = 'k',
-	label = 'MIF (th = 1)',
-	zorder = 0
-	)
+	if name == 'O3_rxn_rates':
+		df = df.dropna()
 
-ax[2].plot(lx, 0.5305*lx,
-	'k:',
-	linewidth = 2,
-	label = 'MDF (th = 0.5305)',
-	zorder = 0,
-	)
+	elif name in ['exp', 'atmos']:
+		df = df.copy()
+		dp18O = d_to_dp(df['d18O_mean'].to_numpy(dtype = float))
+		dp17O = d_to_dp(df['d17O_mean'].to_numpy(dtype = float))
 
-ax[2].set_xlim([-30,62])
-ax[2].set_ylim([-30,62])
+		df['dp18O'] = dp18O
+		df['dp17O'] = dp17O
 
-ax[2].set_title(r'$H_2O_2$ production')
+		if name == 'atmos':
+			df['Dp17O_5305'] = dp_to_Dp(dp17O, dp18O)
 
+	elif name == 'so4':
+		df = df.copy()
+		df['dp18O'] = d_to_dp(df['d18O_mean'].to_numpy(dtype = float))
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL D: CO DISSOCIATION #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	return df
 
-#plot O3 production
-codiss = df[df['experiment_type'].str.contains('CO_decomposition')]
-ets = set(codiss['experiment_type'])
+def load_table(name, path = None, cache = None):
+	'''
+	Reads a data table and adds its derived columns
 
-for i, et in enumerate(ets):
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `TABLES`
 
-	#pull color
-	c = [val for key, val in cm.items() if key in et][0]
+	path : str or None
+		Data directory; defaults to the module-level `path`
 
-	#get experiments of that type
-	temp = codiss[codiss['experiment_type'] == et]
+	cache : bool or None
+		If True, reads the table through the binary cache (see
+		`table_cache.read_cached`), which is rebuilt whenever the csv changes
+		and leaves out free-text columns no figure uses ('notes'); defaults
+		to the module-level `use_cache`
 
-	#now separate into O and CO2
-	o = temp[temp['compound'] == 'O']
-	co2 = temp[temp['compound'] == 'CO2']
+	Returns
+	-------
+	df : pd.DataFrame
+		Table with derived columns
+	'''
 
-	#plot CO2
-	ax[3].scatter(co2['dp18O'],co2['dp17O'],
-		facecolor = c,
-		edgecolors = 'k',
-		linewidths = 0.5,
-		s = 50,
-		marker = 'o',
-		label = et+'_O3',
-		)
+	if cache is None:
+		cache = use_cache
 
-	#plot O
-	ax[3].scatter(o['dp18O'],o['dp17O'],
-		facecolor = 'w',
-		edgecolors = c,
-		linewidths = 1,
-		s = 50,
-		marker = 'o',
-		label = et+'_O2',
-		)
+	if cache:
+		import table_cache
+		with profiling.stage('read_cache', table = name):
+			df = table_cache.read_cached(name, path = path)
 
-#add MIF and MDF lines
-lx = np.array([-200,5000])
+	else:
+		df = read_table(name, path = path)
 
-ax[3].plot(lx, lx,
-	linewidth = 2,
-	color = 'k',
-	label = 'MIF (th = 1)',
-	zorder = 0
-	)
+	with profiling.stage('convert', table = name):
+		return derive_table(name, df)
 
-ax[3].plot(lx, 0.5305*lx,
-	'k:',
-	linewidth = 2,
-	label = 'MDF (th = 0.5305)',
-	zorder = 0,
-	)
+def load_tables(names, path = None, tables = None, cache = None):
+	'''
+	Loads several tables, skipping any that are already loaded
 
-ax[3].set_xlim([-200,5000])
-ax[3].set_ylim([-200,5000])
+	Parameters
+	----------
+	names : iterable
+		Table names to load
 
-ax[3].set_title(r'$CO$ dissociation')
+	path : str or None
+		Data directory; defaults to the module-level `path`
 
+	tables : dict or None
+		Already-loaded tables, keyed by name; these are not re-read
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL E: CO2 DISSOCIATION #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	cache : bool or None
+		Whether to read through the binary cache; defaults to the
+		module-level `use_cache`
 
-#plot O3 production
-co2diss = df[df['experiment_type'].str.contains('CO2_decomposition')]
-ets = set(co2diss['experiment_type'])
+	Returns
+	-------
+	tables : dict
+		Loaded tables, keyed by name
+	'''
 
-for i, et in enumerate(ets):
+	tables = dict(tables or {})
 
-	#pull color
-	c = [val for key, val in cm.items() if key in et][0]
+	for name in names:
+		if name not in tables:
+			tables[name] = load_table(name, path = path, cache = cache)
 
-	#get experiments of that type
-	temp = co2diss[co2diss['experiment_type'] == et]
+	return tables
 
-	#now separate into O2
-	o2 = temp[temp['compound'] == 'O2']
+#=============================#
+# SLOPES AND LAB CALIBRATIONS #
+#=============================#
 
-	#plot O2
-	ax[4].scatter(o2['dp18O'],o2['dp17O'],
-		facecolor = 'w',
-		edgecolors = c,
-		linewidths = 1,
-		s = 50,
-		marker = 'o',
-		label = et+'_O2',
-		)
+def _dp_std(df, sd = None):
+	'''
+	dp18O and dp17O uncertainties of each row, from 'd18O_std' and
+	'd17O_std' (see `exp_slopes`)
+	'''
 
-#add MIF and MDF lines
-lx = np.array([-100,100])
+	out = []
 
-ax[4].plot(lx, lx,
-	linewidth = 2,
-	color = 'k',
-	label = 'MIF (th = 1)',
-	zorder = 0
-	)
+	for i, iso in enumerate(('d18O', 'd17O')):
 
-ax[4].plot(lx, 0.5305*lx,
-	'k:',
-	linewidth = 2,
-	label = 'MDF (th = 0.5305)',
-	zorder = 0,
-	)
+		s = df[iso + '_std'].to_numpy(dtype = float)
+		fill = np.nanmedian(s) if sd is None else sd[i]
+		s = np.where(np.isnan(s), fill, s)
 
-ax[4].set_xlim([-90,45])
-ax[4].set_ylim([-35,100])
+		#d(dp)/d(d) = 1/(1 + d/1000)
+		out.append(s / (1 + df[iso + '_mean'].to_numpy(dtype = float)/1000))
 
-ax[4].set_title(r'$CO_2$ dissociation')
+	return out
 
-#~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL F: CO2 FORMATION #
-#~~~~~~~~~~~~~~~~~~~~~~~~#
+def exp_slopes(df, screen = True, method = 'ols', sd = None):
+	'''
+	Calculates the dp17O vs. dp18O slope of each experiment
 
-#plot O3 production
-co2form = df[df['experiment_type'].str.contains('CO2_formation')]
-ets = set(co2form['experiment_type'])
+	All experiments are regressed at once, by ordinary least squares
+	(`regression.regress_groups`) or by York regression weighted by the
+	'd18O_std' and 'd17O_std' columns (`regression.york_groups`).
 
-for i, et in enumerate(ets):
+	Parameters
+	----------
+	df : pd.DataFrame
+		Experimental compilation, including 'dp18O' and 'dp17O' columns
 
-	#pull color
-	c = [val for key, val in cm.items() if key in et][0]
+	screen : bool
+		If True, drops experiments with fewer than 3 points or r2 < 0.8
 
-	#get experiments of that type
-	temp = co2form[co2form['experiment_type'] == et]
+	method : str
+		'ols' (the default, as used for the figures) or 'york'
 
-	#now separate into O2
-	co2 = temp[temp['compound'] == 'CO2']
+	sd : tuple or None
+		d18O and d17O uncertainties (permil) assumed for 'york' where none
+		are reported; defaults to the median reported values
 
-	#plot CO2
-	ax[5].scatter(co2['dp18O'],co2['dp17O'],
-		facecolor = c,
-		edgecolors = 'k',
-		linewidths = 0.5,
-		s = 50,
-		marker = 'o',
-		label = et+'_O3',
-		)
+	Returns
+	-------
+	x : pd.DataFrame
+		Table indexed by exp_nr with columns 'ets' (experiment type), 'ms'
+		(slope), 'r2', 'n', 'lam' (wavelength), 'b' (intercept), and 'ms_se'
+		(slope standard error); for 'york', also 'b_se' (intercept standard
+		error) and 'mswd'
+	'''
 
-#add MIF and MDF lines
-lx = np.array([-100,100])
+	#calculate slopes, n, and R2 for each experiment
+	with profiling.stage('regress'):
 
-ax[5].plot(lx, lx,
-	linewidth = 2,
-	color = 'k',
-	label = 'MIF (th = 1)',
-	zorder = 0
-	)
+		if method == 'ols':
+			fits = regress_groups(df['dp18O'], df['dp17O'], df['exp_nr'],
+				screen = screen)
 
-ax[5].plot(lx, 0.5305*lx,
-	'k:',
-	linewidth = 2,
-	label = 'MDF (th = 0.5305)',
-	zorder = 0,
-	)
+		elif method == 'york':
+			sx, sy = _dp_std(df, sd)
+			fits = york_groups(df['dp18O'], df['dp17O'], sx, sy,
+				df['exp_nr'], screen = screen)
 
-ax[5].set_xlim([10,100])
-ax[5].set_ylim([10,100])
+		else:
+			raise ValueError('unknown method %r' % method)
 
-ax[5].set_title(r'$CO_2$ formation')
+	#experiment type and wavelength are constant within an experiment, so
+	# take them from the first row of each
+	first = df.drop_duplicates('exp_nr').set_index('exp_nr')
 
-plt.tight_layout()
+	#now concatenate these
+	x = pd.DataFrame({
+		'ets': first['experiment_type'],
+		'ms': fits['slope'],
+		'r2': fits['r2'],
+		'n': fits['n'],
+		'lam': first['wavelength'],
+		'b': fits['intercept'],
+		'ms_se': fits['slope_se'],
+		}, index = fits.index)
 
-#save figure
-fig.savefig('Fig_O-MIF_1.pdf',
-	bbox_inches = 0,
-	transparent = True,
-	)
+	if method == 'york':
+		x['b_se'] = fits['intercept_se']
+		x['mswd'] = fits['mswd']
 
+	x.index.name = 'exp_nr'
 
+	return x
 
-# FIG. O-MIF2: Box-and-whisker plots of different slopes
-#	A. slopes for all experiments grouped by type
-#	B. slopes for CO dissociation grouped by wavelength (for self shielding disc.)
-#	C. slopes for O3 dissociation grouped by wavelength
+def exp_slope_cis(df, by = ('ets',), n_boot = 10000, ci = 0.95, seed = 0,
+	jobs = 1):
+	'''
+	Bootstrap confidence intervals of the screened experimental slopes
+
+	Rows are resampled within each experiment and every slope is refit for
+	each replicate (see `regression.bootstrap_groups`). Group intervals are
+	for the median slope of the experiments in each group, as drawn in the
+	FIG. O-MIF2 boxplots.
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Experimental compilation, including 'dp18O' and 'dp17O' columns
+
+	by : tuple
+		Columns of the slope table to group experiments by, e.g. ('ets',) or
+		('ets', 'lam'); defaults to ('ets',)
+
+	n_boot : int
+		Number of bootstrap replicates; defaults to 10000
+
+	ci : float
+		Confidence interval width; defaults to 0.95
+
+	seed : int
+		Random seed; defaults to 0
+
+	jobs : int
+		Number of worker processes; defaults to 1
 
-#make figure
-fig,ax = plt.subplots(1,3,
-	figsize = (7.48,6), #make tall for labels
-	sharey = True
-	)
+	Returns
+	-------
+	scr : pd.DataFrame
+		Screened slope table (see `exp_slopes`) with added 'ms_lo' and 'ms_hi'
+		columns
 
-#make panels square
-for i in range(len(ax)):
-	ax[i].set_box_aspect(1)
+	gcis : pd.DataFrame
+		Table indexed by `by` with columns 'ms' (median slope), 'ms_lo',
+		'ms_hi', and 'n_exp' (number of experiments)
+	'''
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL A: ALL EXP BY TYPE #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	scr = exp_slopes(df)
+	d = df[df['exp_nr'].isin(scr.index)]
 
-#group everything by experiment
-g = df.groupby('exp_nr')
+	cis, draws = bootstrap_groups(d['dp18O'], d['dp17O'], d['exp_nr'],
+		n_boot = n_boot, ci = ci, seed = seed, jobs = jobs)
 
-#calculate slopes, n, R2, wavelength and type for each experiment
-ms = g.apply(lambda v: linregress(v.dp18O,v.dp17O)[0])
-ets = g.apply(lambda v: list(set(v['experiment_type']))[0])
-r2 = g.apply(lambda v: linregress(v.dp18O, v.dp17O)[2]**2)
-lams = g.apply(lambda v: list(set(v['wavelength']))[0])
-n = g['dp18O'].count()
+	scr = scr.copy()
+	scr['ms_lo'] = cis['slope_lo']
+	scr['ms_hi'] = cis['slope_hi']
 
-#now concatenate these and regroup by experiment type
-x = pd.concat([ets, ms, r2, n, lams],axis=1)
-x.columns = ['ets', 'ms', 'r2', 'n', 'lam']
+	#median slope of each group, for every replicate
+	a = 100*(1 - ci)/2
+	pos = pd.Series(np.arange(len(cis)), index = cis.index)
+	rows = []
 
-#drop experiments with fewer than 3 points or r2 < 0.8
-# THIS IS THE FINAL DATASET OF SLOPES TO WORK WITH
-scr = x[(x['n'] > 2) & (x['r2'] >= 0.8)]
+	for key, g in scr.groupby(list(by), dropna = False):
 
-#groupby experiment time and plot box plots
-gr = scr[['ets','ms']].groupby('ets')
-gr.boxplot(
-	subplots = False,
-	rot = 90,
-	grid = False,
-	ax = ax[0]
-	)
+		med = np.nanmedian(draws[:, pos[g.index].values], axis = 1)
+		lo, hi = np.nanpercentile(med, [a, 100 - a])
+		rows.append((np.median(g['ms']), lo, hi, len(g)))
 
-ax[0].set_title(r'all experiments by type')
+	gcis = pd.DataFrame(rows,
+		columns = ['ms', 'ms_lo', 'ms_hi', 'n_exp'],
+		index = scr.groupby(list(by), dropna = False).size().index,
+		)
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL B: CO DISS BY WAVELENGTH #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	return scr, gcis
 
-#extract co dissociation experiments
-cods = scr[scr['ets'] == 'CO_decomposition_photo']
+def calibrate_labs(stds, anchor = 'Sh', min_spread = 5):
+	'''
+	Calculates the Dp17O correction slope and intercept for each lab
 
-#then groupby wavelength and plot boxplots
-gr = cods[['ms','lam']].groupby('lam')
-gr.boxplot(
-	subplots = False,
-	rot = 90,
-	grid = False,
-	ax = ax[1]
-	)
+	Assumes Wostbrock et al. (2020) (the Sharp lab, 'Sh') is "true" and
+	solves every lab's transfer function at once by weighted least squares
+	over all standards shared between labs (see `calibration.py`). Labs that
+	share standards only with other non-anchor labs are chained through
+	them, as Johnston-old used to link NBS-127 and seawater sulfate labs.
 
-ax[1].set_title(r'$CO$ photo dissociation')
+	Parameters
+	----------
+	stds : pd.DataFrame
+		Standards table, indexed by standard name
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL C: O3 DISS BY WAVELENGTH #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	anchor : str or list
+		Lab(s) whose values are taken as true; defaults to 'Sh'
 
-#extract co dissociation experiments
-ozds = scr[scr['ets'] == 'ozone_decomposition_photo']
+	min_spread : float
+		Minimum d18O range of a lab's shared standards to fit a slope rather
+		than a constant offset; defaults to 5 permil
 
-#then groupby wavelength and plot boxplots
-gr = ozds[['ms','lam']].groupby('lam')
-gr.boxplot(
-	subplots = False,
-	rot = 90,
-	grid = False,
-	ax = ax[2]
-	)
+	Returns
+	-------
+	cal_df : pd.DataFrame
+		Table indexed by lab with columns 'm' and 'b', such that corrected
+		Dp17O = Dp17O - m*d18O - b, plus the solver's 'mode', 'hops', and
+		'n_std' columns; labs not linked to the anchor are NaN
+	'''
 
-plt.tight_layout()
+	with profiling.stage('calibrate'):
+		cal_df, _ = solve_calibration(stds, anchor = anchor,
+			min_spread = min_spread)
 
-ax[2].set_title(r'$O3$ photo dissociation')
+	return cal_df
 
-ax[0].set_ylim([0.5,1.4])
+def correct_so4(df, cal_df):
+	'''
+	Projects the lab calibrations onto the sulfate compilation
 
-#save figure
-fig.savefig('Fig_O-MIF_2.pdf',
-	bbox_inches = 0,
-	transparent = True,
-	)
+	Parameters
+	----------
+	df : pd.DataFrame
+		Sulfate compilation
 
+	cal_df : pd.DataFrame
+		Lab calibrations, as returned by `calibrate_labs`
 
-# FIG. O-MIF3: Three-isotope plot of atmospheric species
-#	* Ranges a la Thiemens 2014 Fig. 8
-#	A. d'18O vs. d'17O, color coded with MDF and MIF lines
-#	B. d'18O vs. D'17O, color coded
+	Returns
+	-------
+	res : pd.DataFrame
+		Sulfate compilation with added 'm', 'b', and 'Dp17O_5305_corr_mean'
+		columns; labs without a calibration have NaN corrected values
+	'''
 
-#import data
-df = pd.read_csv(path+'atmos_compilation.csv', encoding='ISO-8859-1')
-df['dp18O'] = 1000*np.log(df['d18O_mean']/1000 + 1)
-df['dp17O'] = 1000*np.log(df['d17O_mean']/1000 + 1)
-df['Dp17O_5305'] = df['dp17O'] - 0.5305*df['dp18O']
-
-sps = set(df['species'])
-
-#make figure
-fig,ax = plt.subplots(1,2,
-	figsize = (7.48,4),
-	sharex = True
-	)
-
-#make panels square
-for i in range(len(ax)):
-	ax[i].set_box_aspect(1)
-
-#make color scheme
-cs = plt.get_cmap(name = 'Paired', lut = 12)
-
-cm = {
-	'ox': 'k',
-	'oz': cs.colors[1],
-	'CO': cs.colors[0],
-	'CO2': cs.colors[2],
-	'CO3': cs.colors[3],
-	'ClO4': cs.colors[4],
-	'H2O2': cs.colors[5],
-	'H2O': cs.colors[7],
-	'N2O': cs.colors[6],
-	'NO3': cs.colors[8],
-	'SO4': cs.colors[9],
-}
+	with profiling.stage('correct_so4'):
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL A: d17O vs. d18O plot #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-
-#loop through and plot
-for i, s in enumerate(sps):
-
-	#make temp data frame
-	temp = df[df['species'] == s]
-
-	#pull color
-	c = [val for key, val in cm.items() if key in s][0]
-
-	#make trop filled, strat open
-	if 'trop' in s:
-		mfc = c
-		mec = 'k'
-		zo = 1
-
-	elif 'strat' in s:
-		mfc = 'w'
-		mec = c
-		zo = 0
-
-	#now plot
-	ax[0].errorbar(
-		temp['dp18O'],
-		temp['dp17O'],
-		xerr = temp['d18O_std'],
-		yerr = temp['d17O_std'],
-		fmt = 'o',
-		mfc = mfc,
-		mec = mec,
-		ecolor = 'k',
-		markersize = 8,
-		zorder = zo,
-		label = s,
-		)
+		#now project correction slope and intercept onto dataframe
+		t = cal_df[['m','b']].reset_index()
+		t.columns = ['lab','m','b']
+		res = pd.merge(df,t,how='left',on='lab')
 
-#add MIF and MDF lines
-lx = np.array([-150,250])
-
-ax[0].plot(lx, lx,
-	linewidth = 2,
-	color = 'k',
-	label = 'MIF (th = 1)',
-	zorder = 0
-	)
-
-ax[0].plot(lx, 0.5305*lx,
-	'k:',
-	linewidth = 2,
-	label = 'MDF (th = 0.5305)',
-	zorder = 0,
-	)
-
-#set limits and labels
-ax[0].set_xlim([-110,260])
-ax[0].set_ylim([-60,165])
-
-ax[0].legend(loc = 'best')
-
-ax[0].set_xlabel(r"$\delta ' ^{18}O$ (‰ VSMOW)")
-ax[0].set_ylabel(r"$\delta ' ^{17}O$ (‰ VSMOW)")
-
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL B: D'17O vs. d18O plot #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-
-#loop through and plot
-for i, s in enumerate(sps):
-
-	#make temp data frame
-	temp = df[df['species'] == s]
-
-	#pull color
-	c = [val for key, val in cm.items() if key in s][0]
-
-	#make trop filled, strat open
-	if 'trop' in s:
-		mfc = c
-		mec = 'k'
-		zo = 1
-
-	elif 'strat' in s:
-		mfc = 'w'
-		mec = c
-		zo = 0
-
-	#now plot
-	ax[1].errorbar(
-		temp['dp18O'],
-		temp['Dp17O_5305'],
-		# xerr = temp['d18O_std'],
-		# yerr = temp['d17O_std'],
-		fmt = 'o',
-		mfc = mfc,
-		mec = mec,
-		ecolor = 'k',
-		markersize = 8,
-		zorder = zo,
-		)
+		#calculate corrected Dp17O values
+		# FILLING NAN d18O VALUES WITH ZERO FOR A CONSTANT OFFSET!
+		res['Dp17O_5305_corr_mean'] = res['Dp17O_5305_mean'] - \
+			res['m']*res['d18O_mean'].fillna(0) - res['b']
 
-#set limits and labels
-ax[1].set_xlim([-110,260])
-ax[1].set_ylim([-4,52])
+	return res
 
-ax[1].set_xlabel(r"$\delta ' ^{18}O$ (‰ VSMOW)")
-ax[1].set_ylabel(r"$\Delta ' ^{17}O_{\theta = 0.5305}$ (‰ VSMOW)")
+#Cao and Bao (2013) model constants
+GAMMA = 0.1321
+THETA = 0.017
+TAU_MODERN = 1.526e19 / 1.09e16 #modern O2 residence time
 
-plt.tight_layout()
+def D17O(rho, tm, gam = GAMMA, th = THETA, mt = TAU_MODERN):
+	'''
+	Cao and Bao (2013) model-predicted D17O of O2 as a function of pO2/pCO2
 
-#save figure
-fig.savefig('Fig_O-MIF_3.pdf',
-	bbox_inches = 0,
-	transparent = True,
-	)
+	All arguments broadcast against each other, so one call evaluates any
+	grid of ratios, residence times, and constants (see `model_sweep.py` for
+	chunked and cached evaluation of large grids).
 
+	Parameters
+	----------
+	rho : array-like
+		pO2/pCO2 ratio
 
-# FIG. O-MIF4: Model-predicted D17O-O2 vs. O2/CO2 ratios
-#	* Cao and Bao (2013)
-#	* Young et al. (2014)
-#	* Liu et al. (2021)
+	tm : array-like
+		Multiplier on the modern O2 residence time
 
-#(MAKE PANELS B AND C IN ILLUSTRATOR)
+	gam : array-like
+		Model gamma; defaults to `GAMMA`
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL A: CAO AND BAO PREDICTION #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	th : array-like
+		Model theta; defaults to `THETA`
 
-#make equation function
-def D17O(rho, tm):
+	mt : array-like
+		Modern O2 residence time; defaults to `TAU_MODERN`
+
+	Returns
+	-------
+	D17O : array-like
+		Predicted D17O of O2, with the broadcast shape of the inputs
+	'''
+
+	rho = np.asarray(rho, dtype = float)
 
 	#first calc. d18O difference
 	dd18O = (64 + 146*rho/1.23)/(1 + rho/1.23)
@@ -919,165 +801,870 @@ def D17O(rho, tm):
 	#then calc Phi
 	Phi = 0.519 * dd18O - 7.1738
 
-	#input some constants
-	gam = 0.1321
-	th = 0.017
-	mt = 1.526e19 / 1.09e16 #modern tau
-	tau = mt * tm
+	#gamma * theta * tau
+	gtt = np.multiply(gam, th) * np.multiply(mt, tm)
 
 	#finally get D17O
-	D17O = -Phi*gam*th*tau / (1 + rho + gam*th*tau)
+	D17O = -Phi*gtt / (1 + rho + gtt)
 
 	return D17O
 
-#make figure
-fig,ax = plt.subplots(1,1, figsize = (4,4))
-ax.set_box_aspect(1)
-
-#get colors
-cm = plt.get_cmap(name = 'Accent', lut = 6)
-cs = [
-	cm.colors[0], 
-	cm.colors[1], 
-	'k', 
-	cm.colors[4], 
-	cm.colors[3]
-	]
+#=================#
+# FIGURE REGISTRY #
+#=================#
+
+#registered figure builders, keyed by figure name; each entry stores the
+# builder function, the output file name, and the tables it needs
+FIGURES = {}
+
+def register_figure(name, fname, inputs = ()):
+	'''
+	Decorator that registers a figure builder
 
-#make rho array
-lr = np.linspace(-3,3,1000)
-rho = 10**lr
+	Builders take a dict of loaded tables (keyed by table name) and return
+	the finished matplotlib figure.
 
-#get list of tau multipliers to loop through
-tms = [60,10,1,0.5,0.01]
+	Parameters
+	----------
+	name : str
+		Figure name, e.g. 'O-MIF5'
 
-for i, tm in enumerate(tms):
+	fname : str
+		Output file name
 
-	#calculate D
-	D = D17O(rho, tm)
+	inputs : tuple
+		Names of the tables the figure needs; must be keys in `TABLES`
+	'''
 
-	#plot
-	ax.plot(lr, D, linewidth = 2, color = cs[i])
+	def wrap(fn):
+		FIGURES[name] = {
+			'builder': fn,
+			'fname': fname,
+			'inputs': tuple(inputs),
+			}
+		return fn
 
+	return wrap
 
-#tighten up labels and axes
-ax.set_xlim([-3,3])
-ax.set_ylim([-65,0])
+def build_figure(name, tables = None, path = None, outdir = '.'):
+	'''
+	Builds a single registered figure and saves it
 
-ax.set_xlabel(r'$pO_2/pCO_2$')
-ax.set_ylabel(r'$\Delta ^{17}O_{0.52}$ (‰ VSMOW)')
+	Parameters
+	----------
+	name : str
+		Figure name; must be a key in `FIGURES`
 
-plt.tight_layout()
+	tables : dict or None
+		Already-loaded tables; any missing inputs are read from `path`
 
-#save figure
-fig.savefig('Fig_O-MIF_4A.pdf',
-	bbox_inches = 0,
-	transparent = True,
-	)
+	path : str or None
+		Data directory; defaults to the module-level `path`
 
-# FIG. O-MIF5: Three-isotope plot of all sulfate species
-#	A. d18O vs. d17O, sorted by type
-#	B. age vs. Dp17O for geologic samples only
+	outdir : str
+		Directory to save the figure in
+
+	Returns
+	-------
+	fname : str
+		Path of the saved figure
+	'''
 
-# STEP 1: GET DATA FROM ALL LABS ON SAME SCALE
-#	1A. ASSUME WOSTBROCK ET AL. 2020 IS "TRUE". FOR LABS WITH UWG-2 AND AIR,
-#		DIRECTLY CORRECT TO WOSTBROCK DATA
-#	1B. FOR LABS WITHOUT UWG-2 AND AIR, CORRECT TO JOHNSTON-NEW USING SEAWATER
-#		SULFATE OR NBS-128 AND UWG-2
+	import matplotlib.pyplot as plt
 
-#import standards
-stds = pd.read_csv(path+'standards.csv', index_col = 0)
+	spec = FIGURES[name]
 
-#true values
-std_true = stds[stds['lab'] == 'Sh']
+	with profiling.stage('figure', figure = name):
 
-#get set of labs
-labs = set(stds['lab'])
+		tables = load_tables(spec['inputs'], path = path, tables = tables)
 
-#make empty dataframe to store data in
-cal_df = pd.DataFrame(index = labs, columns = ['m','b'])
+		#artist creation (and tight_layout, recorded on its own)
+		with profiling.stage('draw', figure = name):
+			fig = spec['builder'](tables)
 
-#loop through and calculate differences from "true" values, only for labs
-# where UWG-2 and air exist
-for l in labs:
+		#record the render mode(s) in the file metadata
+		fname = os.path.join(outdir, spec['fname'])
+		kw = {}
 
-	#get stds from that lab
-	std_l = stds[stds['lab'] == l]
+		if os.path.splitext(fname)[1].lower() in ('.pdf', '.png', '.svg'):
+			kw['metadata'] = {'Keywords': render_summary(fig)}
 
-	#if no UWG-2 and air, pass
-	if not ('UWG-2' in std_l.index and 'air' in std_l.index):
-		pass
+		#save figure
+		with profiling.stage('savefig', figure = name):
+			fig.savefig(fname,
+				bbox_inches = 0,
+				transparent = True,
+				**kw
+				)
+
+		plt.close(fig)
+
+	return fname
+
+def build_all(names = None, path = None, outdir = '.'):
+	'''
+	Builds registered figures one after another, reading each table once
+
+	Parameters
+	----------
+	names : iterable or None
+		Figure names to build; defaults to all registered figures
+
+	path : str or None
+		Data directory; defaults to the module-level `path`
+
+	outdir : str
+		Directory to save the figures in
+
+	Returns
+	-------
+	fnames : list
+		Paths of the saved figures
+	'''
+
+	if names is None:
+		names = list(FIGURES)
+
+	inputs = [t for n in names for t in FIGURES[n]['inputs']]
+	tables = load_tables(dict.fromkeys(inputs), path = path)
+
+	return [build_figure(n, tables = tables, outdir = outdir) for n in names]
+
+#tables shared with each build worker, set once by the pool initializer
+_worker_tables = None
+
+def _init_worker(tables, profile = None):
+	'''
+	Pool initializer: switches to the headless Agg backend and stores the
+	shared tables so that each worker receives them only once; `profile`
+	(if not None) switches profiling on or off in the worker
+	'''
+
+	import matplotlib
+	matplotlib.use('Agg')
+
+	#import pyplot up front so it is not counted in the first figure's time
+	import matplotlib.pyplot
+
+	global _worker_tables
+	_worker_tables = tables
+
+	#workers start with no stages of their parent
+	if profile is not None:
+		profiling.enable(profile)
+		profiling.reset()
+
+def _build_timed(name, outdir, tables = None):
+	'''
+	Builds a single figure and returns its name, file name, wall time, and
+	the stages it recorded in a worker process
+	'''
+
+	worker = tables is None
+
+	if worker:
+		tables = _worker_tables
+
+	t0 = time.perf_counter()
+	fname = build_figure(name, tables = tables, outdir = outdir)
+	t = time.perf_counter() - t0
+
+	return name, fname, t, profiling.drain() if worker else []
+
+def build_parallel(names = None, path = None, outdir = '.', jobs = None,
+	tables = None):
+	'''
+	Builds registered figures concurrently in a process pool
+
+	All input tables are read once in the calling process and handed to each
+	worker when it starts, so no worker re-parses the compilations. Workers
+	render with the Agg backend.
+
+	Parameters
+	----------
+	names : iterable or None
+		Figure names to build; defaults to all registered figures
+
+	path : str or None
+		Data directory; defaults to the module-level `path`
+
+	outdir : str
+		Directory to save the figures in
+
+	jobs : int or None
+		Number of worker processes; defaults to one per figure, capped at the
+		number of cpus. If 1, figures are built in this process.
+
+	tables : dict or None
+		Already-loaded tables; any missing inputs are read from `path`
+
+	Returns
+	-------
+	timings : pd.DataFrame
+		Table indexed by figure name with columns 'fname' and 'seconds', plus
+		the total wall time in `timings.attrs['wall']`
+	'''
+
+	if names is None:
+		names = list(FIGURES)
+
+	names = list(names)
+
+	#read every table needed by any figure, once
+	t0 = time.perf_counter()
+	inputs = [t for n in names for t in FIGURES[n]['inputs']]
+	tables = load_tables(dict.fromkeys(inputs), path = path, tables = tables)
+
+	if jobs is None:
+		jobs = min(len(names), os.cpu_count() or 1)
+
+	if jobs <= 1:
+		_init_worker(None)
+		res = [_build_timed(n, outdir, tables = tables) for n in names]
+
+	else:
+		with ProcessPoolExecutor(
+			max_workers = jobs,
+			initializer = _init_worker,
+			initargs = (tables, profiling.enabled),
+			) as ex:
+
+			futs = [ex.submit(_build_timed, n, outdir) for n in names]
+			res = [f.result() for f in futs]
+
+	#hand the stages recorded in workers back to this process
+	for r in res:
+		profiling.extend(r[3])
+
+	timings = pd.DataFrame([r[:3] for r in res],
+		columns = ['name', 'fname', 'seconds'])
+	timings = timings.set_index('name')
+	timings.attrs['wall'] = time.perf_counter() - t0
+
+	return timings
+
+def render_summary(fig):
+	'''
+	Describes the render modes used in a figure, e.g. 'render_mode=raster
+	(vector 6, raster 2, density 0); raster_points=5000;
+	density_points=200000'
+
+	The overall mode is the most reduced one used by any group of points.
+	'''
+
+	modes = getattr(fig, 'render_modes', {})
+	used = [m for m in RENDER_MODES if modes.get(m)] or ['vector']
+
+	return 'render_mode=%s (%s); raster_points=%s; density_points=%s' % (
+		used[-1],
+		', '.join('%s %d' % (m, modes.get(m, 0)) for m in RENDER_MODES),
+		raster_points,
+		density_points,
+		)
+
+def _points(ax, x, y, kind = 'scatter', color = 'k', **kw):
+	'''
+	Draws one group of samples as vector markers, a rasterized layer, or a
+	2-D density image, depending on its size (see `raster_points` and
+	`density_points`), and notes the mode used on the figure
+
+	`kind` is 'scatter' or 'errorbar' and `kw` are passed to it; `color`
+	shades the density image, which is drawn under the reference lines with
+	an empty vector artist standing in for it in legends.
+	'''
+
+	x = np.asarray(x, dtype = float)
+	y = np.asarray(y, dtype = float)
+	ok = np.isfinite(x) & np.isfinite(y)
+	n = ok.sum()
+
+	draw = getattr(ax, kind)
+
+	if density_points is not None and n > density_points:
+		mode = 'density'
+
+		from matplotlib.colors import LinearSegmentedColormap, to_rgba
+
+		H, xe, ye = np.histogram2d(x[ok], y[ok], bins = density_bins)
+		cmap = LinearSegmentedColormap.from_list('density',
+			[to_rgba(color, 0), to_rgba(color, 1)])
+
+		ax.imshow(np.log1p(H.T),
+			extent = (xe[0], xe[-1], ye[0], ye[-1]),
+			origin = 'lower',
+			aspect = 'auto',
+			interpolation = 'nearest',
+			cmap = cmap,
+			zorder = -1,
+			)
+
+		#legend entry only
+		kw.pop('xerr', None)
+		kw.pop('yerr', None)
+		draw([], [], **kw)
+
+	elif raster_points is not None and n > raster_points:
+		mode = 'raster'
+		draw(x, y, rasterized = True, **kw)
 
 	else:
-		#if they're both there, extract and calc slope
-		DD = std_l['Dp17O_5305_mean'] - std_true['Dp17O_5305_mean']
-		y = DD[['UWG-2','air']]
-		x = std_l.loc[['UWG-2','air'],'d18O_mean']
+		mode = 'vector'
+		draw(x, y, **kw)
 
-		#plt.scatter(x,y)
-		cal_df.loc[l,:] = get_line(x,y)
+	fig = ax.figure
+	if not hasattr(fig, 'render_modes'):
+		fig.render_modes = {}
 
-#now, loop through and calculate differences from "true" values for labs with
-# NBS-127 or seawater sulfate as a 1-point offset, where the "true" values are
-# now Johnston Old, corrected to Wostbrock et al. (2020)
-std_true = stds[stds['lab'] == 'JO']
+	fig.render_modes[mode] = fig.render_modes.get(mode, 0) + 1
 
-#correct Johnston Old to Wostbrock
-std_true_new = std_true['Dp17O_5305_mean'] - \
-	cal_df.loc['JO','m']*std_true['d18O_mean'] - cal_df.loc['JO','b']
+def _mif_mdf_lines(ax, lx):
+	'''
+	Adds the MIF (th = 1) and MDF (th = 0.5305) reference lines to an axis
+	'''
 
-for l in labs:
+	lx = np.array(lx)
 
-	#get stds from that lab
-	std_l = stds[stds['lab'] == l]
+	ax.plot(lx, lx,
+		linewidth = 2,
+		color = 'k',
+		label = 'MIF (th = 1)',
+		zorder = 0
+		)
 
-	#pass if already calculated
-	if not cal_df.loc[l,:].isnull().any():
-		pass
+	ax.plot(lx, 0.5305*lx,
+		'k:',
+		linewidth = 2,
+		label = 'MDF (th = 0.5305)',
+		zorder = 0,
+		)
 
-	elif 'NBS-127' in std_l.index:
+#================#
+# THEORY FIGURES #
+#================#
 
-		DD = std_l['Dp17O_5305_mean'] - std_true_new
-		cal_df.loc[l,:] = [0, DD['NBS-127']]
+# FIG. THEO-1: Self-shielding schematic
+#	* following Fig. 6 from Thiemens 2021
 
-	elif 'Seawater_SO4' in std_l.index:
+# FIG. THEO-2: O3 formation rates as a function of symmetry (Janssen et al. 2001)
+#	* following Fig. 9 from Thiemens 2021
 
-		DD = std_l['Dp17O_5305_mean'] - std_true_new
-		cal_df.loc[l,:] = [0, DD['Seawater_SO4']]
+@register_figure('THEO-2', 'Fig_TH_1.pdf', inputs = ('O3_rxn_rates',))
+def fig_theo_2(tables):
+	'''
+	O3 formation rates as a function of symmetry (Janssen et al. 2001)
+	'''
+
+	import matplotlib.pyplot as plt
+	from scipy.stats import linregress
+
+	df = tables['O3_rxn_rates']
 
+	#make figure
+	fig,ax = plt.subplots(1,2,
+		figsize = (7.48,3),
+		sharey = True,
+		)
 
-#import data
-df = pd.read_csv(path+'so4_compilation.csv', encoding='ISO-8859-1')
+	ax[1].set_box_aspect(1)
+
+	#make color dict
+	cs = plt.get_cmap(name = 'Accent', lut = 6)
+
+	cd = {'s' : cs.colors[2],
+		  'as' : cs.colors[3]
+		  }
+
+	#~~~~~~~~~~~~~~~~~~~~~~~~#
+	# PANEL A: RATE BAR PLOT #
+	#~~~~~~~~~~~~~~~~~~~~~~~~#
+
+	#group data by mass
+	gr = df.groupby('mass')
+
+	#calculate number of isotopomers
+	ni = gr['channel'].count().max()
+
+	for n,g in gr:
+
+		#make x array
+		x = n + np.arange(len(g))*1/ni
+
+		#make color array
+		c = [cd[s] for s in g['sas']]
+
+		#plot bar plot
+		ax[0].bar(
+			x,
+			g['k_mean']-1,
+			yerr = g['k_std'],
+			bottom = 1,
+			color = c,
+			edgecolor = 'k',
+			width = 1/ni
+			)
+
+		#also plot as scatterplot
+		ax[0].scatter(
+			x,
+			g['k_mean'],
+			facecolor = c,
+			edgecolor = 'k',
+			linewidth = 0.5,
+			s = 50
+			)
+
+	#add zero line
+	ax[0].plot(
+		[47, 55],
+		[1,1],
+		linewidth = 2,
+		color = 'k',
+		zorder = 0
+		)
 
-#now project correction slope and intercept onto dataframe
-t = cal_df.reset_index()
-t.columns = ['lab','m','b']
-res = pd.merge(df,t,how='left',on='lab')
+	#set labels and limits
+	ax[0].set_xlim([47.5, 54.5])
 
-#calculate corrected Dp17O values
-# FILLING NAN d18O VALUES WITH ZERO FOR A CONSTANT OFFSET!
-res['Dp17O_5305_corr_mean'] = res['Dp17O_5305_mean'] - \
-							  res['m']*res['d18O_mean'].fillna(0) - res['b']
+	ax[0].set_xlabel('mass (amu)')
+	ax[0].set_ylabel(r'relative formation rate, $k^x/k^{666}$')
 
-res['dp18O'] = 1000*np.log(res['d18O_mean']/1000 + 1)
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	# PANEL B: DZPE AND ETA EFFECT #
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 
-#make figure
-fig,ax = plt.subplots(1,2,
-	figsize = (7.48,2.75)
-	)
+	#calculate regression line
+	part = dataset(tables)['O3_rxn_rates']
+	rdf = select(part, in_reg = True)
+	res = linregress(rdf['DZPE'],rdf['k_mean'])
 
-#make panel A square
-ax[0].set_box_aspect(1)
+	#plot symmetric, then asymmetric data
+	for sas in ['s', 'as']:
 
-cm = {
-	'geologic': [[0,0,0],[1,1,1]],
-	'atmospheric': [[0.25,0.25,0.25],[0,0,0]],
-	'modern_aquatic': [[0.5,0.5,0.5],[0,0,0]],
-	'modern_terrestrial': [[1,1,1],[0,0,0]],
-}
+		dat = select(part, sas = sas)
+		ax[1].errorbar(
+			dat['DZPE'],
+			dat['k_mean'],
+			yerr = dat['k_std'],
+			fmt = 'o',
+			mfc = cd[sas],
+			mec = 'k',
+			ecolor = 'k',
+			markersize = 8,
+			)
 
+	#plot regression line
+	x = np.linspace(-30,30,10)
+	y = x*res.slope + res.intercept
+
+	ax[1].plot(x, y, linewidth = 2, color = 'k')
+
+	#set limits and labels
+	ax[1].set_xlim([-25,25])
+	ax[1].set_ylim([0.75,1.55])
+
+	ax[1].set_xlabel(r'$\Delta(ZPE)$ (cm$^{-1}$)')
+
+	with profiling.stage('tight_layout'):
+		fig.tight_layout()
+
+	return fig
+
+# FIG. THEO-3: Potential energy curve schematic (Heays et al. 2017)
+#	* following Fig. 14 from Thiemens 2021??
+
+
+#===============#
+# O-MIF FIGURES #
+#===============#
 
-sam_type = {
+# FIG. O-MIF1: Experimental three-isotope plot
+#	* O3 production
+#	* O3 dissociation
+#	* CO photolysis
+#	* CO2 photolysis
+#	* H2O2 formation
+
+def _exp_panel(ax, part, family, cm, filled = (), hollow = ()):
+	'''
+	Plots one experiment family on a three-isotope panel, with products as
+	filled symbols and reactants as hollow symbols
+	'''
+
+	#experiment types of that family
+	for et in match(part, 'experiment_type', '*' + family + '*'):
+
+		#pull color
+		c = [val for key, val in cm.items() if key in et][0]
+
+		#plot products
+		for cpd in filled:
+
+			t = select(part, experiment_type = et, compound = cpd)
+			_points(ax, t['dp18O'], t['dp17O'],
+				color = c,
+				facecolor = c,
+				edgecolors = 'k',
+				linewidths = 0.5,
+				s = 50,
+				marker = 'o',
+				label = et+'_'+cpd,
+				)
+
+		#plot reactants
+		for cpd in hollow:
+
+			t = select(part, experiment_type = et, compound = cpd)
+			_points(ax, t['dp18O'], t['dp17O'],
+				color = c,
+				facecolor = 'w',
+				edgecolors = c,
+				linewidths = 1,
+				s = 50,
+				marker = 'o',
+				label = et+'_'+cpd,
+				)
+
+@register_figure('O-MIF1', 'Fig_O-MIF_1.pdf', inputs = ('exp',))
+def fig_o_mif_1(tables):
+	'''
+	Experimental three-isotope plot, one panel per experiment family
+	'''
+
+	import matplotlib.pyplot as plt
+
+	part = dataset(tables)['exp']
+
+	#make figure
+	fig,ax = plt.subplots(2,3,
+		figsize = (7.48,6)
+		)
+
+	#flatten it for iterating
+	ax = ax.flatten()
+
+	#make all square
+	for i in range(len(ax)):
+		ax[i].set_box_aspect(1)
+
+	ax[4].set_xlabel(r"$\delta ' ^{18} O$ (‰ vs. starting)")
+	ax[0].set_ylabel(r"$\delta ' ^{17} O$ (‰ vs. starting)")
+
+	#make color scheme
+	cs = plt.get_cmap(name = 'Accent', lut = 6)
+
+	cm = {
+		'electrical': cs.colors[0],
+		'microwave': cs.colors[1],
+		'photo': cs.colors[4],
+		'thermal': cs.colors[3],
+		'recombination': cs.colors[5],
+		'water_electrolysis': cs.colors[2]
+	}
+
+	#panel specs: family, products, reactants, line extent, x and y limits,
+	# and title
+	panels = [
+		('ozone_generation', ['O3'], ['O2'], [-100,200],
+			[-85,150], [-85,150], r'$O_3$ production'),
+		('ozone_decomposition', ['O3'], ['O2'], [-100,200],
+			[-45,95], [-45,95], r'$O_3$ dissociation'),
+		('peroxide_formation', ['H2O2'], ['O2'], [-100,200],
+			[-30,62], [-30,62], r'$H_2O_2$ production'),
+		('CO_decomposition', ['CO2'], ['O'], [-200,5000],
+			[-200,5000], [-200,5000], r'$CO$ dissociation'),
+		('CO2_decomposition', [], ['O2'], [-100,100],
+			[-90,45], [-35,100], r'$CO_2$ dissociation'),
+		('CO2_formation', ['CO2'], [], [-100,100],
+			[10,100], [10,100], r'$CO_2$ formation'),
+		]
+
+	for i, (fam, filled, hollow, lx, xl, yl, title) in enumerate(panels):
+
+		_exp_panel(ax[i], part, fam, cm, filled = filled, hollow = hollow)
+
+		#add MIF and MDF lines
+		_mif_mdf_lines(ax[i], lx)
+
+		ax[i].set_xlim(xl)
+		ax[i].set_ylim(yl)
+
+		ax[i].set_title(title)
+
+	with profiling.stage('tight_layout'):
+		fig.tight_layout()
+
+	return fig
+
+# FIG. O-MIF2: Box-and-whisker plots of different slopes
+#	A. slopes for all experiments grouped by type
+#	B. slopes for CO dissociation grouped by wavelength (for self shielding disc.)
+#	C. slopes for O3 dissociation grouped by wavelength
+
+@register_figure('O-MIF2', 'Fig_O-MIF_2.pdf', inputs = ('exp',))
+def fig_o_mif_2(tables):
+	'''
+	Box-and-whisker plots of experimental triple-isotope slopes
+	'''
+
+	import matplotlib.pyplot as plt
+
+	#make figure
+	fig,ax = plt.subplots(1,3,
+		figsize = (7.48,6), #make tall for labels
+		sharey = True
+		)
+
+	#make panels square
+	for i in range(len(ax)):
+		ax[i].set_box_aspect(1)
+
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	# PANEL A: ALL EXP BY TYPE #
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+	# THIS IS THE FINAL DATASET OF SLOPES TO WORK WITH
+	scr = exp_slopes(tables['exp'])
+	sp = table_partition(scr, ('ets',))
+
+	#groupby experiment time and plot box plots
+	gr = scr[['ets','ms']].groupby('ets')
+	gr.boxplot(
+		subplots = False,
+		rot = 90,
+		grid = False,
+		ax = ax[0]
+		)
+
+	ax[0].set_title(r'all experiments by type')
+
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	# PANEL B: CO DISS BY WAVELENGTH #
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+	#extract co dissociation experiments
+	cods = select(sp, ets = 'CO_decomposition_photo')
+
+	#then groupby wavelength and plot boxplots
+	gr = cods[['ms','lam']].groupby('lam')
+	gr.boxplot(
+		subplots = False,
+		rot = 90,
+		grid = False,
+		ax = ax[1]
+		)
+
+	ax[1].set_title(r'$CO$ photo dissociation')
+
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	# PANEL C: O3 DISS BY WAVELENGTH #
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+	#extract co dissociation experiments
+	ozds = select(sp, ets = 'ozone_decomposition_photo')
+
+	#then groupby wavelength and plot boxplots
+	gr = ozds[['ms','lam']].groupby('lam')
+	gr.boxplot(
+		subplots = False,
+		rot = 90,
+		grid = False,
+		ax = ax[2]
+		)
+
+	with profiling.stage('tight_layout'):
+		fig.tight_layout()
+
+	ax[2].set_title(r'$O3$ photo dissociation')
+
+	ax[0].set_ylim([0.5,1.4])
+
+	return fig
+
+# FIG. O-MIF3: Three-isotope plot of atmospheric species
+#	* Ranges a la Thiemens 2014 Fig. 8
+#	A. d'18O vs. d'17O, color coded with MDF and MIF lines
+#	B. d'18O vs. D'17O, color coded
+
+@register_figure('O-MIF3', 'Fig_O-MIF_3.pdf', inputs = ('atmos',))
+def fig_o_mif_3(tables):
+	'''
+	Three-isotope and Delta-prime plots of atmospheric species
+	'''
+
+	import matplotlib.pyplot as plt
+
+	part = dataset(tables)['atmos']
+	sps = values(part, 'species')
+
+	#make figure
+	fig,ax = plt.subplots(1,2,
+		figsize = (7.48,4),
+		sharex = True
+		)
+
+	#make panels square
+	for i in range(len(ax)):
+		ax[i].set_box_aspect(1)
+
+	#make color scheme
+	cs = plt.get_cmap(name = 'Paired', lut = 12)
+
+	cm = {
+		'ox': 'k',
+		'oz': cs.colors[1],
+		'CO': cs.colors[0],
+		'CO2': cs.colors[2],
+		'CO3': cs.colors[3],
+		'ClO4': cs.colors[4],
+		'H2O2': cs.colors[5],
+		'H2O': cs.colors[7],
+		'N2O': cs.colors[6],
+		'NO3': cs.colors[8],
+		'SO4': cs.colors[9],
+	}
+
+	#loop through and plot
+	for i, s in enumerate(sps):
+
+		#make temp data frame
+		temp = select(part, species = s)
+
+		#pull color
+		c = [val for key, val in cm.items() if key in s][0]
+
+		#make trop filled, strat open
+		if 'trop' in s:
+			mfc = c
+			mec = 'k'
+			zo = 1
+
+		elif 'strat' in s:
+			mfc = 'w'
+			mec = c
+			zo = 0
+
+		#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+		# PANEL A: d17O vs. d18O plot #
+		#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+		_points(ax[0],
+			temp['dp18O'],
+			temp['dp17O'],
+			kind = 'errorbar',
+			color = c,
+			xerr = temp['d18O_std'],
+			yerr = temp['d17O_std'],
+			fmt = 'o',
+			mfc = mfc,
+			mec = mec,
+			ecolor = 'k',
+			markersize = 8,
+			zorder = zo,
+			label = s,
+			)
+
+		#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+		# PANEL B: D'17O vs. d18O plot #
+		#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+		_points(ax[1],
+			temp['dp18O'],
+			temp['Dp17O_5305'],
+			kind = 'errorbar',
+			color = c,
+			fmt = 'o',
+			mfc = mfc,
+			mec = mec,
+			ecolor = 'k',
+			markersize = 8,
+			zorder = zo,
+			)
+
+	#add MIF and MDF lines
+	_mif_mdf_lines(ax[0], [-150,250])
+
+	#set limits and labels
+	ax[0].set_xlim([-110,260])
+	ax[0].set_ylim([-60,165])
+
+	ax[0].legend(loc = 'best')
+
+	ax[0].set_xlabel(r"$\delta ' ^{18}O$ (‰ VSMOW)")
+	ax[0].set_ylabel(r"$\delta ' ^{17}O$ (‰ VSMOW)")
+
+	ax[1].set_xlim([-110,260])
+	ax[1].set_ylim([-4,52])
+
+	ax[1].set_xlabel(r"$\delta ' ^{18}O$ (‰ VSMOW)")
+	ax[1].set_ylabel(r"$\Delta ' ^{17}O_{\theta = 0.5305}$ (‰ VSMOW)")
+
+	with profiling.stage('tight_layout'):
+		fig.tight_layout()
+
+	return fig
+
+# FIG. O-MIF4: Model-predicted D17O-O2 vs. O2/CO2 ratios
+#	* Cao and Bao (2013)
+#	* Young et al. (2014)
+#	* Liu et al. (2021)
+
+#(MAKE PANELS B AND C IN ILLUSTRATOR)
+
+@register_figure('O-MIF4A', 'Fig_O-MIF_4A.pdf')
+def fig_o_mif_4a(tables):
+	'''
+	Cao and Bao (2013) model-predicted D17O of O2 vs. pO2/pCO2
+	'''
+
+	import matplotlib.pyplot as plt
+
+	#make figure
+	fig,ax = plt.subplots(1,1, figsize = (4,4))
+	ax.set_box_aspect(1)
+
+	#get colors
+	cm = plt.get_cmap(name = 'Accent', lut = 6)
+	cs = [
+		cm.colors[0],
+		cm.colors[1],
+		'k',
+		cm.colors[4],
+		cm.colors[3]
+		]
+
+	#make rho array
+	lr = np.linspace(-3,3,1000)
+	rho = 10**lr
+
+	#get list of tau multipliers to loop through
+	tms = [60,10,1,0.5,0.01]
+
+	#calculate D for every multiplier at once, (tm, rho)
+	D = D17O(rho, np.array(tms)[:,None])
+
+	for i, tm in enumerate(tms):
+
+		#plot
+		ax.plot(lr, D[i], linewidth = 2, color = cs[i])
+
+	#tighten up labels and axes
+	ax.set_xlim([-3,3])
+	ax.set_ylim([-65,0])
+
+	ax.set_xlabel(r'$pO_2/pCO_2$')
+	ax.set_ylabel(r'$\Delta ^{17}O_{0.52}$ (‰ VSMOW)')
+
+	with profiling.stage('tight_layout'):
+		fig.tight_layout()
+
+	return fig
+
+# FIG. O-MIF5: Three-isotope plot of all sulfate species
+#	A. d18O vs. d17O, sorted by type
+#	B. age vs. Dp17O for geologic samples only
+
+#sulfate lithologies, grouped by sample type
+SAM_TYPE = {
 'atmospheric': [
 	'Aerosol',
 	'Ash',
@@ -1113,105 +1700,173 @@ sam_type = {
 	]
 }
 
+@register_figure('O-MIF5', 'Fig_O-MIF_5.pdf', inputs = ('so4', 'standards'))
+def fig_o_mif_5(tables):
+	'''
+	Sulfate Delta-prime plot and Earth-history record, after correcting all
+	labs to the Wostbrock et al. (2020) scale
+	'''
 
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL A: TRIPLE ISOTOPE PLOT #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-
-for st, li in sam_type.items():
+	import matplotlib.pyplot as plt
 
-	#get those samples
-	temp = res[res['lithology'].isin(li)]
+	# STEP 1: GET DATA FROM ALL LABS ON SAME SCALE
+	cal_df = calibrate_labs(tables['standards'])
+	res = correct_so4(tables['so4'], cal_df)
+	part = table_partition(res, PARTITION_KEYS['so4'])
 
-	#plot scatterplot
-	ax[0].scatter(
-		temp['dp18O'],
-		temp['Dp17O_5305_corr_mean'],
-		facecolor = cm[st][0],
-		edgecolors = cm[st][1],
-		linewidths = 0.5,
-		s = 50,
-		marker = 'o',
-		label = st,
+	#make figure
+	fig,ax = plt.subplots(1,2,
+		figsize = (7.48,2.75)
 		)
 
-#add MDF shading
-gmwl_dp18O = np.array([-50,0])
-gmwl_dp17O = 0.52654 * gmwl_dp18O #+ 0.014 #Sharp et al. (2018)
-gmwl_Dp17O = gmwl_dp17O - 0.5305*gmwl_dp18O
-
-ax[0].fill_between(
-	[gmwl_dp18O[0] + 28, gmwl_dp18O[1] + 33], #x values
-	[gmwl_Dp17O[0] - 0.15, gmwl_Dp17O[1] - 0.15], #y1 values
-	[gmwl_Dp17O[0] - 0.2, gmwl_Dp17O[1] - 0.2], #y2 alues
-	alpha = 0.5,
-	color = cs.colors[3],
-	# zorder = 0,
-	)
-
-#set limits and labels
-ax[0].set_ylim([-2,6.2])
-ax[0].set_xlim([-25,40])
-
-ax[0].set_xlabel(r"$\delta ' ^{18} O$ (‰ VSMOW)")
-ax[0].set_ylabel(r"$\Delta ' ^{17} O$ (‰ VSMOW)")
-
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-# PANEL B: EARTH HISTORY PLOT #
-#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-
-#make color scheme
-cs = plt.get_cmap(name = 'Accent', lut = 6)
-
-cm = {
-	'Anhydrite': cs.colors[0],
-	'Barite': cs.colors[1],
-	'CAS': cs.colors[2],
-	'Evaporite': cs.colors[5],
-	'Gypsum': cs.colors[4],
-}
-
-gs = res[res['lithology'].isin(sam_type['geologic'])]
-
-for li in set(gs['lithology']):
-
-	#get temp
-	temp = gs[gs['lithology'] == li]
+	#make panel A square
+	ax[0].set_box_aspect(1)
+
+	#make color scheme
+	cs = plt.get_cmap(name = 'Accent', lut = 6)
+
+	cm = {
+		'geologic': [[0,0,0],[1,1,1]],
+		'atmospheric': [[0.25,0.25,0.25],[0,0,0]],
+		'modern_aquatic': [[0.5,0.5,0.5],[0,0,0]],
+		'modern_terrestrial': [[1,1,1],[0,0,0]],
+	}
+
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	# PANEL A: TRIPLE ISOTOPE PLOT #
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+	for st, li in SAM_TYPE.items():
+
+		#get those samples
+		temp = select(part, lithology = li)
+
+		#plot scatterplot; white symbols are shaded by their edge color
+		_points(ax[0],
+			temp['dp18O'],
+			temp['Dp17O_5305_corr_mean'],
+			color = cm[st][1] if cm[st][0] == [1,1,1] else cm[st][0],
+			facecolor = cm[st][0],
+			edgecolors = cm[st][1],
+			linewidths = 0.5,
+			s = 50,
+			marker = 'o',
+			label = st,
+			)
+
+	#add MDF shading
+	gmwl_dp18O = np.array([-50,0])
+	gmwl_dp17O = 0.52654 * gmwl_dp18O #+ 0.014 #Sharp et al. (2018)
+	gmwl_Dp17O = gmwl_dp17O - 0.5305*gmwl_dp18O
+
+	ax[0].fill_between(
+		[gmwl_dp18O[0] + 28, gmwl_dp18O[1] + 33], #x values
+		[gmwl_Dp17O[0] - 0.15, gmwl_Dp17O[1] - 0.15], #y1 values
+		[gmwl_Dp17O[0] - 0.2, gmwl_Dp17O[1] - 0.2], #y2 alues
+		alpha = 0.5,
+		color = cs.colors[3],
+		)
 
-	#plot results
-	ax[1].scatter(
-		temp['age_Ma'],
-		temp['Dp17O_5305_corr_mean'],
-		facecolor = cm[li],
-		edgecolors = 'k',
-		linewidths = 0.5,
-		s = 50,
-		marker = 'o',
-		label = li,
+	#set limits and labels
+	ax[0].set_ylim([-2,6.2])
+	ax[0].set_xlim([-25,40])
+
+	ax[0].set_xlabel(r"$\delta ' ^{18} O$ (‰ VSMOW)")
+	ax[0].set_ylabel(r"$\Delta ' ^{17} O$ (‰ VSMOW)")
+
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+	# PANEL B: EARTH HISTORY PLOT #
+	#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+	cm = {
+		'Anhydrite': cs.colors[0],
+		'Barite': cs.colors[1],
+		'CAS': cs.colors[2],
+		'Evaporite': cs.colors[5],
+		'Gypsum': cs.colors[4],
+	}
+
+	gs = select(part, lithology = SAM_TYPE['geologic'])
+
+	for li in [l for l in values(part, 'lithology') if l in SAM_TYPE['geologic']]:
+
+		#get temp
+		temp = select(part, lithology = li)
+
+		#plot results
+		_points(ax[1],
+			temp['age_Ma'],
+			temp['Dp17O_5305_corr_mean'],
+			color = cm[li],
+			facecolor = cm[li],
+			edgecolors = 'k',
+			linewidths = 0.5,
+			s = 50,
+			marker = 'o',
+			label = li,
+			)
+
+	#overlay binned and rolling medians of all geologic samples
+	ix = None
+
+	if so4_overlay is not None:
+
+		from age_index import build_age_index, binned_stats, rolling_median
+
+		ix = build_age_index(gs)
+
+	#nothing to overlay without dated geologic samples
+	if ix is not None and len(ix['age']):
+
+		st = binned_stats(ix, so4_overlay, by_group = False)
+
+		ax[1].errorbar(
+			(st['age_lo'] + st['age_hi'])/2,
+			st['median'],
+			yerr = st['mad'],
+			fmt = 's',
+			color = 'k',
+			markerfacecolor = 'w',
+			markersize = 4,
+			linewidth = 0.75,
+			zorder = 3,
+			)
+
+		rm = rolling_median(ix, so4_overlay,
+			at = np.arange(0, ix['age'][-1] + so4_overlay/10, so4_overlay/10))
+
+		ax[1].plot(
+			rm.index,
+			rm,
+			color = 'k',
+			linewidth = 1,
+			zorder = 3,
+			)
+
+	#add MDF shading
+	ax[1].fill_between(
+		[-100,3500], #x values
+		[gmwl_Dp17O[0] - 0.15, gmwl_Dp17O[0] - 0.15], #y1 values
+		[gmwl_Dp17O[1] - 0.2, gmwl_Dp17O[1] - 0.2], #y2 values
+		alpha = 0.5,
+		color = cs.colors[3],
+		zorder = 0,
 		)
 
-#add MDF shading
-ax[1].fill_between(
-	[-100,3500], #x values
-	[gmwl_Dp17O[0] - 0.15, gmwl_Dp17O[0] - 0.15], #y1 values
-	[gmwl_Dp17O[1] - 0.2, gmwl_Dp17O[1] - 0.2], #y2 values
-	alpha = 0.5,
-	color = cs.colors[3],
-	zorder = 0,
-	)
+	#set limits and labels
+	ax[1].set_ylim([-1.8,0.3])
+	ax[1].set_xlim([-100,3350])
+
+	ax[1].set_xlabel('age (Ma)')
+	ax[1].set_ylabel(r"$\Delta ' ^{17} O$ (‰ VSMOW)")
 
-#set limits and labels
-ax[1].set_ylim([-1.8,0.3])
-ax[1].set_xlim([-100,3350])
+	with profiling.stage('tight_layout'):
+		fig.tight_layout()
 
-ax[1].set_xlabel('age (Ma)')
-ax[1].set_ylabel(r"$\Delta ' ^{17} O$ (‰ VSMOW)")
+	return fig
 
 
-plt.tight_layout()
+if __name__ == '__main__':
 
-#save figure
-fig.savefig('Fig_O-MIF_5.pdf',
-	bbox_inches = 0,
-	transparent = True,
-	)
+	#build every figure, as the original script did
+	build_all()
@@ -0,0 +1,454 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: ARROW EXPORT OF DERIVED TABLES
+
+#import packages
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+
+#bumped whenever exported columns, types, or metadata change
+SCHEMA_VERSION = 1
+
+#exported tables: converted experiments and atmospheric samples,
+# per-experiment slopes, and lab-corrected sulfate
+EXPORTS = ['exp', 'atmos', 'scr', 'res']
+
+#source tables the exports are derived from
+SOURCES = ['exp', 'atmos', 'so4', 'standards']
+
+#string columns exported dictionary-encoded
+DICTIONARY = ['lab', 'species', 'lithology']
+
+#rows per record batch
+BATCH = 2**16
+
+#schema metadata key
+META_KEY = b'toid'
+
+#names of the segments this process published and has not yet released
+_published = set()
+
+#define functions
+def derived_tables(path = None, tables = None, incremental = False):
+	'''
+	Computes the fully derived tables
+
+	Parameters
+	----------
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	tables : dict or None
+		Already-loaded source tables, keyed by name; these are not re-read
+
+	incremental : bool
+		If True, takes 'exp', 'atmos', and 'res' from the derived-table store
+		(see `incremental.update`), which only recomputes what changed
+
+	Returns
+	-------
+	derived : dict
+		'exp' and 'atmos' (with delta-prime columns), 'scr' (screened
+		per-experiment slopes, see `analysis_code.exp_slopes`), and 'res'
+		(sulfate with lab corrections, see `analysis_code.correct_so4`)
+	'''
+
+	if incremental:
+		import incremental as inc
+
+		inc.update(path = path)
+		exp, atmos, res = (inc.load_derived(n, path = path)
+			for n in ('exp', 'atmos', 'so4'))
+
+	else:
+		tables = ac.load_tables(SOURCES, path = path, tables = tables)
+		exp, atmos = tables['exp'], tables['atmos']
+		res = ac.correct_so4(tables['so4'],
+			ac.calibrate_labs(tables['standards']))
+
+	return {
+		'exp': exp,
+		'atmos': atmos,
+		'scr': ac.exp_slopes(exp),
+		'res': res,
+		}
+
+def _sources(path):
+	'''
+	Hash of each source csv, or None for those that are missing
+	'''
+
+	import table_cache
+
+	path = ac.path if path is None else path
+	out = {}
+
+	for name in SOURCES:
+		fname = os.path.join(path, ac.TABLES[name])
+		out[name] = table_cache.file_hash(fname) \
+			if os.path.exists(fname) else None
+
+	return out
+
+def to_arrow(df, name, sources = None):
+	'''
+	Converts a derived table to an Arrow table with the export schema
+
+	Named indices (e.g. 'exp_nr' of 'scr') become leading columns. Columns
+	of `DICTIONARY` are dictionary-encoded (int32 codes into string
+	values); all other strings are utf8. Missing values, including NaN,
+	are stored as nulls. The schema metadata holds `SCHEMA_VERSION`, the
+	table name, and the source hashes.
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Derived table
+
+	name : str
+		Export name; one of `EXPORTS`
+
+	sources : dict or None
+		Source csv hashes to record, keyed by table name
+
+	Returns
+	-------
+	table : pyarrow.Table
+		Arrow table
+	'''
+
+	import pyarrow as pa
+
+	if df.index.name is not None:
+		df = df.reset_index()
+
+	cols, fields = [], []
+
+	for c in df.columns:
+
+		s = df[c]
+
+		if c in DICTIONARY:
+			codes, uniq = pd.factorize(s.astype(object))
+			arr = pa.DictionaryArray.from_arrays(
+				pa.array(codes.astype(np.int32), mask = codes < 0),
+				pa.array(uniq.astype(object), type = pa.string()))
+
+		elif s.dtype.kind in 'biuf':
+			arr = pa.array(s.to_numpy(), from_pandas = True)
+
+		else:
+			arr = pa.array(s.astype(object).where(s.notna(), None),
+				type = pa.string(), from_pandas = True)
+
+		cols.append(arr)
+		fields.append(pa.field(str(c), arr.type))
+
+	meta = {
+		'schema_version': SCHEMA_VERSION,
+		'table': name,
+		'sources': sources or {},
+		}
+
+	schema = pa.schema(fields, metadata = {META_KEY: json.dumps(meta)})
+
+	return pa.Table.from_arrays(cols, schema = schema)
+
+def export_meta(table):
+	'''
+	Export metadata of an Arrow table or schema
+
+	Parameters
+	----------
+	table : pyarrow.Table or pyarrow.Schema
+		Exported table, or its schema
+
+	Returns
+	-------
+	meta : dict
+		'schema_version', 'table', and 'sources'
+
+	Raises
+	------
+	ValueError
+		If the table was not written by this module, or by a different
+		`SCHEMA_VERSION`
+	'''
+
+	schema = getattr(table, 'schema', table)
+	raw = (schema.metadata or {}).get(META_KEY)
+
+	if raw is None:
+		raise ValueError('not an exported table')
+
+	meta = json.loads(raw)
+
+	if meta['schema_version'] != SCHEMA_VERSION:
+		raise ValueError('export schema version %s, expected %s' % (
+			meta['schema_version'], SCHEMA_VERSION))
+
+	return meta
+
+def write_ipc(tables, outdir, batch = BATCH):
+	'''
+	Writes Arrow tables as uncompressed IPC files, one per table
+
+	Uncompressed files can be memory-mapped and read without copying (see
+	`read_ipc`). Each file is written to a temporary name and then renamed,
+	so readers never see a partial file.
+
+	Parameters
+	----------
+	tables : dict
+		Arrow tables (see `to_arrow`), keyed by export name
+
+	outdir : str
+		Output directory
+
+	batch : int
+		Rows per record batch
+
+	Returns
+	-------
+	fnames : dict
+		Written files, keyed by export name
+	'''
+
+	import pyarrow as pa
+
+	os.makedirs(outdir, exist_ok = True)
+	fnames = {}
+
+	for name, t in tables.items():
+
+		fname = os.path.join(outdir, name + '.arrow')
+
+		with pa.OSFile(fname + '.tmp', 'wb') as sink:
+			with pa.ipc.new_file(sink, t.schema) as w:
+				w.write_table(t, max_chunksize = batch)
+
+		os.replace(fname + '.tmp', fname)
+		fnames[name] = fname
+
+	return fnames
+
+def read_ipc(fname):
+	'''
+	Memory-maps an exported IPC file
+
+	The returned table's buffers point into the mapped file; nothing is
+	copied until a column is converted (e.g. by `to_pandas`).
+
+	Parameters
+	----------
+	fname : str
+		IPC file written by `write_ipc`
+
+	Returns
+	-------
+	table : pyarrow.Table
+		Exported table
+	'''
+
+	import pyarrow as pa
+
+	t = pa.ipc.open_file(pa.memory_map(fname, 'r')).read_all()
+	export_meta(t)
+
+	return t
+
+def export(outdir, path = None, tables = None, incremental = False,
+	batch = BATCH):
+	'''
+	Derives every table of `EXPORTS` and writes it as an IPC file
+
+	Parameters
+	----------
+	outdir : str
+		Output directory
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	tables : dict or None
+		Already-loaded source tables, keyed by name
+
+	incremental : bool
+		If True, uses the derived-table store (see `derived_tables`)
+
+	batch : int
+		Rows per record batch
+
+	Returns
+	-------
+	fnames : dict
+		Written files, keyed by export name
+	'''
+
+	derived = derived_tables(path = path, tables = tables,
+		incremental = incremental)
+	sources = _sources(path)
+
+	return write_ipc({n: to_arrow(derived[n], n, sources)
+		for n in EXPORTS}, outdir, batch = batch)
+
+def _stream_size(table, batch):
+	'''
+	Bytes of a table written as an IPC stream
+	'''
+
+	import pyarrow as pa
+
+	sink = pa.MockOutputStream()
+	with pa.ipc.new_stream(sink, table.schema) as w:
+		w.write_table(table, max_chunksize = batch)
+
+	return sink.size()
+
+def publish_shared(tables, prefix = 'toid', batch = BATCH):
+	'''
+	Copies Arrow tables into shared-memory segments, one per table
+
+	Each segment holds one IPC stream, which other processes map with
+	`attach_shared` without copying. Segments live until the returned
+	handles are unlinked, e.g. by `release_shared`.
+
+	Parameters
+	----------
+	tables : dict
+		Arrow tables (see `to_arrow`), keyed by export name
+
+	prefix : str
+		Segment name prefix; segments are named '<prefix>_<export name>'
+
+	batch : int
+		Rows per record batch
+
+	Returns
+	-------
+	segments : dict
+		`multiprocessing.shared_memory.SharedMemory` handles, keyed by
+		export name
+	'''
+
+	import pyarrow as pa
+	from multiprocessing import shared_memory
+
+	segments = {}
+
+	for name, t in tables.items():
+
+		size = _stream_size(t, batch)
+		shm = shared_memory.SharedMemory(name = '%s_%s' % (prefix, name),
+			create = True, size = size)
+
+		#write the stream straight into the segment
+		sink = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf))
+		with pa.ipc.new_stream(sink, t.schema) as w:
+			w.write_table(t, max_chunksize = batch)
+
+		segments[name] = shm
+		_published.add(shm.name)
+
+	return segments
+
+def attach_shared(name, prefix = 'toid'):
+	'''
+	Maps an exported table from a shared-memory segment
+
+	The table's buffers point into the segment, so the returned handle must
+	stay open for as long as the table (or anything sliced from it) is used.
+	Only the publisher unlinks the segment (see `release_shared`); consumers
+	just close their handle. Tables may also be attached in the publishing
+	process itself.
+
+	Parameters
+	----------
+	name : str
+		Export name, e.g. 'res'
+
+	prefix : str
+		Segment name prefix used by `publish_shared`
+
+	Returns
+	-------
+	table : pyarrow.Table
+		Exported table
+
+	shm : multiprocessing.shared_memory.SharedMemory
+		Segment handle
+	'''
+
+	import pyarrow as pa
+	from multiprocessing import shared_memory
+
+	fname = '%s_%s' % (prefix, name)
+
+	#consumers must not unlink the segment when they exit; before Python
+	# 3.13 every attach registers it with this process's resource tracker.
+	# In the publishing process that registration is the publisher's own,
+	# which `release_shared` removes when it unlinks.
+	if sys.version_info >= (3, 13):
+		shm = shared_memory.SharedMemory(name = fname, track = False)
+
+	elif fname in _published:
+		shm = shared_memory.SharedMemory(name = fname)
+
+	else:
+		from multiprocessing import resource_tracker
+
+		shm = shared_memory.SharedMemory(name = fname)
+		resource_tracker.unregister(shm._name, 'shared_memory')
+
+	t = pa.ipc.open_stream(pa.py_buffer(shm.buf)).read_all()
+	export_meta(t)
+
+	return t, shm
+
+def release_shared(segments):
+	'''
+	Closes and unlinks shared-memory segments made by `publish_shared`;
+	segments that are already gone are skipped
+	'''
+
+	for shm in segments.values():
+		shm.close()
+		_published.discard(shm.name)
+
+		try:
+			shm.unlink()
+		except FileNotFoundError:
+			pass
+
+def main(argv = None):
+	'''
+	Command-line entry point
+	'''
+
+	p = argparse.ArgumentParser(description = 'Export the derived tables '
+		'(%s) as Arrow IPC files.' % ', '.join(EXPORTS))
+	p.add_argument('outdir', help = 'output directory')
+	p.add_argument('--path', default = None,
+		help = 'data directory of the compilations')
+	p.add_argument('--incremental', action = 'store_true',
+		help = 'take derived tables from the incremental store')
+	p.add_argument('--batch', type = int, default = BATCH,
+		help = 'rows per record batch')
+
+	args = p.parse_args(argv)
+
+	fnames = export(args.outdir, path = args.path,
+		incremental = args.incremental, batch = args.batch)
+
+	for name, fname in fnames.items():
+		print('%s: %s (%d bytes)' % (name, fname, os.path.getsize(fname)))
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,405 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: BENCHMARKS
+
+#import packages
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+import calibration
+
+#benchmarked stages, in run order; 'render' times every registered figure
+STAGES = ['load', 'convert', 'slopes', 'york', 'calibrate', 'render']
+
+#table sizes, as multiples of the real compilations
+SCALES = [1, 10, 100, 1000]
+
+#results are stored here by default
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	'.benchmarks')
+
+#define functions
+def scale_tables(tables, k, seed = 0):
+	'''
+	Makes synthetic raw tables k times the size of the real ones
+
+	Tables come from `synthetic.generate`, so group structure (experiments,
+	species, labs, lithologies) scales with them. The reaction-rate table is
+	left as is.
+
+	Parameters
+	----------
+	tables : dict
+		Raw tables, as returned by `analysis_code.read_table`
+
+	k : int
+		Scale factor; 1 returns the tables unchanged
+
+	seed : int
+		Random seed; defaults to 0
+
+	Returns
+	-------
+	scaled : dict
+		Scaled raw tables, keyed by table name
+	'''
+
+	if k == 1:
+		return dict(tables)
+
+	import synthetic
+
+	scaled = {}
+
+	for i, (name, df) in enumerate(tables.items()):
+
+		if name in synthetic.SYNTHETIC:
+			df = pd.concat(synthetic.generate(name, k*len(df), seed = [seed, i],
+				source = df))
+
+		scaled[name] = df
+
+	return scaled
+
+def write_tables(tables, path):
+	'''
+	Writes raw tables as csvs named as in `analysis_code.TABLES`
+	'''
+
+	for name, df in tables.items():
+		df.to_csv(os.path.join(path, ac.TABLES[name]),
+			index = name == 'standards',
+			encoding = 'ISO-8859-1',
+			)
+
+def measure(fn, repeat = 3):
+	'''
+	Times a function and measures the peak memory it allocates
+
+	The function is timed `repeat` times, then run once more under
+	tracemalloc (which slows it down) to record its peak allocation.
+
+	Parameters
+	----------
+	fn : callable
+		Function taking no arguments
+
+	repeat : int
+		Number of timed runs; defaults to 3
+
+	Returns
+	-------
+	result : dict
+		'best' and 'median' wall times (s), 'cpu' time of the best run (s),
+		and 'peak_mb' (peak traced allocation, MB)
+	'''
+
+	walls, cpus = [], []
+
+	for _ in range(repeat):
+
+		c0, t0 = time.process_time(), time.perf_counter()
+		fn()
+		walls.append(time.perf_counter() - t0)
+		cpus.append(time.process_time() - c0)
+
+	tracemalloc.start()
+
+	try:
+		fn()
+		_, peak = tracemalloc.get_traced_memory()
+
+	finally:
+		tracemalloc.stop()
+
+	return {
+		'best': min(walls),
+		'median': float(np.median(walls)),
+		'cpu': cpus[int(np.argmin(walls))],
+		'peak_mb': peak/2**20,
+		}
+
+def _stages(path, outdir, tables):
+	'''
+	Benchmarked stage functions for one set of tables, keyed by stage
+	'''
+
+	def load():
+		return {n: ac.load_table(n, path = path, cache = False)
+			for n in ac.TABLES}
+
+	def convert():
+		atmos = tables['atmos']
+		R17, R18 = ac.Dp_d_to_R(atmos['Dp17O_5305'].to_numpy(),
+			atmos['d18O_mean'].to_numpy())
+		ac.R_to_Dp_d(R17, R18)
+
+	def slopes():
+		ac.exp_slopes(tables['exp'])
+
+	def york():
+		ac.exp_slopes(tables['exp'], method = 'york')
+
+	def calibrate():
+		calibration._cache.clear()
+		ac.correct_so4(tables['so4'], ac.calibrate_labs(tables['standards']))
+
+	stages = {
+		'load': load,
+		'convert': convert,
+		'slopes': slopes,
+		'york': york,
+		'calibrate': calibrate,
+		}
+
+	for name in ac.FIGURES:
+
+		def render(name = name):
+			calibration._cache.clear()
+			ac.build_figure(name, tables = tables, outdir = outdir)
+
+		stages['render:' + name] = render
+
+	return stages
+
+def git_commit():
+	'''
+	Current git commit and whether the tree has uncommitted changes, or
+	(None, None) outside of a repository
+	'''
+
+	cwd = os.path.dirname(os.path.abspath(__file__))
+
+	try:
+		commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = cwd,
+			capture_output = True, text = True, check = True).stdout.strip()
+		dirty = bool(subprocess.run(['git', 'status', '--porcelain',
+			'--untracked-files=no'], cwd = cwd, capture_output = True,
+			text = True, check = True).stdout.strip())
+
+	except (OSError, subprocess.CalledProcessError):
+		return None, None
+
+	return commit, dirty
+
+def run(scales = None, stages = None, path = None, repeat = 3, seed = 0,
+	verbose = True):
+	'''
+	Runs the benchmarks
+
+	Parameters
+	----------
+	scales : list or None
+		Table sizes, as multiples of the real compilations; defaults to
+		`SCALES`
+
+	stages : list or None
+		Stages to run; defaults to `STAGES`. 'render' runs every figure;
+		single figures can be given as e.g. 'render:O-MIF5'.
+
+	path : str or None
+		Directory of the real compilations; defaults to `analysis_code.path`
+
+	repeat : int
+		Number of timed runs per stage; defaults to 3
+
+	seed : int
+		Seed of the synthetic noise; defaults to 0
+
+	verbose : bool
+		If True, prints each result as it is measured
+
+	Returns
+	-------
+	record : dict
+		Run metadata ('commit', 'dirty', 'date', and versions) and a list of
+		'results', one per stage and scale
+	'''
+
+	import matplotlib
+	matplotlib.use('Agg')
+
+	scales = SCALES if scales is None else scales
+	stages = STAGES if stages is None else stages
+
+	raw = {n: ac.read_table(n, path = path) for n in ac.TABLES}
+	commit, dirty = git_commit()
+
+	record = {
+		'commit': commit,
+		'dirty': dirty,
+		'date': datetime.datetime.now().isoformat(timespec = 'seconds'),
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'pandas': pd.__version__,
+		'machine': platform.machine(),
+		'cpus': os.cpu_count(),
+		'repeat': repeat,
+		'results': [],
+		}
+
+	for k in scales:
+
+		with tempfile.TemporaryDirectory() as tmp:
+
+			write_tables(scale_tables(raw, k, seed = seed), tmp)
+			tables = {n: ac.load_table(n, path = tmp, cache = False)
+				for n in ac.TABLES}
+
+			fns = _stages(tmp, tmp, tables)
+
+			for st in fns:
+
+				if st not in stages and st.split(':')[0] not in stages:
+					continue
+
+				res = measure(fns[st], repeat = repeat)
+				res.update({
+					'stage': st,
+					'scale': k,
+					'rows': int(sum(len(t) for t in tables.values())),
+					})
+
+				record['results'].append(res)
+
+				if verbose:
+					print('%-16s x%-5d %9.4f s %9.1f MB' % (st, k, res['best'],
+						res['peak_mb']), flush = True)
+
+	return record
+
+def save(record, results_dir = None):
+	'''
+	Saves a benchmark record as json, named by date and commit
+
+	Returns
+	-------
+	fname : str
+		Saved file
+	'''
+
+	results_dir = RESULTS_DIR if results_dir is None else results_dir
+	os.makedirs(results_dir, exist_ok = True)
+
+	tag = (record['commit'] or 'nogit')[:10] + ('-dirty' if record['dirty']
+		else '')
+	fname = os.path.join(results_dir, '%s_%s.json' % (
+		record['date'].replace(':', '').replace('-', ''), tag))
+
+	with open(fname, 'w') as f:
+		json.dump(record, f, indent = 1)
+
+	return fname
+
+def load(ref, results_dir = None):
+	'''
+	Loads a saved benchmark record
+
+	Parameters
+	----------
+	ref : str
+		File name, or a commit hash prefix (the latest record of that commit
+		is used)
+
+	results_dir : str or None
+		Results directory; defaults to `RESULTS_DIR`
+
+	Returns
+	-------
+	record : dict
+		Benchmark record
+	'''
+
+	results_dir = RESULTS_DIR if results_dir is None else results_dir
+
+	if not os.path.exists(ref):
+		match = sorted(f for f in os.listdir(results_dir)
+			if f.split('_', 1)[1].startswith(ref))
+		if not match:
+			raise FileNotFoundError('no benchmark results for %r' % ref)
+		ref = os.path.join(results_dir, match[-1])
+
+	with open(ref) as f:
+		return json.load(f)
+
+def compare(old, new, threshold = 1.2):
+	'''
+	Compares two benchmark records stage by stage
+
+	Parameters
+	----------
+	old, new : dict
+		Benchmark records, as returned by `run` or `load`
+
+	threshold : float
+		Ratio of new to old best time (or peak memory) above which a stage is
+		flagged as a regression; defaults to 1.2
+
+	Returns
+	-------
+	cmp : pd.DataFrame
+		Table indexed by (stage, scale) with old and new best times and peak
+		memory, their ratios, and a 'regression' flag
+	'''
+
+	a = pd.DataFrame(old['results']).set_index(['stage', 'scale'])
+	b = pd.DataFrame(new['results']).set_index(['stage', 'scale'])
+
+	cmp = a[['best', 'peak_mb']].join(b[['best', 'peak_mb']], how = 'inner',
+		lsuffix = '_old', rsuffix = '_new')
+
+	cmp['time_ratio'] = cmp['best_new']/cmp['best_old']
+	cmp['mem_ratio'] = cmp['peak_mb_new']/cmp['peak_mb_old']
+	cmp['regression'] = (cmp['time_ratio'] > threshold) | \
+		(cmp['mem_ratio'] > threshold)
+
+	return cmp
+
+def main(argv = None):
+	'''
+	Command-line entry point
+	'''
+
+	p = argparse.ArgumentParser(description = 'Time and profile the memory '
+		'of each analysis stage on real and scaled-up compilations.')
+	p.add_argument('--scales', type = int, nargs = '+', default = SCALES)
+	p.add_argument('--stages', nargs = '+', default = STAGES)
+	p.add_argument('--path', default = None,
+		help = 'directory of the real compilations')
+	p.add_argument('--repeat', type = int, default = 3)
+	p.add_argument('--seed', type = int, default = 0)
+	p.add_argument('--results-dir', default = None)
+	p.add_argument('--compare', default = None, metavar = 'REF',
+		help = 'saved results (file or commit prefix) to compare against')
+	p.add_argument('--no-save', action = 'store_true')
+
+	args = p.parse_args(argv)
+
+	#read the reference first, so it cannot be this run's own results
+	ref = load(args.compare, args.results_dir) if args.compare else None
+
+	record = run(scales = args.scales, stages = args.stages,
+		path = args.path, repeat = args.repeat, seed = args.seed)
+
+	if not args.no_save:
+		print('saved', save(record, args.results_dir))
+
+	if ref is not None:
+		cmp = compare(ref, record)
+		print(cmp.round(3).to_string())
+		return int(cmp['regression'].any())
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
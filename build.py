@@ -0,0 +1,377 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: INCREMENTAL FIGURE BUILDS
+
+#import packages
+import argparse
+import ast
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+
+import analysis_code as ac
+import profiling
+from table_cache import file_hash
+
+#manifest of the last build, stored in the output directory
+MANIFEST = '.build_manifest.json'
+MANIFEST_VERSION = 1
+
+#module-level settings of analysis_code that change how figures are drawn
+PARAMS = ['so4_overlay', 'raster_points', 'density_points', 'density_bins']
+
+#define functions
+def select_figures(patterns = None):
+	'''
+	Registered figure names matching names or glob patterns
+
+	Parameters
+	----------
+	patterns : iterable or None
+		Figure names or glob patterns, e.g. 'O-MIF5' or 'O-MIF*'; defaults to
+		every registered figure
+
+	Returns
+	-------
+	names : list
+		Matching figure names, in registry order
+	'''
+
+	if not patterns:
+		return list(ac.FIGURES)
+
+	names = []
+
+	for p in patterns:
+		hits = [n for n in ac.FIGURES if fnmatch.fnmatchcase(n, p)]
+		if not hits:
+			raise KeyError('no registered figure matches %r' % p)
+		names += [n for n in hits if n not in names]
+
+	return [n for n in ac.FIGURES if n in names]
+
+def read_manifest(outdir):
+	'''
+	Reads the build manifest of an output directory, or an empty one
+	'''
+
+	try:
+		with open(os.path.join(outdir, MANIFEST)) as f:
+			man = json.load(f)
+
+	except (OSError, ValueError):
+		man = None
+
+	if not man or man.get('version') != MANIFEST_VERSION:
+		man = {'version': MANIFEST_VERSION, 'files': {}, 'figures': {}}
+
+	return man
+
+def write_manifest(outdir, man):
+	'''
+	Writes the build manifest atomically
+	'''
+
+	fname = os.path.join(outdir, MANIFEST)
+	tmp = fname + '.tmp'
+
+	with open(tmp, 'w') as f:
+		json.dump(man, f, indent = 1, sort_keys = True)
+
+	os.replace(tmp, fname)
+
+def input_hashes(names, path, files):
+	'''
+	sha1 hashes of input tables
+
+	A file whose size and modification time match its entry in `files` is
+	not read again; others are hashed and their entries updated in place.
+
+	Parameters
+	----------
+	names : iterable
+		Table names; must be keys in `analysis_code.TABLES`
+
+	path : str
+		Data directory
+
+	files : dict
+		File states from the manifest, keyed by table name
+
+	Returns
+	-------
+	hashes : dict
+		sha1 of each table, keyed by table name
+	'''
+
+	hashes = {}
+
+	for name in names:
+
+		fname = os.path.join(path, ac.TABLES[name])
+		st = os.stat(fname)
+		old = files.get(name)
+
+		if old is None or old['size'] != st.st_size or \
+			old['mtime_ns'] != st.st_mtime_ns:
+
+			old = {
+				'size': st.st_size,
+				'mtime_ns': st.st_mtime_ns,
+				'sha1': file_hash(fname),
+				}
+			files[name] = old
+
+		hashes[name] = old['sha1']
+
+	return hashes
+
+def _local_imports(fname, here):
+	'''
+	Modules of this directory imported anywhere in a source file, including
+	inside functions
+	'''
+
+	with open(fname, 'rb') as f:
+		tree = ast.parse(f.read(), fname)
+
+	mods = set()
+
+	for node in ast.walk(tree):
+		if isinstance(node, ast.Import):
+			mods.update(a.name.split('.')[0] for a in node.names)
+		elif isinstance(node, ast.ImportFrom) and node.module and \
+			not node.level:
+			mods.add(node.module.split('.')[0])
+
+	return {m for m in mods if os.path.exists(os.path.join(here, m + '.py'))}
+
+def code_hash():
+	'''
+	sha1 of the source of `analysis_code` and every module of this directory
+	it imports, directly or not, so that code changes also trigger rebuilds
+	'''
+
+	here = os.path.dirname(os.path.abspath(__file__))
+	todo, seen = ['analysis_code'], set()
+
+	while todo:
+		m = todo.pop()
+		if m not in seen:
+			seen.add(m)
+			todo += _local_imports(os.path.join(here, m + '.py'), here)
+
+	h = hashlib.sha1()
+
+	for m in sorted(seen):
+		h.update(m.encode())
+		h.update(file_hash(os.path.join(here, m + '.py')).encode())
+
+	return h.hexdigest()
+
+def build_params():
+	'''
+	Current values of the settings in `PARAMS`
+	'''
+
+	return {k: getattr(ac, k) for k in PARAMS}
+
+def stale(names = None, path = None, outdir = '.', man = None):
+	'''
+	Figures whose inputs, settings, or code changed since they were last built
+
+	Parameters
+	----------
+	names : iterable or None
+		Figure names to check; defaults to every registered figure
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	outdir : str
+		Output directory holding the figures and the manifest
+
+	man : dict or None
+		Manifest; read from `outdir` if None. File states are updated in
+		place.
+
+	Returns
+	-------
+	todo : dict
+		Reason for rebuilding each stale figure, keyed by figure name
+		('new', 'missing', 'code', 'params', or the changed input tables)
+
+	entries : dict
+		Manifest entries the figures will have once built, keyed by name
+	'''
+
+	path = ac.path if path is None else path
+	man = read_manifest(outdir) if man is None else man
+	names = list(ac.FIGURES) if names is None else list(names)
+
+	inputs = dict.fromkeys(t for n in names for t in ac.FIGURES[n]['inputs'])
+	hashes = input_hashes(inputs, path, man['files'])
+	code = code_hash()
+	params = json.loads(json.dumps(build_params()))
+
+	todo, entries = {}, {}
+
+	for n in names:
+
+		spec = ac.FIGURES[n]
+		new = {
+			'fname': spec['fname'],
+			'inputs': {t: hashes[t] for t in spec['inputs']},
+			'params': params,
+			'code': code,
+			}
+		entries[n] = new
+		old = man['figures'].get(n)
+
+		if old is None:
+			todo[n] = 'new'
+
+		elif not os.path.exists(os.path.join(outdir, spec['fname'])):
+			todo[n] = 'missing'
+
+		elif old['code'] != new['code'] or old['fname'] != new['fname']:
+			todo[n] = 'code'
+
+		elif old['params'] != new['params']:
+			todo[n] = 'params'
+
+		elif old['inputs'] != new['inputs']:
+			todo[n] = ', '.join(sorted(t for t in set(old['inputs']) |
+				set(new['inputs']) if old['inputs'].get(t) !=
+				new['inputs'].get(t)))
+
+	return todo, entries
+
+def build(names = None, path = None, outdir = '.', jobs = None, force = False,
+	dry_run = False, verbose = True):
+	'''
+	Rebuilds only the figures that are out of date
+
+	A figure is rebuilt if it has not been built into `outdir` before, its
+	file is missing, or the hash of any of its input tables (see
+	`analysis_code.FIGURES`), the settings in `PARAMS`, or the code changed
+	since. Only the tables needed by the rebuilt figures are loaded.
+
+	Parameters
+	----------
+	names : iterable or None
+		Figure names or glob patterns; defaults to every registered figure
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	outdir : str
+		Output directory
+
+	jobs : int or None
+		Number of worker processes, as in `analysis_code.build_parallel`
+
+	force : bool
+		If True, rebuilds every selected figure
+
+	dry_run : bool
+		If True, only reports what would be rebuilt
+
+	verbose : bool
+		If True, prints what is rebuilt and why
+
+	Returns
+	-------
+	todo : dict
+		Reason for rebuilding each rebuilt (or, with `dry_run`, stale)
+		figure, keyed by figure name
+	'''
+
+	path = ac.path if path is None else path
+	names = select_figures(names)
+
+	os.makedirs(outdir, exist_ok = True)
+	man = read_manifest(outdir)
+
+	todo, entries = stale(names, path = path, outdir = outdir, man = man)
+
+	if force:
+		todo = {n: todo.get(n, 'forced') for n in names}
+
+	if verbose:
+		for n in names:
+			print('%-10s %s' % (n, todo.get(n, 'up to date')), flush = True)
+
+	if dry_run:
+		return todo
+
+	if not todo:
+		write_manifest(outdir, man)
+		return todo
+
+	timings = ac.build_parallel(list(todo), path = path, outdir = outdir,
+		jobs = jobs)
+
+	for n in todo:
+		man['figures'][n] = entries[n]
+
+	write_manifest(outdir, man)
+
+	if verbose:
+		for n, row in timings.iterrows():
+			print('built %-10s %7.2f s  %s' % (n, row['seconds'],
+				row['fname']))
+		print('total %17.2f s' % timings.attrs['wall'])
+
+	return todo
+
+def main(argv = None):
+	'''
+	Command-line entry point
+	'''
+
+	p = argparse.ArgumentParser(description = 'Rebuild the figures whose '
+		'input tables, settings, or code changed since the last build.')
+	p.add_argument('names', nargs = '*', metavar = 'FIGURE',
+		help = 'figure names or glob patterns (default: all); one of %s' %
+		', '.join(ac.FIGURES))
+	p.add_argument('--path', default = None, help = 'data directory')
+	p.add_argument('--outdir', default = '.', help = 'output directory')
+	p.add_argument('-j', '--jobs', type = int, default = None,
+		help = 'number of worker processes')
+	p.add_argument('-B', '--force', action = 'store_true',
+		help = 'rebuild the selected figures even if up to date')
+	p.add_argument('-n', '--dry-run', action = 'store_true',
+		help = 'only report which figures are out of date')
+	p.add_argument('--no-cache', action = 'store_true',
+		help = 'read the csvs directly instead of the binary table cache')
+	p.add_argument('--profile', default = None, metavar = 'TRACE',
+		help = 'record the time and peak memory of each stage, print a '
+		'summary, and save a Chrome trace json')
+
+	args = p.parse_args(argv)
+
+	if args.no_cache:
+		ac.use_cache = False
+
+	try:
+		select_figures(args.names)
+	except KeyError as e:
+		p.error(e.args[0])
+
+	if args.profile:
+		profiling.enable()
+
+	build(args.names, path = args.path, outdir = args.outdir,
+		jobs = args.jobs, force = args.force, dry_run = args.dry_run)
+
+	if args.profile:
+		print(profiling.summary().round(3).to_string())
+		print(profiling.summary(by = ('name', 'figure')).round(3).to_string())
+		print('saved', profiling.save(args.profile, meta = {
+			'figures': args.names, 'path': args.path, 'jobs': args.jobs}))
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
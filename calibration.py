@@ -0,0 +1,343 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: INTER-LABORATORY CALIBRATION SOLVER
+
+#import packages
+import warnings
+
+import numpy as np
+import pandas as pd
+
+#solved calibrations, keyed by standards content and solver parameters
+_cache = {}
+
+#define functions
+def calibration_system(stds, anchor = 'Sh', min_spread = 5, default_std = None):
+	'''
+	Sets up the weighted least-squares system linking labs through standards
+
+	Labs and standards form a graph, with an edge wherever a lab measured a
+	standard. Starting from the anchor lab(s), labs are added whenever they
+	share at least one standard with a lab already reached, so calibrations
+	can chain through any number of labs. Each measurement of a shared
+	standard s by lab l gives one equation
+
+		Dp17O_ls = T_s + m_l*d18O_ls + b_l
+
+	where T_s is the "true" Dp17O of the standard and m_l = b_l = 0 for the
+	anchor. Labs with at least two shared standards spanning `min_spread`
+	permil in d18O get a slope; the rest get a constant offset (m_l = 0).
+
+	Parameters
+	----------
+	stds : pd.DataFrame
+		Standards table, indexed by standard name, with columns 'lab',
+		'd18O_mean', 'Dp17O_5305_mean', and optionally 'Dp17O_5305_std'
+
+	anchor : str or list
+		Lab(s) whose values are taken as true; defaults to 'Sh', the Sharp
+		lab values of Wostbrock et al. (2020)
+
+	min_spread : float
+		Minimum d18O range of a lab's shared standards to fit a slope;
+		defaults to 5 permil
+
+	default_std : float or None
+		Dp17O uncertainty used where 'Dp17O_5305_std' is missing; defaults to
+		the median of the reported values (or 1 if none are reported)
+
+	Returns
+	-------
+	system : dict
+		Solver inputs: 'rows' (positional rows of `stds` used), 'cols' (the
+		T, m, and b parameter column of each row), 'has_m' and 'has_b'
+		(whether each row's lab has a slope and offset), 'w' (weights),
+		'n_params', and per-lab 'labs' and per-standard 'stds' tables
+	'''
+
+	anchors = [anchor] if isinstance(anchor, str) else list(anchor)
+
+	lab = stds['lab'].astype(str).to_numpy()
+	std = np.asarray(stds.index.astype(str))
+	d18O = stds['d18O_mean'].to_numpy(dtype = float)
+	Dp17O = stds['Dp17O_5305_mean'].to_numpy(dtype = float)
+
+	if 'Dp17O_5305_std' in stds.columns:
+		sd = stds['Dp17O_5305_std'].to_numpy(dtype = float)
+	else:
+		sd = np.full(len(stds), np.nan)
+
+	if default_std is None:
+		ok = np.isfinite(sd) & (sd > 0)
+		default_std = np.median(sd[ok]) if ok.any() else 1
+
+	sd = np.where(np.isfinite(sd) & (sd > 0), sd, default_std)
+
+	#only complete measurements can be used
+	valid = np.isfinite(d18O) & np.isfinite(Dp17O)
+
+	#standards measured by each lab, and labs measuring each standard
+	by_lab, by_std = {}, {}
+	for i in np.flatnonzero(valid):
+		by_lab.setdefault(lab[i], set()).add(std[i])
+		by_std.setdefault(std[i], set()).add(lab[i])
+
+	#breadth-first search out from the anchor(s)
+	hops = {l: 0 for l in anchors if l in by_lab}
+	known = set().union(*[by_lab[l] for l in hops]) if hops else set()
+	h = 0
+
+	while True:
+
+		h += 1
+		new = [l for l in sorted(by_lab) if l not in hops and by_lab[l] & known]
+
+		if not new:
+			break
+
+		for l in new:
+			hops[l] = h
+
+		known |= set().union(*[by_lab[l] for l in new])
+
+	#shared standards: measured by at least two reached labs
+	shared = sorted(
+		s for s, ls in by_std.items() if len(ls & set(hops)) >= 2
+		)
+
+	rows = np.array([
+		i for i in np.flatnonzero(valid) if lab[i] in hops and std[i] in shared
+		], dtype = int)
+
+	#parameter columns: T for each standard, then m and b for each lab
+	t_col = {s: i for i, s in enumerate(shared)}
+	p = len(shared)
+
+	lab_info = []
+
+	for l in sorted(hops):
+
+		r = rows[lab[rows] == l]
+
+		if l in anchors:
+			mode, mc, bc = 'anchor', -1, -1
+
+		elif len(r) >= 2 and np.ptp(d18O[r]) >= min_spread:
+			mode, mc, bc = 'line', p, p + 1
+			p += 2
+
+		else:
+			mode, mc, bc = 'offset', -1, p
+			p += 1
+
+		lab_info.append((l, mode, hops[l], len(r), mc, bc))
+
+	labs = pd.DataFrame(lab_info,
+		columns = ['lab', 'mode', 'hops', 'n_std', 'm_col', 'b_col'],
+		).set_index('lab')
+
+	#column triplet of each row; absent parameters point at column 0 with
+	# a zero coefficient
+	mcol = labs['m_col'].reindex(lab[rows]).to_numpy()
+	bcol = labs['b_col'].reindex(lab[rows]).to_numpy()
+
+	cols = np.column_stack([
+		[t_col[s] for s in std[rows]],
+		np.maximum(mcol, 0),
+		np.maximum(bcol, 0),
+		]).astype(int)
+
+	system = {
+		'rows': rows,
+		'cols': cols,
+		'has_m': mcol >= 0,
+		'has_b': bcol >= 0,
+		'w': 1/sd[rows]**2,
+		'n_params': p,
+		'labs': labs,
+		'stds': pd.Series(t_col, dtype = int),
+		}
+
+	return system
+
+def solve_system(system, Dp17O, d18O):
+	'''
+	Solves a calibration system for one or many sets of standard values
+
+	The normal equations are assembled directly from each row's (at most
+	three) nonzero coefficients and solved for every set at once, so this
+	is used both for the point calibration and for Monte Carlo draws.
+
+	Parameters
+	----------
+	system : dict
+		Calibration system, as returned by `calibration_system`
+
+	Dp17O : np.array
+		Standard Dp17O values for every row of the standards table, shape
+		(n_standards,) or (n_sets, n_standards)
+
+	d18O : np.array
+		Standard d18O values, same shape as `Dp17O`
+
+	Returns
+	-------
+	theta : np.array
+		Solved parameters, shape (n_params,) or (n_sets, n_params)
+	'''
+
+	Dp17O = np.asarray(Dp17O, dtype = float)
+	d18O = np.asarray(d18O, dtype = float)
+
+	single = Dp17O.ndim == 1
+	Dp17O, d18O = np.atleast_2d(Dp17O), np.atleast_2d(d18O)
+
+	k = len(Dp17O)
+	p = system['n_params']
+	rows, cols, w = system['rows'], system['cols'], system['w']
+
+	#coefficients of each row, (k, R, 3)
+	a = np.ones((k, len(rows), 3))
+	a[:,:,1] = d18O[:,rows] * system['has_m']
+	a[:,:,2] *= system['has_b']
+
+	y = Dp17O[:,rows]
+
+	#assemble normal equations by scatter-adding each row's terms
+	N = np.zeros((k, p*p))
+	rhs = np.zeros((k, p))
+
+	for i in range(3):
+
+		np.add.at(rhs, (slice(None), cols[:,i]), w*a[:,:,i]*y)
+
+		for j in range(3):
+			np.add.at(N, (slice(None), cols[:,i]*p + cols[:,j]),
+				w*a[:,:,i]*a[:,:,j])
+
+	N = N.reshape(k, p, p)
+
+	try:
+		theta = np.linalg.solve(N, rhs[:,:,None])[:,:,0]
+
+	except np.linalg.LinAlgError:
+		warnings.warn('calibration system is rank deficient; using the '
+			'minimum-norm solution', RuntimeWarning)
+		theta = np.einsum('kij,kj->ki', np.linalg.pinv(N), rhs)
+
+	return theta[0] if single else theta
+
+def system_cal(system, theta):
+	'''
+	Extracts per-lab slopes and intercepts from solved parameters
+
+	Parameters
+	----------
+	system : dict
+		Calibration system, as returned by `calibration_system`
+
+	theta : np.array
+		Solved parameters, shape (n_params,) or (n_sets, n_params)
+
+	Returns
+	-------
+	m : np.array
+		Slope of each lab in `system['labs']`, shape (n_labs,) or
+		(n_sets, n_labs)
+
+	b : np.array
+		Intercept of each lab, same shape as `m`
+	'''
+
+	labs = system['labs']
+	theta = np.asarray(theta)
+
+	#append a zero so that absent parameters (column -1) read as zero
+	th = np.concatenate([theta, np.zeros(theta.shape[:-1] + (1,))], axis = -1)
+
+	m = th[..., labs['m_col'].to_numpy()]
+	b = th[..., labs['b_col'].to_numpy()]
+
+	return m, b
+
+def _stds_key(stds, params):
+	'''
+	Hashable key of a standards table's content and solver parameters
+	'''
+
+	cols = [c for c in
+		['lab', 'd18O_mean', 'Dp17O_5305_mean', 'Dp17O_5305_std']
+		if c in stds.columns]
+
+	t = stds[cols].reset_index().astype(str)
+	h = pd.util.hash_pandas_object(t, index = False).to_numpy()
+
+	return (h.tobytes(), repr(params))
+
+def solve_calibration(stds, anchor = 'Sh', min_spread = 5, default_std = None,
+	cache = True):
+	'''
+	Solves the Dp17O transfer function of every lab at once
+
+	See `calibration_system` for the model. Results are cached on the
+	content of the standards table and the solver parameters, so repeated
+	calls (e.g., once per figure) solve only once.
+
+	Parameters
+	----------
+	stds : pd.DataFrame
+		Standards table, indexed by standard name
+
+	anchor : str or list
+		Lab(s) whose values are taken as true; defaults to 'Sh'
+
+	min_spread : float
+		Minimum d18O range of a lab's shared standards to fit a slope;
+		defaults to 5 permil
+
+	default_std : float or None
+		Dp17O uncertainty used where 'Dp17O_5305_std' is missing
+
+	cache : bool
+		If True, reuses a previously solved calibration
+
+	Returns
+	-------
+	cal_df : pd.DataFrame
+		Table indexed by every lab in `stds` with columns 'm' and 'b', such
+		that corrected Dp17O = Dp17O - m*d18O - b, plus 'mode' ('anchor',
+		'line', or 'offset'), 'hops' (distance from the anchor), and 'n_std'
+		(shared standards used). Labs not connected to the anchor are NaN.
+
+	true : pd.Series
+		Solved true Dp17O of each shared standard
+	'''
+
+	params = (anchor, min_spread, default_std)
+	key = _stds_key(stds, params) if cache else None
+
+	if key in _cache:
+		cal_df, true = _cache[key]
+		return cal_df.copy(), true.copy()
+
+	system = calibration_system(stds, anchor = anchor,
+		min_spread = min_spread, default_std = default_std)
+
+	theta = solve_system(system,
+		stds['Dp17O_5305_mean'].to_numpy(dtype = float),
+		stds['d18O_mean'].to_numpy(dtype = float),
+		)
+
+	m, b = system_cal(system, theta)
+
+	labs = system['labs']
+	cal_df = pd.DataFrame({'m': m, 'b': b}, index = labs.index)
+	cal_df = cal_df.join(labs[['mode', 'hops', 'n_std']])
+	cal_df = cal_df.reindex(sorted(set(stds['lab'].astype(str))))
+	cal_df.index.name = None
+
+	true = pd.Series(theta[system['stds'].to_numpy()],
+		index = system['stds'].index, name = 'Dp17O_5305_true')
+
+	if cache:
+		_cache[key] = (cal_df, true)
+
+	return cal_df.copy(), true.copy()
@@ -0,0 +1,527 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: CITATION KEYS AND REFERENCE INDEX
+
+#import packages
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+
+#tables with a 'reference' column
+CITED = ['exp', 'atmos', 'so4', 'standards']
+
+#journal abbreviations of the citation keys, keyed by journal as written in
+# the tables (lowercase, without periods)
+JOURNALS = {
+	'anal chem': 'analchem',
+	'atmos chem phys': 'acp',
+	'atmos env': 'atmosenv',
+	'atmos environ': 'atmosenv',
+	'chem geol': 'chemgeol',
+	'chem phys': 'chemphys',
+	'chem phys lett': 'cpl',
+	'chemosphere': 'chem',
+	'dep rec': 'deprec',
+	'earth space sci': 'ess',
+	'env sci tech': 'est',
+	'environ sci tech': 'est',
+	'epsl': 'epsl',
+	'es&t': 'est',
+	'gca': 'gca',
+	'geochim cosmochim ac': 'gca',
+	'geology': 'geol',
+	'grl': 'grl',
+	'j chem phys': 'jcp',
+	'j geophys res': 'jgr',
+	'j geophys res atmos': 'jgr',
+	'j phys chem': 'jpc',
+	'jcp': 'jcp',
+	'jgr': 'jgr',
+	'jgr atmos': 'jgr',
+	'jpc-a': 'jpca',
+	'nature': 'nat',
+	'nature comms': 'natcomms',
+	'nature geosci': 'natgeo',
+	'ph d thesis': 'thesis',
+	'pnas': 'pnas',
+	'precambrian research': 'precamres',
+	'rcms': 'rcms',
+	'science': 'sci',
+	'sci rep': 'scirep',
+	'sci tot environ': 'scitotenv',
+	'solar system history': 'ssh',
+	'tellus': 'tellus',
+	'z naturforsch': 'znf',
+}
+
+#first-author spellings in the tables that differ from the README keys
+AUTHORS = {
+	'Bindemann': 'Bindeman',
+	'Panday': 'Pandey',
+}
+
+#README keys that do not follow the table's year or journal, keyed by the
+# key generated here
+KEY_ALIASES = {
+	'Crockford-2017geol': 'Crockford-2018geol',
+	'Crockford-2019chemgeol': 'Crockford-2019cg',
+	'Mauersberger-2003ssh': 'Mauersberger-2002ssr',
+	'Savarino-1999atmosenv': 'Savarino-1999ae',
+	'Wostbrock-2020chemgeol': 'Wostbrock-2020cg',
+}
+
+#one citation: authors, year with optional letter, journal
+_CITATION = re.compile(
+	r'^\s*(?P<authors>.+?)\s*\((?P<year>\d{4})(?P<letter>[a-z]?)\)\s*'
+	r'(?P<journal>.*?)\s*$')
+
+_UMLAUTS = str.maketrans({
+	'\xe4': 'ae', '\xf6': 'oe', '\xfc': 'ue', '\xc4': 'Ae', '\xd6': 'Oe',
+	'\xdc': 'Ue', '\xdf': 'ss'})
+
+#fields of the index
+FIELDS = ('key', 'author', 'year', 'journal', 'lab')
+
+#define functions
+def _text(s):
+	'''
+	Undoes Mac Roman text read as ISO-8859-1 (e.g. 'Fr\\x9fchtl'), leaving
+	other strings unchanged
+	'''
+
+	if re.search('[\x80-\x9f]', s):
+		try:
+			return s.encode('latin-1').decode('mac_roman')
+		except UnicodeError:
+			pass
+
+	return s
+
+def author_key(name):
+	'''
+	Normalized surname, e.g. 'Hill-Falkenthal' -> 'HillFalkenthal' and
+	'R\\xf6ckmann' -> 'Roeckmann'
+
+	Parameters
+	----------
+	name : str
+		Surname
+
+	Returns
+	-------
+	key : str
+		Surname with umlauts transliterated and accents, spaces, and
+		punctuation removed
+	'''
+
+	name = unicodedata.normalize('NFKD', _text(name).translate(_UMLAUTS))
+	name = re.sub(r'[^A-Za-z]', '', name.encode('ascii', 'ignore').decode())
+
+	return AUTHORS.get(name, name)
+
+def journal_key(journal):
+	'''
+	Journal abbreviation, e.g. 'Geochim. Cosmochim. Ac.' -> 'gca'
+
+	Journals missing from `JOURNALS` keep their lowercase letters.
+	Anything after a comma (e.g. the university of a thesis) is ignored.
+
+	Parameters
+	----------
+	journal : str
+		Journal as written in a reference
+
+	Returns
+	-------
+	abbr : str
+		Abbreviation
+	'''
+
+	j = _text(journal).split(',')[0].lower().replace('.', ' ')
+	j = ' '.join(j.split())
+
+	if j in JOURNALS:
+		return JOURNALS[j]
+
+	return re.sub(r'[^a-z]', '', j)
+
+def parse_citation(citation):
+	'''
+	Parses one citation, e.g. 'Bao et al. (2000b) Nature'
+
+	Parameters
+	----------
+	citation : str
+		Authors, year in parentheses, and journal
+
+	Returns
+	-------
+	cit : dict or None
+		'key' (e.g. 'Bao-2000natb'; see `KEY_ALIASES`), 'author' (first
+		author), 'authors' (every named author), 'year' (int), 'journal'
+		(abbreviation), and 'citation'; None if there is no year
+	'''
+
+	m = _CITATION.match(citation)
+	if m is None:
+		return None
+
+	#'A et al.', 'A and B', or 'A, B, and C'
+	names = re.split(r'\s*,\s*(?:and\s+)?|\s+and\s+',
+		m.group('authors').split(' et al')[0])
+	authors = [author_key(n.split()[-1]) for n in names if n.strip()]
+
+	journal = journal_key(m.group('journal'))
+	key = '%s-%s%s%s' % (authors[0], m.group('year'), journal,
+		m.group('letter'))
+
+	return {
+		'key': KEY_ALIASES.get(key, key),
+		'author': authors[0],
+		'authors': authors,
+		'year': int(m.group('year')),
+		'journal': journal,
+		'citation': _text(citation.strip()),
+		}
+
+def parse_references(refs):
+	'''
+	Citations of each distinct reference string
+
+	References citing several publications (separated by ';') give one row
+	per publication. Each distinct string is parsed once.
+
+	Parameters
+	----------
+	refs : array-like
+		Reference strings, e.g. a table's 'reference' column
+
+	Returns
+	-------
+	cits : pd.DataFrame
+		One row per reference and citation, with 'reference' and the fields
+		of `parse_citation`; references without a year are left out
+	'''
+
+	out = []
+
+	for r in pd.unique(pd.Series(refs, dtype = object).dropna()):
+		for c in str(r).split(';'):
+			cit = parse_citation(c)
+			if cit is not None:
+				cit['reference'] = r
+				out.append(cit)
+
+	cols = ['reference', 'key', 'author', 'authors', 'year', 'journal',
+		'citation']
+
+	return pd.DataFrame(out, columns = cols)
+
+def citation_keys(refs, sep = '; '):
+	'''
+	Citation keys of each reference, e.g. 'Crockford et al. (2019) Chem.
+	Geol.' -> 'Crockford-2019cg'
+
+	Parameters
+	----------
+	refs : array-like
+		Reference strings
+
+	sep : str
+		Separator of the keys of references citing several publications
+
+	Returns
+	-------
+	keys : np.array
+		Keys of each reference; None where no citation could be parsed
+	'''
+
+	refs = pd.Series(refs, dtype = object)
+	cits = parse_references(refs)
+	keys = cits.groupby('reference', sort = False)['key'].agg(sep.join)
+	keys = refs.map(keys)
+
+	return keys.astype(object).where(keys.notna(), None).to_numpy()
+
+def _add(field, value, name, rows):
+	'''
+	Appends row positions to one entry of an index field
+	'''
+
+	field.setdefault(value, {}).setdefault(name, []).append(rows)
+
+def build_citation_index(tables):
+	'''
+	Builds an inverted index from citations to table rows
+
+	Each table's rows are grouped by reference string once; the group of
+	every distinct reference is then filed under each of its citation keys,
+	authors, years and journals (and, for tables with a 'lab' column, under
+	its lab). Every lookup of a single value is then one dict access.
+	Keys are stored case-insensitively.
+
+	Parameters
+	----------
+	tables : dict
+		Loaded tables, keyed by name; tables without a 'reference' column
+		are skipped
+
+	Returns
+	-------
+	index : dict
+		Index: 'tables' (names indexed), 'n' (rows of each table),
+		'citations' (see `citation_table`), and for each of `FIELDS` a dict
+		from value to {table name: sorted, read-only row positions}
+	'''
+
+	index = {f: {} for f in FIELDS}
+	index['tables'] = []
+	index['n'] = {}
+	cits = []
+
+	for name, df in tables.items():
+
+		if 'reference' not in df.columns:
+			continue
+
+		index['tables'].append(name)
+		index['n'][name] = len(df)
+
+		#rows of each distinct reference, as contiguous runs of one sort
+		codes, uniq = pd.factorize(df['reference'])
+		o = np.argsort(codes, kind = 'stable')
+		bounds = np.searchsorted(codes[o], np.arange(len(uniq) + 1))
+		rows = {r: o[bounds[i]:bounds[i + 1]] for i, r in enumerate(uniq)}
+
+		c = parse_references(uniq)
+		c['table'] = name
+		c['n'] = [len(rows[r]) for r in c['reference']]
+		cits.append(c)
+
+		#each reference once per value, even if cited twice
+		for r, g in c.groupby('reference', sort = False):
+			rr = rows[r]
+			for k in set(g['key']):
+				_add(index['key'], k.lower(), name, rr)
+			for a in set(a for aa in g['authors'] for a in aa):
+				_add(index['author'], a.lower(), name, rr)
+			for y in set(g['year']):
+				_add(index['year'], int(y), name, rr)
+			for j in set(g['journal']):
+				_add(index['journal'], j, name, rr)
+
+		if 'lab' in df.columns:
+			codes, labs = pd.factorize(df['lab'])
+			for i, lab in enumerate(labs):
+				_add(index['lab'], str(ac.LAB_ALIASES.get(lab, lab)), name,
+					np.flatnonzero(codes == i))
+
+	#one sorted array per table and value; lookups hand these out without
+	# copying, so they are made read-only
+	for f in FIELDS:
+		for v, d in index[f].items():
+			for name, rr in d.items():
+				d[name] = np.sort(np.concatenate(rr))
+				d[name].flags.writeable = False
+
+	index['citations'] = citation_table(cits)
+
+	return index
+
+def citation_table(cits):
+	'''
+	One row per citation key, with its first author, year, journal, one
+	spelling of the citation, and its number of rows in each table
+	'''
+
+	if not cits:
+		return pd.DataFrame(columns = ['author', 'year', 'journal',
+			'citation'])
+
+	c = pd.concat(cits, ignore_index = True)
+
+	tab = c.groupby('key')[['author', 'year', 'journal', 'citation']].first()
+	n = c.pivot_table(index = 'key', columns = 'table', values = 'n',
+		aggfunc = 'sum', fill_value = 0)
+
+	return tab.join(n.add_prefix('n_')).sort_values(['author', 'year'])
+
+def load_citation_index(path = None, tables = None, names = CITED):
+	'''
+	Loads the tables and builds their citation index
+
+	Parameters
+	----------
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	tables : dict or None
+		Already-loaded tables, keyed by name; these are not re-read
+
+	names : iterable
+		Tables to index; defaults to `CITED`
+
+	Returns
+	-------
+	index : dict
+		Citation index (see `build_citation_index`)
+	'''
+
+	tables = ac.load_tables(names, path = path, tables = tables)
+
+	return build_citation_index({n: tables[n] for n in names})
+
+def _lab_codes(index, lab):
+	'''
+	Lab codes matching a code (or other spelling of one) or a lab name of
+	`analysis_code.LABS` (e.g. 'B' or 'Bao')
+	'''
+
+	lab = ac.LAB_ALIASES.get(lab, lab)
+
+	if lab in index['lab']:
+		return [lab]
+
+	return [c for c, n in ac.LABS.items()
+		if n.lower() == str(lab).lower() and c in index['lab']]
+
+def _union(rows, n):
+	'''
+	Sorted union of row positions of a table with n rows
+	'''
+
+	if len(rows) == 1:
+		return rows[0]
+
+	m = np.zeros(n, dtype = bool)
+	for r in rows:
+		m[r] = True
+
+	return np.flatnonzero(m)
+
+def _field_rows(index, field, crit):
+	'''
+	{table: row positions} of the values of one field selected by a
+	criterion: a value, a list of values, or for 'year' an inclusive
+	(first, last) range
+	'''
+
+	d = index[field]
+
+	if field == 'year' and isinstance(crit, tuple):
+		lo, hi = crit
+		vals = [y for y in d if lo <= y <= hi]
+
+	else:
+		crit = crit if isinstance(crit, (list, set, np.ndarray)) else [crit]
+
+		if field == 'lab':
+			vals = [c for v in crit for c in _lab_codes(index, v)]
+		elif field == 'year':
+			vals = [int(v) for v in crit]
+		elif field == 'journal':
+			vals = [str(v).lower() for v in crit]
+		elif field == 'author':
+			vals = [author_key(str(v)).lower() for v in crit]
+		else:
+			vals = [str(v).lower() for v in crit]
+
+	vals = [v for v in vals if v in d]
+
+	#a single value is stored as is
+	if len(vals) == 1:
+		return d[vals[0]]
+
+	out = {}
+	for name in index['tables']:
+		rr = [d[v][name] for v in vals if name in d[v]]
+		if rr:
+			out[name] = _union(rr, index['n'][name])
+
+	return out
+
+def lookup(index, tables = None, **criteria):
+	'''
+	Rows matching criteria on citation fields
+
+	Criteria are any of `FIELDS`: 'key' (e.g. 'Crockford-2019cg'; case
+	insensitive), 'author' (any named author, e.g. 'Bao'), 'year', 'journal'
+	(abbreviation, e.g. 'gca'), and 'lab' (a lab code or name of
+	`analysis_code.LABS`). Each is a value or a list of values; 'year' may
+	also be an inclusive (first, last) tuple. Different criteria are
+	combined with AND, so e.g. lookup(index, year = (2010, 2015), lab =
+	'Bao') finds all data of the Bao lab published 2010-2015. A single value
+	is one dict access.
+
+	Parameters
+	----------
+	index : dict
+		Citation index, as returned by `build_citation_index`
+
+	tables : iterable or None
+		Tables to search; defaults to every indexed table
+
+	**criteria :
+		Criteria, keyed by field
+
+	Returns
+	-------
+	rows : dict
+		Sorted row positions of the matching rows, keyed by table name;
+		tables without matches are left out. Arrays may be shared with the
+		index and are then read-only.
+	'''
+
+	bad = set(criteria) - set(FIELDS)
+	if bad:
+		raise KeyError('not a citation field: %s' % ', '.join(sorted(bad)))
+
+	names = index['tables'] if tables is None else \
+		[n for n in index['tables'] if n in set(tables)]
+
+	out = {n: None for n in names}
+
+	for field, crit in criteria.items():
+
+		hits = _field_rows(index, field, crit)
+
+		for n in list(out):
+			if n not in hits:
+				del out[n]
+			elif out[n] is None:
+				out[n] = hits[n]
+			else:
+				m = np.zeros(index['n'][n], dtype = bool)
+				m[hits[n]] = True
+				out[n] = out[n][m[out[n]]]
+
+	#no criteria: every row
+	return {n: np.arange(index['n'][n]) if r is None else r
+		for n, r in out.items() if r is None or len(r)}
+
+def select(tables, index, **criteria):
+	'''
+	Rows of each table matching criteria on citation fields (see `lookup`)
+
+	Parameters
+	----------
+	tables : dict
+		Loaded tables the index was built from, keyed by name
+
+	index : dict
+		Citation index, as returned by `build_citation_index`
+
+	**criteria :
+		Criteria, keyed by field
+
+	Returns
+	-------
+	sel : dict
+		Matching rows of each table with any, keyed by table name
+	'''
+
+	rows = lookup(index, tables = list(tables), **criteria)
+
+	return {n: tables[n].iloc[r] for n, r in rows.items()}
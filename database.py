@@ -0,0 +1,511 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: SQL BACKEND
+
+#import packages
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+from ingest import SCHEMAS
+from table_cache import file_hash
+
+#bump to force every existing database to be rebuilt
+DB_VERSION = 2
+
+#database file names within the data directory, by backend
+DB_FILES = {
+	'sqlite': '.tables.sqlite',
+	'duckdb': '.tables.duckdb',
+}
+
+#source tables loaded into the database
+SOURCES = ['exp', 'atmos', 'so4', 'standards']
+
+#indexed columns of each table; tuples are multi-column indexes
+INDEXES = {
+	'exp': ['experiment_type', 'exp_nr', 'reference', 'year'],
+	'atmos': ['species', 'reference', 'year'],
+	'so4': ['lab', 'lithology', 'reference', 'age_Ma', 'year',
+		('lab', 'year')],
+	'standards': ['lab', 'standard'],
+	'slopes': ['exp_nr', 'ets'],
+}
+
+#rows read from each csv and inserted at a time
+CHUNK = 200000
+
+#publication year in a reference, e.g. 'Bao et al. (2000a) Nature'
+_YEAR = r'\((\d{4})[a-z]?\)'
+
+_PY_TYPES = {'str': str, 'int': np.int64, 'float': float}
+
+#define functions
+def db_file(path = None, backend = 'sqlite'):
+	'''
+	Database file of a data directory
+	'''
+
+	path = ac.path if path is None else path
+
+	return os.path.join(path, DB_FILES[backend])
+
+def _connect(fname, backend):
+	'''
+	Opens a database file with the given backend
+	'''
+
+	if backend == 'sqlite':
+		return sqlite3.connect(fname)
+
+	if backend == 'duckdb':
+		import duckdb
+		return duckdb.connect(fname)
+
+	raise ValueError('unknown backend %r' % backend)
+
+def _sources(path):
+	'''
+	Size, modification time, and hash of each source csv
+	'''
+
+	out = {}
+
+	for name in SOURCES:
+		fname = os.path.join(path, ac.TABLES[name])
+		st = os.stat(fname)
+		out[name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+	return out
+
+def _read_meta(con):
+	'''
+	Build metadata stored in a database, or None
+	'''
+
+	try:
+		row = con.execute('SELECT value FROM _meta WHERE key = ?',
+			['build']).fetchone()
+
+	except Exception:
+		return None
+
+	return None if row is None else json.loads(row[0])
+
+def _add_year(df):
+	'''
+	Adds the publication year parsed from the 'reference' column
+	'''
+
+	if 'reference' in df.columns:
+		df['year'] = pd.to_numeric(df['reference'].astype(str).str.extract(
+			_YEAR, expand = False), errors = 'coerce')
+
+	return df
+
+def _insert(con, backend, name, df):
+	'''
+	Appends rows to a table, creating it from the first chunk
+	'''
+
+	if backend == 'sqlite':
+		df.to_sql(name, con, if_exists = 'append', index = False)
+
+	else:
+		con.register('_chunk', df)
+		try:
+			con.execute('INSERT INTO "%s" SELECT * FROM _chunk' % name)
+		except Exception:
+			con.execute('CREATE TABLE "%s" AS SELECT * FROM _chunk' % name)
+		con.unregister('_chunk')
+
+def _read_chunks(name, path, chunk):
+	'''
+	Reads a source csv `chunk` rows at a time, with the column types of
+	`ingest.SCHEMAS`
+	'''
+
+	fname = os.path.join(path, ac.TABLES[name])
+	dtype = {c: _PY_TYPES[k] for c, k in SCHEMAS[name].items()}
+
+	if name == 'standards':
+		yield ac.read_table(name, path = path).reset_index()
+		return
+
+	for df in pd.read_csv(fname, encoding = ac.ENCODINGS[name], dtype = dtype,
+		chunksize = chunk):
+		yield ac.fix_labs(df)
+
+def _fit_slopes(rows):
+	'''
+	Unscreened slopes of the experiments in `rows`, with a 'screened' flag
+	for those that `analysis_code.exp_slopes` keeps
+	'''
+
+	x = ac.exp_slopes(rows, screen = False)
+	x['screened'] = (x['n'] >= 3) & (x['r2'] >= 0.8)
+	x['lam'] = x['lam'].astype(object)
+
+	return x.reset_index()
+
+def build_database(path = None, db = None, backend = 'sqlite',
+	chunk = CHUNK):
+	'''
+	Loads the compilations and their derived columns into a database
+
+	Tables 'exp', 'atmos', 'so4', and 'standards' hold the source rows with
+	the derived columns of `analysis_code.derive_table`, a 'year' parsed
+	from the reference, and, for 'so4', the lab corrections of
+	`analysis_code.correct_so4` ('m', 'b', and 'Dp17O_5305_corr_mean').
+	'slopes' holds the unscreened per-experiment slopes of
+	`analysis_code.exp_slopes` with a 'screened' flag, and 'cal' the lab
+	calibrations. Csvs are read and inserted `chunk` rows at a time, so
+	memory use does not depend on their size, and the indexes of `INDEXES`
+	are made once all rows are in. The database is written to a temporary
+	file that replaces `db` only when complete.
+
+	Parameters
+	----------
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	db : str or None
+		Database file; defaults to `db_file(path, backend)`
+
+	backend : str
+		'sqlite' (default) or 'duckdb' (needs the duckdb package)
+
+	chunk : int
+		Rows per chunk; defaults to `CHUNK`
+
+	Returns
+	-------
+	db : str
+		Database file
+	'''
+
+	path = ac.path if path is None else path
+	db = db_file(path, backend) if db is None else db
+	tmp = db + '.tmp'
+
+	if os.path.exists(tmp):
+		os.remove(tmp)
+
+	#hash first so that an edit during the build is caught on the next open
+	meta = _sources(path)
+	for name in SOURCES:
+		meta[name]['sha1'] = file_hash(os.path.join(path, ac.TABLES[name]))
+
+	cal = ac.calibrate_labs(ac.read_table('standards', path = path))
+
+	con = _connect(tmp, backend)
+
+	try:
+		if backend == 'sqlite':
+			con.execute('PRAGMA journal_mode = OFF')
+			con.execute('PRAGMA synchronous = OFF')
+
+		for name in SOURCES:
+
+			#rows of the last experiment of a chunk may continue in the next
+			carry = None
+			seen = set()
+			redo = set()
+
+			for df in _read_chunks(name, path, chunk):
+
+				df = ac.derive_table(name, df)
+
+				if name == 'so4':
+					df = ac.correct_so4(df, cal)
+
+				_insert(con, backend, name, _add_year(df))
+
+				if name != 'exp':
+					continue
+
+				if carry is not None:
+					df = pd.concat([carry, df], ignore_index = True)
+
+				last = df['exp_nr'].iloc[-1]
+				carry = df[df['exp_nr'] == last]
+				done = df[df['exp_nr'] != last]
+
+				if len(done):
+					fits = _fit_slopes(done)
+					redo.update(seen.intersection(fits['exp_nr']))
+					seen.update(fits['exp_nr'])
+					_insert(con, backend, 'slopes', fits)
+
+			if carry is not None:
+				fits = _fit_slopes(carry)
+				redo.update(seen.intersection(fits['exp_nr']))
+				_insert(con, backend, 'slopes', fits)
+
+			#experiments split across the csv are refit from all their rows
+			if redo:
+				q = ', '.join('?'*len(redo))
+				con.execute('DELETE FROM slopes WHERE exp_nr IN (%s)' % q,
+					sorted(int(r) for r in redo))
+				rows = _fetch(con, backend, 'SELECT * FROM exp WHERE exp_nr '
+					'IN (%s)' % q, sorted(int(r) for r in redo))
+				_insert(con, backend, 'slopes', _fit_slopes(rows))
+
+		c = cal.reset_index()
+		c.columns = ['lab'] + list(c.columns[1:])
+		_insert(con, backend, 'cal', c)
+
+		for name, cols in INDEXES.items():
+			for col in cols:
+				col = (col,) if isinstance(col, str) else col
+				con.execute('CREATE INDEX "ix_%s_%s" ON "%s" (%s)' % (name,
+					'_'.join(col), name, ', '.join('"%s"' % c for c in col)))
+
+		con.execute('CREATE TABLE _meta (key TEXT, value TEXT)')
+		con.execute('INSERT INTO _meta VALUES (?, ?)', ['build', json.dumps(
+			{'version': DB_VERSION, 'sources': meta})])
+
+		if backend == 'sqlite':
+			con.execute('ANALYZE')
+
+		con.commit()
+
+	except BaseException:
+		con.close()
+		os.remove(tmp)
+		raise
+
+	con.close()
+	os.replace(tmp, db)
+
+	return db
+
+def is_fresh(path = None, db = None, backend = 'sqlite'):
+	'''
+	Checks whether a database matches the source csvs
+
+	As in `table_cache.is_fresh`, sources whose size and modification time
+	are unchanged are not re-hashed.
+	'''
+
+	path = ac.path if path is None else path
+	db = db_file(path, backend) if db is None else db
+
+	if not os.path.exists(db):
+		return False
+
+	con = _connect(db, backend)
+
+	try:
+		info = _read_meta(con)
+	finally:
+		con.close()
+
+	if info is None or info.get('version') != DB_VERSION:
+		return False
+
+	now = _sources(path)
+
+	for name in SOURCES:
+
+		old = info['sources'].get(name)
+
+		if old is None or old['size'] != now[name]['size']:
+			return False
+
+		if old['mtime_ns'] != now[name]['mtime_ns'] and old['sha1'] != \
+			file_hash(os.path.join(path, ac.TABLES[name])):
+			return False
+
+	return True
+
+def connect(path = None, db = None, backend = 'sqlite', rebuild = None):
+	'''
+	Opens the database of a data directory, building it first if needed
+
+	Parameters
+	----------
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	db : str or None
+		Database file; defaults to `db_file(path, backend)`
+
+	backend : str
+		'sqlite' (default) or 'duckdb'
+
+	rebuild : bool or None
+		If True, always rebuilds; if False, never does; if None (default),
+		rebuilds when the source csvs changed (see `is_fresh`)
+
+	Returns
+	-------
+	con : sqlite3.Connection or duckdb.DuckDBPyConnection
+		Open connection
+	'''
+
+	path = ac.path if path is None else path
+	db = db_file(path, backend) if db is None else db
+
+	if rebuild or (rebuild is None and not is_fresh(path, db, backend)):
+		build_database(path, db, backend)
+
+	return _connect(db, backend)
+
+def _fetch(con, backend, sql, params = (), arrow = False):
+	'''
+	Runs a query on an open connection
+	'''
+
+	if backend == 'duckdb':
+		res = con.execute(sql, list(params))
+		return res.arrow() if arrow else res.df()
+
+	df = pd.read_sql_query(sql, con, params = list(params))
+
+	if arrow:
+		import pyarrow as pa
+		return pa.Table.from_pandas(df, preserve_index = False)
+
+	return df
+
+def query(sql, params = (), con = None, arrow = False, **kw):
+	'''
+	Runs a SQL query against the database
+
+	Parameters
+	----------
+	sql : str
+		Query, with '?' placeholders for `params`, e.g. "SELECT * FROM so4
+		WHERE lab = ? AND year > ? AND Dp17O_5305_mean < ?"
+
+	params : sequence
+		Query parameters
+
+	con : connection or None
+		Open connection, as returned by `connect`; opened (and closed) for
+		this query if None
+
+	arrow : bool
+		If True, returns a pyarrow Table instead of a DataFrame
+
+	**kw :
+		Passed to `connect` when `con` is None
+
+	Returns
+	-------
+	res : pd.DataFrame or pyarrow.Table
+		Query result
+	'''
+
+	if con is not None:
+		backend = 'sqlite' if isinstance(con, sqlite3.Connection) \
+			else 'duckdb'
+		return _fetch(con, backend, sql, params, arrow)
+
+	con = connect(**kw)
+
+	try:
+		return _fetch(con, kw.get('backend', 'sqlite'), sql, params, arrow)
+	finally:
+		con.close()
+
+def where(**filters):
+	'''
+	Builds a parameterized WHERE clause
+
+	Each filter is a value (equality), a list of values (IN), or a
+	(low, high) tuple (inclusive range; None for no bound).
+
+	Returns
+	-------
+	clause : str
+		Clause, without the WHERE keyword ('1 = 1' for no filters)
+
+	params : list
+		Query parameters
+	'''
+
+	terms, params = [], []
+
+	for col, v in filters.items():
+
+		c = '"%s"' % col
+
+		if isinstance(v, tuple):
+			lo, hi = v
+			if lo is not None:
+				terms.append('%s >= ?' % c)
+				params.append(lo)
+			if hi is not None:
+				terms.append('%s <= ?' % c)
+				params.append(hi)
+
+		elif isinstance(v, (list, set, np.ndarray, pd.Index)):
+			v = list(v)
+			terms.append('%s IN (%s)' % (c, ', '.join('?'*len(v))))
+			params += v
+
+		elif v is None:
+			terms.append('%s IS NULL' % c)
+
+		else:
+			terms.append('%s = ?' % c)
+			params.append(v)
+
+	return ' AND '.join(terms) or '1 = 1', params
+
+def select(table, columns = None, con = None, arrow = False, limit = None,
+	path = None, backend = 'sqlite', **filters):
+	'''
+	Rows of a table matching filters on its columns
+
+	e.g. SO4 rows of Bao-lab papers after 2005 with Dp17O < -0.5:
+	select('so4', lab = 'B', year = (2006, None),
+	Dp17O_5305_mean = (None, -0.5)). Ranges are inclusive.
+
+	Parameters
+	----------
+	table : str
+		'exp', 'atmos', 'so4', 'standards', 'slopes', or 'cal'
+
+	columns : list or None
+		Columns to return; defaults to all
+
+	con : connection or None
+		Open connection; opened for this query if None
+
+	arrow : bool
+		If True, returns a pyarrow Table
+
+	limit : int or None
+		Maximum number of rows
+
+	path : str or None
+		Data directory whose database is opened when `con` is None;
+		defaults to `analysis_code.path`
+
+	backend : str
+		'sqlite' (default) or 'duckdb', when `con` is None
+
+	**filters :
+		Filters, keyed by column (see `where`)
+
+	Returns
+	-------
+	res : pd.DataFrame or pyarrow.Table
+		Matching rows
+	'''
+
+	cols = '*' if columns is None else ', '.join('"%s"' % c for c in columns)
+	clause, params = where(**filters)
+
+	sql = 'SELECT %s FROM "%s" WHERE %s' % (cols, table, clause)
+
+	if limit is not None:
+		sql += ' LIMIT %d' % limit
+
+	return query(sql, params, con = con, arrow = arrow, path = path,
+		backend = backend)
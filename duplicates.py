@@ -0,0 +1,380 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: DUPLICATE DETECTION
+
+#import packages
+import argparse
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+
+#tables with sample locations and Dp17O, and their Dp17O column
+DP17O_COLS = {
+	'atmos': 'Dp17O_5305',
+	'so4': 'Dp17O_5305_mean',
+}
+
+#default tolerances: d18O and Dp17O (permil), and coordinate rounding
+D18O_TOL = 0.05
+DP17O_TOL = 0.005
+COORD_DIGITS = 2
+
+#differences below this count as equal (derived Dp17O carries rounding error)
+EXACT_TOL = 1e-6
+
+#define functions
+def ref_key(refs):
+	'''
+	Normalized reference keys: first author surname and year, e.g.
+	'Bao et al. (2000b) Nature' -> 'bao2000b' and 'Hill-Falkenthal et al.
+	(2013) J. Geophys. Res.' -> 'hillfalkenthal2013'
+
+	References without a year keep all their letters and digits, lowercase.
+
+	Parameters
+	----------
+	refs : array-like
+		Reference strings
+
+	Returns
+	-------
+	keys : np.array
+		Normalized keys
+	'''
+
+	refs = pd.Series(refs, dtype = object).fillna('').astype(str)
+	uniq = refs.unique()
+
+	keys = {}
+
+	for r in uniq:
+		m = re.match(r'\s*([^\s(]+).*?\((\d{4}[a-z]?)\)', r)
+		if m:
+			keys[r] = re.sub(r'[^a-z]', '', m.group(1).lower()) + m.group(2)
+		else:
+			keys[r] = re.sub(r'[^a-z0-9]', '', r.lower())
+
+	return refs.map(keys).to_numpy(dtype = object)
+
+def records(tables):
+	'''
+	Rows of every table in `DP17O_COLS`, in a common layout
+
+	Parameters
+	----------
+	tables : dict
+		Loaded tables (see `analysis_code.load_table`), keyed by name
+
+	Returns
+	-------
+	rec : pd.DataFrame
+		Columns 'table', 'row' (index in its table), 'ref' (see `ref_key`),
+		'reference', 'sample_ID', 'lat', 'lon', 'd18O', and 'Dp17O'
+	'''
+
+	out = []
+
+	for name, col in DP17O_COLS.items():
+
+		if name not in tables:
+			continue
+
+		df = tables[name]
+
+		out.append(pd.DataFrame({
+			'table': name,
+			'row': df.index.to_numpy(),
+			'ref': ref_key(df['reference']),
+			'reference': df['reference'].to_numpy(dtype = object),
+			'sample_ID': df['sample_ID'].to_numpy(dtype = object),
+			'lat': df['lat_N_dd'].to_numpy(dtype = float),
+			'lon': df['long_E_dd'].to_numpy(dtype = float),
+			'd18O': df['d18O_mean'].to_numpy(dtype = float),
+			'Dp17O': df[col].to_numpy(dtype = float),
+			}))
+
+	return pd.concat(out, ignore_index = True)
+
+def _block_keys(rec, d18O_tol, Dp17O_tol, coord_digits):
+	'''
+	Block codes of each record: normalized reference, rounded lat/long, and
+	whether it is compared on Dp17O (d18O missing); plus its compared value
+	in units of its tolerance
+	'''
+
+	ref = pd.factorize(rec['ref'])[0]
+
+	#rounded coordinates, with missing ones in a block of their own
+	s = 10**coord_digits
+	lat = np.round(rec['lat'].to_numpy()*s)
+	lon = np.round(rec['lon'].to_numpy()*s)
+	lat = np.where(np.isnan(lat), -10**9, lat).astype(np.int64)
+	lon = np.where(np.isnan(lon), -10**9, lon).astype(np.int64)
+
+	d18O = rec['d18O'].to_numpy()
+	alt = np.isnan(d18O)
+	v = np.where(alt, rec['Dp17O'].to_numpy()/Dp17O_tol, d18O/d18O_tol)
+
+	return ref, lat, lon, alt.astype(np.int64), v
+
+def _hash(*cols):
+	'''
+	64-bit hash of integer key columns
+	'''
+
+	return pd.util.hash_pandas_object(pd.DataFrame(
+		{i: c for i, c in enumerate(cols)}), index = False).to_numpy()
+
+def _same(x, i, j):
+	'''
+	Elementwise equality of x[i] and x[j], counting two missing values as
+	equal
+	'''
+
+	a, b = x[i], x[j]
+
+	return (np.abs(a - b) <= EXACT_TOL) | (np.isnan(a) & np.isnan(b))
+
+def find_duplicates(tables = None, path = None, d18O_tol = D18O_TOL,
+	Dp17O_tol = DP17O_TOL, coord_digits = COORD_DIGITS, within = True):
+	'''
+	Finds rows that duplicate each other, within and across tables
+
+	Rows are blocked by normalized reference (see `ref_key`), lat/long
+	rounded to `coord_digits` decimals, and whether they are compared on
+	d18O or, where d18O is missing, on Dp17O. Each block key is hashed to
+	64 bits and rows are sorted by it and then by that value, so each
+	row is only ever compared with the rows that follow it in its block
+	within the tolerance; memory stays linear in the rows. Candidates are
+	then checked against both tolerances. Rows without Dp17O are not
+	compared.
+
+	Parameters
+	----------
+	tables : dict or None
+		Loaded tables, keyed by name; tables of `DP17O_COLS` that are
+		missing are loaded from `path`
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	d18O_tol, Dp17O_tol : float
+		Largest d18O and Dp17O differences of near duplicates (permil)
+
+	coord_digits : int
+		Decimals lat/long must agree to
+
+	within : bool
+		If True, also finds duplicates within each table
+
+	Returns
+	-------
+	dups : pd.DataFrame
+		One row per duplicate pair, with 'table_a', 'row_a', 'table_b',
+		'row_b' (indices in their tables), 'ref', 'sample_ID_a',
+		'sample_ID_b', 'd_d18O' and 'd_Dp17O' (absolute differences),
+		'same_id' (whether the sample IDs match), and 'kind': 'exact' if
+		every compared value agrees to within `EXACT_TOL`, else 'near'
+	'''
+
+	tables = ac.load_tables(DP17O_COLS, path = path, tables = tables)
+	rec = records(tables)
+
+	return _pairs(rec, d18O_tol, Dp17O_tol, coord_digits, within)
+
+def _pairs(rec, d18O_tol, Dp17O_tol, coord_digits, within):
+	'''
+	Duplicate pairs among records (see `find_duplicates`)
+	'''
+
+	rec = rec[np.isfinite(rec['Dp17O'].to_numpy())]
+
+	ref, lat, lon, alt, v = _block_keys(rec, d18O_tol, Dp17O_tol,
+		coord_digits)
+	tab = pd.factorize(rec['table'])[0]
+
+	#sort by block, then by value within each block; the sweep below then
+	# only reads neighboring entries of the sorted arrays
+	key = _hash(ref, lat, lon, alt)
+	o = np.lexsort((v, key))
+	key, vs = key[o], v[o]
+	ref, lat, lon, alt, tab = ref[o], lat[o], lon[o], alt[o], tab[o]
+	d18 = rec['d18O'].to_numpy()[o]
+	D = rec['Dp17O'].to_numpy()[o]
+
+	#sweep: compare each row with its k-th next one for k = 1, 2, ...;
+	# once a row's k-th next is in another block or beyond the tolerance,
+	# so are all further ones and the row drops out
+	pp, qq = [np.zeros(0, dtype = np.int64)], [np.zeros(0, dtype = np.int64)]
+	act = np.arange(len(o))
+	k = 1
+
+	while len(act):
+
+		act = act[act + k < len(o)]
+		act = act[(key[act] == key[act + k]) &
+			(vs[act + k] - vs[act] <= 1 + 1e-9)]
+		p, q = act, act + k
+
+		#guard against hash collisions, then apply both tolerances
+		ok = (ref[p] == ref[q]) & (lat[p] == lat[q]) & \
+			(lon[p] == lon[q]) & (alt[p] == alt[q]) & \
+			(np.abs(D[p] - D[q]) <= Dp17O_tol + 1e-12) & \
+			((alt[p] == 1) | (np.abs(d18[p] - d18[q]) <= d18O_tol + 1e-12))
+		if not within:
+			ok &= tab[p] != tab[q]
+
+		pp.append(p[ok])
+		qq.append(q[ok])
+		k += 1
+
+	p, q = np.concatenate(pp), np.concatenate(qq)
+	dd18 = np.abs(d18[p] - d18[q])
+	dD = np.abs(D[p] - D[q])
+
+	#back to record positions, each pair once and in record order
+	i, j = np.minimum(o[p], o[q]), np.maximum(o[p], o[q])
+	s = np.argsort(i.astype(np.int64)*len(o) + j, kind = 'stable')
+	i, j, dd18, dD = i[s], j[s], dd18[s], dD[s]
+	d18 = rec['d18O'].to_numpy()
+
+	col = lambda c: rec[c].to_numpy()
+	sid = col('sample_ID')
+
+	exact = (np.nan_to_num(dd18) <= EXACT_TOL) & (dD <= EXACT_TOL) & \
+		_same(col('lat'), i, j) & _same(col('lon'), i, j) & \
+		_same(d18, i, j)
+
+	dups = pd.DataFrame({
+		'table_a': col('table')[i],
+		'row_a': col('row')[i],
+		'table_b': col('table')[j],
+		'row_b': col('row')[j],
+		'ref': col('ref')[i],
+		'sample_ID_a': sid[i],
+		'sample_ID_b': sid[j],
+		'd_d18O': dd18,
+		'd_Dp17O': dD,
+		'same_id': sid[i] == sid[j],
+		'kind': np.where(exact, 'exact', 'near'),
+		})
+
+	return dups
+
+def overlap_report(dups, tables = None, path = None):
+	'''
+	Duplicate overlap of each reference across tables
+
+	Parameters
+	----------
+	dups : pd.DataFrame
+		Duplicate pairs, as returned by `find_duplicates`
+
+	tables : dict or None
+		Loaded tables, keyed by name; those missing are loaded from `path`
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	Returns
+	-------
+	report : pd.DataFrame
+		Table indexed by normalized reference with, for each table, its
+		rows ('n_<table>'), rows duplicated in another table
+		('cross_<table>') and their fraction ('frac_<table>'), and rows
+		duplicated within it ('within_<table>'); plus the number of exact
+		and near pairs and one spelling of the reference. References with
+		no duplicates are kept; sorted by cross-table pairs.
+	'''
+
+	tables = ac.load_tables(DP17O_COLS, path = path, tables = tables)
+	rec = records(tables)
+
+	report = pd.DataFrame(index = pd.Index(pd.unique(rec['ref']),
+		name = 'ref'))
+	report['reference'] = rec.groupby('ref', sort = False)['reference'] \
+		.first()
+
+	cross = dups['table_a'].to_numpy() != dups['table_b'].to_numpy()
+
+	for name in DP17O_COLS:
+
+		r = rec[rec['table'] == name]
+		report['n_' + name] = r.groupby('ref').size()
+
+		#distinct rows of this table in cross- and within-table pairs
+		for label, sel in (('cross_', cross), ('within_', ~cross)):
+			d = dups[sel]
+			rows = pd.concat([
+				d.loc[d['table_a'] == name, ['ref', 'row_a']].set_axis(
+					['ref', 'row'], axis = 1),
+				d.loc[d['table_b'] == name, ['ref', 'row_b']].set_axis(
+					['ref', 'row'], axis = 1),
+				]).drop_duplicates()
+			report[label + name] = rows.groupby('ref').size()
+
+	report = report.fillna({c: 0 for c in report.columns if c != 'reference'})
+
+	for name in DP17O_COLS:
+		for c in ('n_', 'cross_', 'within_'):
+			report[c + name] = report[c + name].astype(int)
+		report['frac_' + name] = report['cross_' + name] / \
+			report['n_' + name].where(report['n_' + name] > 0)
+
+	kind = dups[cross].groupby(['ref', 'kind']).size().unstack('kind')
+	for k in ('exact', 'near'):
+		report[k] = kind[k] if k in kind else 0
+		report[k] = report[k].fillna(0).astype(int)
+
+	return report.sort_values(['exact', 'near'], ascending = False)
+
+def main(argv = None):
+	'''
+	Command-line entry point
+	'''
+
+	p = argparse.ArgumentParser(description = 'Find duplicate rows within '
+		'and across the atmospheric and sulfate compilations.')
+	p.add_argument('--path', default = None,
+		help = 'data directory of the compilations')
+	p.add_argument('--d18O-tol', type = float, default = D18O_TOL)
+	p.add_argument('--Dp17O-tol', type = float, default = DP17O_TOL)
+	p.add_argument('--coord-digits', type = int, default = COORD_DIGITS)
+	p.add_argument('--cross-only', action = 'store_true',
+		help = 'skip duplicates within a table')
+	p.add_argument('--pairs', default = None,
+		help = 'csv to write the duplicate pairs to')
+	p.add_argument('--report', default = None,
+		help = 'csv to write the per-reference overlap report to')
+
+	args = p.parse_args(argv)
+
+	tables = ac.load_tables(DP17O_COLS, path = args.path)
+	dups = find_duplicates(tables, d18O_tol = args.d18O_tol,
+		Dp17O_tol = args.Dp17O_tol, coord_digits = args.coord_digits,
+		within = not args.cross_only)
+	report = overlap_report(dups, tables)
+
+	if args.pairs:
+		dups.to_csv(args.pairs, index = False)
+
+	if args.report:
+		report.to_csv(args.report)
+
+	cross = dups['table_a'] != dups['table_b']
+	print('%d duplicate pairs: %d across tables (%d exact), %d within' % (
+		len(dups), cross.sum(), (cross & (dups['kind'] == 'exact')).sum(),
+		(~cross).sum()))
+
+	shown = report[(report['exact'] + report['near']) > 0]
+	cols = ['n_' + n for n in DP17O_COLS] + ['cross_' + n
+		for n in DP17O_COLS] + ['exact', 'near']
+	if len(shown):
+		print(shown[cols].to_string())
+
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
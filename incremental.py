@@ -0,0 +1,385 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: INCREMENTAL DERIVED-DATA UPDATES
+
+#import packages
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+
+#derived tables kept in the store
+DERIVED = ['exp', 'atmos', 'so4', 'slopes', 'cal']
+
+#source tables tracked by the store
+SOURCES = ['exp', 'atmos', 'so4', 'standards']
+
+#bump to force every existing store to be rebuilt
+STORE_VERSION = 1
+
+#define functions
+def store_paths(path = None, store_dir = None):
+	'''
+	Gets the data directory and derived-table store directory
+
+	Parameters
+	----------
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	store_dir : str or None
+		Store directory; defaults to '.derived' within the data directory
+
+	Returns
+	-------
+	path : str
+		Data directory
+
+	store_dir : str
+		Store directory
+	'''
+
+	if path is None:
+		path = ac.path
+
+	if store_dir is None:
+		store_dir = os.path.join(path, '.derived')
+
+	return path, store_dir
+
+def _prefix_hash(fname, nbytes):
+	'''
+	sha1 hash of the first `nbytes` bytes of a file
+	'''
+
+	h = hashlib.sha1()
+
+	with open(fname, 'rb') as f:
+		while nbytes > 0:
+			block = f.read(min(nbytes, 2**20))
+			if not block:
+				break
+			h.update(block)
+			nbytes -= len(block)
+
+	return h.hexdigest()
+
+def _byte_at(fname, offset):
+	'''
+	Single byte of a file at `offset`
+	'''
+
+	with open(fname, 'rb') as f:
+		f.seek(offset)
+		return f.read(1)
+
+def _source_state(fname):
+	'''
+	Size, hash, and trailing-newline flag of a source csv
+	'''
+
+	with open(fname, 'rb') as f:
+		f.seek(0, os.SEEK_END)
+		size = f.tell()
+		f.seek(max(size - 1, 0))
+		nl = f.read(1) == b'\n'
+
+	return {'size': size, 'sha1': _prefix_hash(fname, size), 'newline': nl}
+
+def _read_tail(name, fname, offset, like):
+	'''
+	Parses only the rows appended to a csv after byte `offset`, reading text
+	columns of the existing table `like` as text
+	'''
+
+	with open(fname, 'rb') as f:
+		header = f.readline()
+		f.seek(offset)
+		tail = f.read()
+
+	kw = {'index_col': 0} if name == 'standards' else {}
+
+	#e.g., an all-numeric wavelength column in the tail stays text
+	text = [c for c in like.columns
+		if pd.api.types.is_string_dtype(like[c]) or like[c].dtype == object]
+
+	return ac.fix_labs(pd.read_csv(io.BytesIO(header + tail),
+		encoding = ac.ENCODINGS[name], dtype = dict.fromkeys(text, str), **kw))
+
+def _read_state(store_dir):
+	'''
+	Reads the store state, or None if there is no store yet
+	'''
+
+	try:
+		with open(os.path.join(store_dir, 'state.json')) as f:
+			return json.load(f)
+
+	except (OSError, ValueError):
+		return None
+
+def _write(store_dir, tables, state):
+	'''
+	Persists derived tables and the store state
+	'''
+
+	os.makedirs(store_dir, exist_ok = True)
+
+	for k, df in tables.items():
+		df.reset_index().to_feather(os.path.join(store_dir, k + '.feather'))
+
+	with open(os.path.join(store_dir, 'state.json'), 'w') as f:
+		json.dump(state, f, indent = 1)
+
+def load_derived(name, path = None, store_dir = None):
+	'''
+	Reads a persisted derived table
+
+	Parameters
+	----------
+	name : str
+		Derived table name: 'exp', 'atmos', 'so4' (corrected), 'slopes'
+		(unscreened per-experiment slopes), or 'cal' (lab calibrations)
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	store_dir : str or None
+		Store directory; defaults to '.derived' within the data directory
+
+	Returns
+	-------
+	df : pd.DataFrame
+		Derived table
+	'''
+
+	path, store_dir = store_paths(path, store_dir)
+	df = pd.read_feather(os.path.join(store_dir, name + '.feather'))
+	df = df.set_index(df.columns[0])
+
+	#unnamed indices were stored as 'index'
+	if df.index.name == 'index':
+		df.index.name = None
+
+	return df
+
+def _full(name, path):
+	'''
+	Fully rebuilds a derived table from its source
+	'''
+
+	return ac.load_table(name, path = path, cache = False)
+
+def _calibrate(stds):
+	'''
+	Lab calibrations with a plain string index
+	'''
+
+	cal = ac.calibrate_labs(stds)
+	cal.index = cal.index.astype(str)
+
+	return cal
+
+def _changed_labs(old, new):
+	'''
+	Labs whose calibration slope or intercept differs between two cal_dfs
+	'''
+
+	labs = old.index.union(new.index)
+	o = old.reindex(labs)[['m', 'b']].to_numpy(dtype = float)
+	n = new.reindex(labs)[['m', 'b']].to_numpy(dtype = float)
+
+	same = (o == n) | (np.isnan(o) & np.isnan(n))
+
+	return set(labs[~same.all(axis = 1)])
+
+def update(path = None, store_dir = None, force = False):
+	'''
+	Brings the persisted derived tables up to date with the source csvs
+
+	For each source table, if the csv only grew by appended rows (its old
+	contents are an unchanged prefix, ending at a line break), only the new
+	rows are parsed and converted; otherwise it is rebuilt. Slopes are then
+	refit only for experiments touched by new rows, and sulfate values are
+	corrected only for new rows and for labs whose calibration changed.
+	Standards changes re-solve the calibration and recorrect only the labs
+	it affects.
+
+	Parameters
+	----------
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	store_dir : str or None
+		Store directory; defaults to '.derived' within the data directory
+
+	force : bool
+		If True, rebuilds everything
+
+	Returns
+	-------
+	report : dict
+		What was recomputed: for each source, 'unchanged', 'appended' (with
+		row count), or 'rebuilt'; plus the refit 'exp_nr' values and the
+		recorrected 'labs'
+	'''
+
+	path, store_dir = store_paths(path, store_dir)
+	state = None if force else _read_state(store_dir)
+
+	if state is not None and state.get('version') != STORE_VERSION:
+		state = None
+
+	if state is not None:
+		tables = {k: load_derived(k, path, store_dir) for k in DERIVED}
+	else:
+		state, tables = {}, {}
+
+	report = {'exp_nr': [], 'labs': []}
+	new_rows = {}
+	new_state = {'version': STORE_VERSION}
+
+	#find what changed in each source
+	for name in SOURCES:
+
+		fname = os.path.join(path, ac.TABLES[name])
+		st = _source_state(fname)
+		old = state.get(name)
+		new_state[name] = st
+
+		if old is not None and old['sha1'] == st['sha1']:
+			report[name] = 'unchanged'
+
+		elif old is not None and name != 'standards' \
+			and st['size'] > old['size'] \
+			and (old['newline'] or _byte_at(fname, old['size']) in b'\r\n') \
+			and _prefix_hash(fname, old['size']) == old['sha1']:
+
+			tail = _read_tail(name, fname, old['size'], tables[name])
+			tail.index = np.arange(len(tail)) + len(tables[name])
+			new_rows[name] = tail
+			report[name] = ('appended', len(tail))
+
+		else:
+			report[name] = 'rebuilt'
+
+	#standards: re-solve, then find labs whose calibration changed
+	if report['standards'] == 'unchanged':
+		cal = tables['cal']
+		labs = set()
+
+	else:
+		cal = _calibrate(ac.read_table('standards', path = path))
+		labs = _changed_labs(tables['cal'], cal) if 'cal' in tables \
+			else set(cal.index)
+
+	tables['cal'] = cal
+
+	#experiments: convert new rows and refit touched experiments
+	if report['exp'] == 'rebuilt':
+		tables['exp'] = _full('exp', path)
+		tables['slopes'] = ac.exp_slopes(tables['exp'], screen = False)
+		report['exp_nr'] = tables['slopes'].index.tolist()
+
+	elif 'exp' in new_rows:
+		tail = ac.derive_table('exp', new_rows['exp'])
+		tables['exp'] = pd.concat([tables['exp'], tail])
+
+		touched = pd.unique(tail['exp_nr'])
+		exp = tables['exp']
+		fits = ac.exp_slopes(exp[exp['exp_nr'].isin(touched)], screen = False)
+
+		slopes = tables['slopes'].drop(index = touched, errors = 'ignore')
+		tables['slopes'] = pd.concat([slopes, fits]).sort_index()
+		report['exp_nr'] = touched.tolist()
+
+	#atmospheric: conversions only
+	if report['atmos'] == 'rebuilt':
+		tables['atmos'] = _full('atmos', path)
+
+	elif 'atmos' in new_rows:
+		tail = ac.derive_table('atmos', new_rows['atmos'])
+		tables['atmos'] = pd.concat([tables['atmos'], tail])
+
+	#sulfate: correct new rows, then recorrect labs whose calibration changed
+	if report['so4'] == 'rebuilt':
+		tables['so4'] = ac.correct_so4(_full('so4', path), cal)
+		labs = set(cal.index)
+
+	else:
+		so4 = tables['so4']
+
+		if 'so4' in new_rows:
+			tail = ac.derive_table('so4', new_rows['so4'])
+			tail = ac.correct_so4(tail, cal).set_axis(tail.index)
+			so4 = pd.concat([so4, tail])
+
+		if labs:
+			rows = so4['lab'].isin(labs)
+			redo = ac.correct_so4(so4.loc[rows].drop(
+				columns = ['m', 'b', 'Dp17O_5305_corr_mean']), cal)
+			so4.loc[rows, ['m', 'b', 'Dp17O_5305_corr_mean']] = \
+				redo[['m', 'b', 'Dp17O_5305_corr_mean']].to_numpy()
+
+		tables['so4'] = so4
+
+	report['labs'] = sorted(labs)
+
+	if any(report[n] != 'unchanged' for n in SOURCES) or force:
+		_write(store_dir, tables, new_state)
+
+	return report
+
+def append_rows(name, rows, path = None, store_dir = None):
+	'''
+	Appends rows to a source csv and updates the derived tables
+
+	Parameters
+	----------
+	name : str
+		Source table: 'exp', 'atmos', 'so4', or 'standards'
+
+	rows : pd.DataFrame
+		New rows, with the source table's columns (and, for 'standards', the
+		standard name as index)
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	store_dir : str or None
+		Store directory; defaults to '.derived' within the data directory
+
+	Returns
+	-------
+	report : dict
+		Update report, as returned by `update`
+	'''
+
+	path, store_dir = store_paths(path, store_dir)
+	fname = os.path.join(path, ac.TABLES[name])
+
+	#bring the store up to date first so that only these rows are new
+	update(path = path, store_dir = store_dir)
+
+	cols = pd.read_csv(fname, nrows = 0, encoding = ac.ENCODINGS[name],
+		index_col = 0 if name == 'standards' else None).columns
+
+	with open(fname, 'rb') as f:
+		f.seek(0, os.SEEK_END)
+		f.seek(max(f.tell() - 1, 0))
+		nl = f.read(1) in [b'\n', b'']
+
+	#in the encoding the table is read with (see `analysis_code.ENCODINGS`)
+	with open(fname, 'a', encoding = ac.ENCODINGS[name], newline = '') as f:
+		if not nl:
+			f.write('\n')
+		rows[list(cols)].to_csv(f,
+			header = False,
+			index = name == 'standards',
+			lineterminator = '\n',
+			)
+
+	return update(path = path, store_dir = store_dir)
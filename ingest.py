@@ -0,0 +1,597 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: VALIDATING AND INGESTING SUBMISSIONS
+
+#import packages
+import argparse
+import codecs
+import csv
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+
+#columns of each table that can be submitted, in csv order, with their types
+SCHEMAS = {
+	'exp': {
+		'sample_ID': 'str',
+		'experiment_type': 'str',
+		'exp_nr': 'int',
+		'wavelength': 'str',
+		'T_C': 'float',
+		'compound': 'str',
+		'd18O_mean': 'float',
+		'd18O_std': 'float',
+		'd17O_mean': 'float',
+		'd17O_std': 'float',
+		'reference': 'str',
+		'notes': 'str',
+	},
+	'atmos': {
+		'sample_ID': 'str',
+		'lat_N_dd': 'float',
+		'long_E_dd': 'float',
+		'species': 'str',
+		'd18O_mean': 'float',
+		'd18O_std': 'float',
+		'd17O_mean': 'float',
+		'd17O_std': 'float',
+		'reference': 'str',
+		'notes': 'str',
+	},
+	'so4': {
+		'sample_ID': 'str',
+		'age_Ma': 'float',
+		'lat_N_dd': 'float',
+		'long_E_dd': 'float',
+		'd18O_mean': 'float',
+		'd18O_std': 'float',
+		'Dp17O_5305_mean': 'float',
+		'Dp17O_5305_std': 'float',
+		'lithology': 'str',
+		'lab': 'str',
+		'reference': 'str',
+		'notes': 'str',
+	},
+	'standards': {
+		'standard': 'str',
+		'lab': 'str',
+		'd18O_mean': 'float',
+		'd18O_std': 'float',
+		'Dp17O_5305_mean': 'float',
+		'Dp17O_5305_std': 'float',
+	},
+}
+
+#columns that must have a value (every 'int' column must be listed)
+REQUIRED = {
+	'exp': ['sample_ID', 'experiment_type', 'exp_nr', 'T_C', 'compound',
+		'd18O_mean', 'd17O_mean', 'reference'],
+	'atmos': ['sample_ID', 'species', 'd17O_mean', 'reference'],
+	'so4': ['sample_ID', 'age_Ma', 'Dp17O_5305_mean', 'lithology', 'lab',
+		'reference'],
+	'standards': ['standard', 'lab', 'd18O_mean', 'Dp17O_5305_mean'],
+}
+
+#allowed (low, high) values of numeric columns; None for no bound
+RANGES = {
+	'exp_nr': (1, None),
+	'T_C': (-273.15, None),
+	'lat_N_dd': (-90, 90),
+	'long_E_dd': (-180, 180),
+	'age_Ma': (0, 4600),
+	'd18O_mean': (-1000, None),
+	'd17O_mean': (-1000, None),
+	'd18O_std': (0, None),
+	'd17O_std': (0, None),
+	'Dp17O_5305_std': (0, None),
+}
+
+SPECIES = [
+	'CO2_strat',
+	'CO2_trop',
+	'CO3_trop',
+	'CO_trop',
+	'ClO4_trop',
+	'H2O2_trop',
+	'H2O_strat',
+	'N2O_strat',
+	'N2O_trop',
+	'NO3_trop',
+	'SO4_trop',
+	'ox_strat',
+	'ox_trop',
+	'oz_strat',
+	'oz_trop',
+	]
+
+EXPERIMENT_TYPES = [
+	'CO2_decomposition_electrical',
+	'CO2_decomposition_photo',
+	'CO2_formation_recombination',
+	'CO_decomposition_photo',
+	'ozone_decomposition_photo',
+	'ozone_decomposition_thermal',
+	'ozone_generation_electrical',
+	'ozone_generation_microwave',
+	'ozone_generation_photo',
+	'ozone_generation_water_electrolysis',
+	'peroxide_formation_recombination',
+	'peroxide_formation_water_electrolysis',
+	]
+
+COMPOUNDS = ['CO2', 'H2O2', 'O', 'O2', 'O3']
+
+#known values of label columns
+VOCAB = {
+	'exp': {'experiment_type': EXPERIMENT_TYPES, 'compound': COMPOUNDS},
+	'atmos': {'species': SPECIES},
+	'so4': {
+		'lithology': sorted(l for li in ac.SAM_TYPE.values() for l in li),
+		'lab': list(ac.LABS),
+		},
+	'standards': {'lab': list(ac.LABS)},
+}
+
+#rows read, checked, and written at a time
+CHUNK = 20000
+
+#UTF-8 multi-byte sequences read as ISO-8859-1 (e.g., 'KÃ¶' for 'Kö')
+_MOJIBAKE = re.compile('[\xc2-\xf4][\x80-\xbf]')
+
+#define functions
+def detect_encoding(fname, blocksize = 2**20):
+	'''
+	Encoding of a csv: 'utf-8' (or 'utf-8-sig' with a byte-order mark) if
+	the whole file decodes as UTF-8, else 'ISO-8859-1', the encoding the
+	compilations are read with
+
+	The file is decoded one block at a time, so memory use does not depend
+	on its size.
+	'''
+
+	dec = codecs.getincrementaldecoder('utf-8')()
+
+	with open(fname, 'rb') as f:
+
+		first = f.read(blocksize)
+		bom = first.startswith(codecs.BOM_UTF8)
+
+		try:
+			for block in iter(lambda: f.read(blocksize), b''):
+				dec.decode(first)
+				first = block
+			dec.decode(first, final = True)
+
+		except UnicodeDecodeError:
+			return 'ISO-8859-1'
+
+	return 'utf-8-sig' if bom else 'utf-8'
+
+def _chunks(reader, ncol, chunk, errors):
+	'''
+	Reads csv rows `chunk` at a time, moving rows with the wrong number of
+	fields to `errors`
+
+	Yields
+	------
+	lines : np.array
+		Line number of each row
+
+	rows : list
+		Rows, as lists of strings
+	'''
+
+	lines, rows = [], []
+
+	for row in reader:
+
+		if len(row) != ncol:
+			if any(row):
+				errors.append((reader.line_num, '', '',
+					'expected %d fields, found %d' % (ncol, len(row))))
+			continue
+
+		lines.append(reader.line_num)
+		rows.append(row)
+
+		if len(rows) == chunk:
+			yield np.array(lines), rows
+			lines, rows = [], []
+
+	if rows:
+		yield np.array(lines), rows
+
+def _split_experiments(fname, encoding, chunk):
+	'''
+	exp_nr values whose rows are not one contiguous block
+
+	Only the exp_nr column is kept, `chunk` rows at a time, so memory use
+	depends on the number of experiments, not of rows. Rows that cannot be
+	checked (wrong number of fields, no integer exp_nr) are skipped, as in
+	`check_chunk`.
+	'''
+
+	seen, split = set(), set()
+	last = None
+
+	with open(fname, encoding = encoding, newline = '') as f:
+
+		reader = csv.reader(f)
+		header = next(reader, [])
+
+		if 'exp_nr' not in header:
+			return split
+
+		i = header.index('exp_nr')
+
+		for _, rows in _chunks(reader, len(header), chunk, []):
+
+			nr = pd.to_numeric(pd.Series([r[i] for r in rows]),
+				errors = 'coerce').to_numpy(dtype = float)
+			v = nr[np.isfinite(nr) & (nr == np.round(nr))].astype(np.int64)
+
+			#first value of each run of equal exp_nr
+			runs = v[np.r_[True, v[1:] != v[:-1]]] if len(v) else v
+
+			for n in runs.tolist():
+				if n == last:
+					continue
+				if n in seen:
+					split.add(n)
+				seen.add(n)
+				last = n
+
+	return split
+
+def _check_exp_nr(v, lines, state, errors):
+	'''
+	Flags experiments whose rows are not one contiguous block, or whose
+	exp_nr is not above that of the experiment before
+
+	Numbers may skip (as in the compilation), but each run of rows with the
+	same exp_nr must be numbered above the run before it and at least
+	`state['min']`. The whole run is flagged, and every run of an
+	experiment in `state['split']` (see `_split_experiments`), so no clean
+	experiment is partial. `state` carries the check across chunks.
+	'''
+
+	bad = np.zeros(len(v), dtype = bool)
+	starts = np.flatnonzero(np.r_[True, v[1:] != v[:-1]])
+	ends = np.r_[starts[1:], len(v)]
+
+	for a, b in zip(starts, ends):
+
+		n = int(v[a])
+
+		#run continued from the previous chunk
+		if n == state['last']:
+			msg = state['msg']
+		elif n in state['split']:
+			msg = 'rows of experiment %d are not contiguous' % n
+		elif state['min'] is not None and n < state['min']:
+			msg = 'exp_nr must be at least %d' % state['min']
+		else:
+			msg = None
+
+		if msg is not None:
+			bad[a:b] = True
+			errors += [(l, 'exp_nr', n, msg) for l in lines[a:b]]
+
+		else:
+			state['min'] = n + 1
+
+		state['last'], state['msg'] = n, msg
+
+	return bad
+
+def check_chunk(name, df, lines, encoding, state):
+	'''
+	Validates and types a chunk of submitted rows
+
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `SCHEMAS`
+
+	df : pd.DataFrame
+		Rows with the table's columns, as strings ('' for missing)
+
+	lines : np.array
+		Line number of each row in the submission
+
+	encoding : str
+		Encoding the submission was read with
+
+	state : dict
+		Checks carried across chunks (exp_nr numbering)
+
+	Returns
+	-------
+	clean : pd.DataFrame
+		Rows that passed every check, typed as in `SCHEMAS`
+
+	errors : list
+		(line, column, value, error) of every failed check
+	'''
+
+	schema = SCHEMAS[name]
+	errors = []
+	bad = np.zeros(len(df), dtype = bool)
+	out = {}
+
+	def flag(mask, col, vals, msg):
+		mask = np.asarray(mask, dtype = bool)
+		if mask.any():
+			bad[mask] = True
+			errors.extend(zip(lines[mask], [col]*mask.sum(),
+				np.asarray(vals, dtype = object)[mask], [msg]*mask.sum()))
+
+	for col, kind in schema.items():
+
+		raw = df[col].to_numpy(dtype = object)
+		missing = raw == ''
+
+		if col in REQUIRED[name]:
+			flag(missing, col, raw, 'missing value')
+
+		if kind == 'str':
+
+			#UTF-8 text in a file that is not UTF-8 throughout; one search of
+			# the whole column first, as this is rare
+			if not encoding.startswith('utf-8') and \
+				_MOJIBAKE.search('\n'.join(raw)):
+				flag(df[col].str.contains(_MOJIBAKE).to_numpy(), col, raw,
+					'UTF-8 text in an ISO-8859-1 file')
+
+			vals = df[col].where(~missing)
+
+			if col == 'lab':
+				vals = vals.replace(ac.LAB_ALIASES)
+
+			known = VOCAB[name].get(col)
+			if known is not None:
+				flag(~missing & ~vals.isin(known).to_numpy(), col, raw,
+					'unknown %s' % col)
+
+			out[col] = vals
+
+			continue
+
+		num = pd.to_numeric(df[col].where(~missing), errors = 'coerce')
+		num = num.to_numpy(dtype = float)
+		flag(~missing & ~np.isfinite(num), col, raw, 'not a number')
+
+		if kind == 'int':
+			flag(np.isfinite(num) & (num != np.round(num)), col, raw,
+				'not an integer')
+
+		lo, hi = RANGES.get(col, (None, None))
+		with np.errstate(invalid = 'ignore'):
+			if lo is not None:
+				flag(num < lo, col, raw, 'below %g' % lo)
+			if hi is not None:
+				flag(num > hi, col, raw, 'above %g' % hi)
+
+		out[col] = num
+
+	#rows without a usable exp_nr are flagged above
+	if name == 'exp':
+		nr = out['exp_nr']
+		has = np.isfinite(nr) & (nr == np.round(nr))
+		bad[has] |= _check_exp_nr(nr[has], lines[has], state, errors)
+
+	clean = pd.DataFrame(out)[~bad]
+
+	for col, kind in schema.items():
+		if kind == 'int':
+			clean[col] = clean[col].astype(np.int64)
+
+	return clean, errors
+
+def ingest(name, fname, store = None, report = None, chunk = CHUNK,
+	encoding = None, exp_start = 'auto', path = None):
+	'''
+	Validates a submitted csv and writes its clean rows to a columnar store
+
+	The submission is read `chunk` rows at a time, so memory use does not
+	depend on its size. Every row is checked for the number of fields,
+	missing required values, types, ranges (see `RANGES`), known labels
+	(see `VOCAB`; lab codes are normalized with `analysis_code.LAB_ALIASES`),
+	mis-encoded text, and, for experiments, that each experiment's rows are
+	contiguous and numbered above the one before. Rows that fail any check
+	are left out of the store and every failed check is written to the
+	error report.
+
+	Parameters
+	----------
+	name : str
+		Table name: 'exp', 'atmos', 'so4', or 'standards'
+
+	fname : str
+		Submitted csv, with the columns of `SCHEMAS[name]` in any order
+
+	store : str or None
+		Output feather file of clean rows; defaults to the submission name
+		with '.clean.feather'
+
+	report : str or None
+		Output csv of errors, with columns 'line', 'column', 'value', and
+		'error'; defaults to the submission name with '.errors.csv'
+
+	chunk : int
+		Rows per chunk; defaults to `CHUNK`
+
+	encoding : str or None
+		Encoding of the submission; detected if None (see `detect_encoding`)
+
+	exp_start : int, 'auto', or None
+		Smallest exp_nr the submitted experiments may use; 'auto' is one
+		above the largest exp_nr of the compilation in `path` (if it can be
+		read), and None accepts any
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	Returns
+	-------
+	summary : dict
+		'encoding', 'rows' (data rows read), 'clean' and 'rejected' row
+		counts, 'errors' (count per error message), and the 'store' and
+		'report' file names
+
+	Raises
+	------
+	ValueError
+		If required columns are missing from the header
+	'''
+
+	import pyarrow as pa
+
+	if name not in SCHEMAS:
+		raise ValueError('cannot ingest table %r' % name)
+
+	schema = SCHEMAS[name]
+	stem = os.path.splitext(fname)[0]
+	store = stem + '.clean.feather' if store is None else store
+	report = stem + '.errors.csv' if report is None else report
+
+	if encoding is None:
+		encoding = detect_encoding(fname)
+
+	if name == 'exp' and exp_start == 'auto':
+		path = ac.path if path is None else path
+		try:
+			nr = pd.read_csv(os.path.join(path, ac.TABLES['exp']),
+				usecols = ['exp_nr'], encoding = 'ISO-8859-1')['exp_nr']
+			exp_start = int(nr.max()) + 1 if len(nr) else 1
+		except (OSError, ValueError):
+			exp_start = None
+
+	#experiments split into several runs are found first, so that all of
+	# their rows are rejected, not just those after the first run
+	state = {'min': exp_start if name == 'exp' else None, 'last': None,
+		'msg': None, 'split': _split_experiments(fname, encoding, chunk)
+		if name == 'exp' else set()}
+
+	pa_types = {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64()}
+	pa_schema = pa.schema([(c, pa_types[k]) for c, k in schema.items()])
+
+	summary = {'encoding': encoding, 'rows': 0, 'clean': 0, 'rejected': 0,
+		'errors': {}, 'store': store, 'report': report}
+
+	tmp = store + '.tmp'
+
+	try:
+		_stream(name, fname, encoding, chunk, state, tmp, report, pa_schema,
+			summary)
+
+	except BaseException:
+		if os.path.exists(tmp):
+			os.remove(tmp)
+		raise
+
+	os.replace(tmp, store)
+
+	summary['rejected'] = summary['rows'] - summary['clean']
+
+	return summary
+
+def _stream(name, fname, encoding, chunk, state, store, report, pa_schema,
+	summary):
+	'''
+	Reads, checks, and writes a submission one chunk at a time
+	'''
+
+	import pyarrow as pa
+
+	schema = SCHEMAS[name]
+
+	with open(fname, encoding = encoding, newline = '') as f, \
+		open(report, 'w', encoding = 'utf-8', newline = '') as rf, \
+		pa.ipc.new_file(store, pa_schema) as sink:
+
+		reader = csv.reader(f)
+		header = next(reader, [])
+
+		missing = [c for c in schema if c not in header]
+		if missing:
+			raise ValueError('%s is missing columns: %s' % (fname,
+				', '.join(missing)))
+
+		w = csv.writer(rf, lineterminator = '\n')
+		w.writerow(['line', 'column', 'value', 'error'])
+
+		#columns that are not in the schema are reported once and dropped
+		w.writerows([(1, c, '', 'unknown column') for c in header
+			if c not in schema])
+
+		pos = [header.index(c) for c in schema]
+		bad_rows = []
+
+		for lines, rows in _chunks(reader, len(header), chunk, bad_rows):
+
+			df = pd.DataFrame(rows, columns = header, dtype = object)
+			df = df.iloc[:, pos].set_axis(list(schema), axis = 1)
+
+			clean, errors = check_chunk(name, df, lines, encoding, state)
+			errors += bad_rows
+			summary['rows'] += len(bad_rows)
+			bad_rows.clear()
+
+			errors.sort(key = lambda e: e[0])
+			w.writerows(errors)
+
+			sink.write_table(pa.Table.from_pandas(clean, schema = pa_schema,
+				preserve_index = False))
+
+			summary['rows'] += len(df)
+			summary['clean'] += len(clean)
+
+			for e in errors:
+				summary['errors'][e[3]] = summary['errors'].get(e[3], 0) + 1
+
+		#malformed rows after the last full row
+		w.writerows(bad_rows)
+		for e in bad_rows:
+			summary['errors'][e[3]] = summary['errors'].get(e[3], 0) + 1
+
+		summary['rows'] += len(bad_rows)
+
+def main(argv = None):
+	'''
+	Command-line entry point
+	'''
+
+	p = argparse.ArgumentParser(description = 'Validate a submitted csv, '
+		'writing its clean rows to a feather store and its errors to a csv.')
+	p.add_argument('table', choices = list(SCHEMAS))
+	p.add_argument('fname', help = 'submitted csv')
+	p.add_argument('--store', default = None)
+	p.add_argument('--report', default = None)
+	p.add_argument('--chunk', type = int, default = CHUNK)
+	p.add_argument('--encoding', default = None)
+	p.add_argument('--path', default = None,
+		help = 'data directory of the compilations')
+
+	args = p.parse_args(argv)
+
+	s = ingest(args.table, args.fname, store = args.store,
+		report = args.report, chunk = args.chunk, encoding = args.encoding,
+		path = args.path)
+
+	print('%s: %d rows (%s), %d clean, %d rejected' % (args.fname, s['rows'],
+		s['encoding'], s['clean'], s['rejected']))
+
+	for msg, n in sorted(s['errors'].items(), key = lambda e: -e[1]):
+		print('%8d  %s' % (n, msg))
+
+	print('clean rows:', s['store'])
+	print('errors:', s['report'])
+
+	return int(s['rejected'] > 0)
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,352 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: INVERTING SULFATE DP17O FOR PO2/PCO2
+
+#import packages
+import numpy as np
+import pandas as pd
+
+import analysis_code as ac
+
+#Phi(rho) = (A + B*rho)/(1 + rho/C) - K, from analysis_code.D17O
+A = 0.519*64
+B = 0.519*146/1.23
+C = 1.23
+K = 7.1738
+
+#smallest pO2/pCO2 searched on the low branch
+RHO_MIN = 1e-12
+
+#define functions
+def _phi(r):
+	'''
+	Phi and dPhi/drho of the Cao and Bao (2013) model
+	'''
+
+	u = 1 + r/C
+
+	return (A + B*r)/u - K, (B - A/C)/u**2
+
+def _model(r, g):
+	'''
+	D17O and dD17O/dln(rho), with g = gamma*theta*tau
+	'''
+
+	p, dp = _phi(r)
+	den = 1 + r + g
+
+	D = -p*g/den
+	dD = -g*(dp*den - p)/den**2
+
+	return D, r*dD
+
+def _gtt(tm, gam, th, mt):
+	'''
+	gamma * theta * tau
+	'''
+
+	return np.multiply(gam, th) * np.multiply(mt, tm)
+
+def rho_turnover(tm, gam = ac.GAMMA, th = ac.THETA, mt = ac.TAU_MODERN,
+	n_iter = 80):
+	'''
+	pO2/pCO2 at which the model D17O is most negative
+
+	D17O decreases from rho = 0 up to this point and increases towards zero
+	beyond it, so it separates the model into two monotonic branches. It is
+	the root of dPhi*(1 + rho + g) - Phi, which decreases monotonically in
+	rho, found by bisection in log(rho).
+
+	Parameters
+	----------
+	tm : array-like
+		Multiplier on the modern O2 residence time
+
+	gam, th, mt : array-like
+		Model constants, as in `analysis_code.D17O`
+
+	n_iter : int
+		Number of bisection steps; defaults to 80
+
+	Returns
+	-------
+	rho : np.array
+		Turnover pO2/pCO2, with the broadcast shape of the inputs
+	'''
+
+	return _turnover(np.asarray(_gtt(tm, gam, th, mt), dtype = float), n_iter)
+
+def _turnover(g, n_iter = 80):
+	'''
+	Turnover rho for g = gamma*theta*tau
+	'''
+
+	lo = np.full(g.shape, np.log(RHO_MIN))
+	hi = np.log(np.maximum(10*(1 + g), 1e3))
+
+	for _ in range(n_iter):
+
+		mid = (lo + hi)/2
+		r = np.exp(mid)
+		p, dp = _phi(r)
+
+		up = dp*(1 + r + g) - p > 0
+		lo = np.where(up, mid, lo)
+		hi = np.where(up, hi, mid)
+
+	return np.exp((lo + hi)/2)
+
+def invert_rho(Dp17O, tm, branch = 'high', frac = 1, gam = ac.GAMMA,
+	th = ac.THETA, mt = ac.TAU_MODERN, tol = 1e-12, max_iter = 100):
+	'''
+	Solves the D17O model for the pO2/pCO2 that reproduces an observed Dp17O
+
+	All arguments broadcast, so one call inverts every sample at every tau
+	multiplier (e.g., Dp17O[:,None] and tm[None,:]). Each root is found by
+	Newton iteration in log(rho), safeguarded by bisection within a bracket
+	on the chosen monotonic branch (see `rho_turnover`); the whole array is
+	iterated in lockstep until every entry has converged.
+
+	Parameters
+	----------
+	Dp17O : array-like
+		Observed Dp17O
+
+	tm : array-like
+		Multiplier on the modern O2 residence time
+
+	branch : str
+		'high' for the branch above the turnover rho (D17O rises towards zero
+		with increasing pO2/pCO2), or 'low' for the branch below it;
+		defaults to 'high'
+
+	frac : array-like
+		Fraction of the O2 anomaly carried into the sample, i.e. Dp17O =
+		frac*D17O(O2); defaults to 1
+
+	gam, th, mt : array-like
+		Model constants, as in `analysis_code.D17O`
+
+	tol : float
+		Convergence tolerance on log(rho); defaults to 1e-12
+
+	max_iter : int
+		Maximum number of iterations; defaults to 100
+
+	Returns
+	-------
+	rho : np.array
+		pO2/pCO2, with the broadcast shape of the inputs; NaN where the
+		observed value cannot be reached on the chosen branch
+	'''
+
+	if branch not in ('high', 'low'):
+		raise ValueError("branch must be 'high' or 'low'")
+
+	y = np.asarray(Dp17O, dtype = float)/np.asarray(frac, dtype = float)
+	g = np.asarray(_gtt(tm, gam, th, mt), dtype = float)
+
+	#turnover before broadcasting, as it only depends on g
+	rt = _turnover(g)
+	Dt, _ = _model(rt, g)
+	y, g, rt, Dt = np.broadcast_arrays(y, g, rt, Dt)
+
+	#bracket in log(rho); D17O > -g*Phi(inf)/rho bounds the high branch
+	if branch == 'high':
+		D0 = np.zeros_like(y)
+		a = np.log(rt)
+		with np.errstate(divide = 'ignore'):
+			b = np.log(np.maximum(rt, g*(B*C - K)/np.abs(y))) + 1e-9
+		s = 1
+
+	else:
+		D0, _ = _model(np.full_like(y, RHO_MIN), g)
+		a = np.full_like(y, np.log(RHO_MIN))
+		b = np.log(rt)
+		s = -1
+
+	ok = np.isfinite(y) & (y >= Dt) & (y <= D0) & (y < 0)
+
+	#iterate on flat copies
+	shape = y.shape
+	y, g = y.ravel(), g.ravel()
+	a, b = np.where(ok, a, np.nan).ravel(), np.where(ok, b, np.nan).ravel()
+	active = ok.ravel()
+
+	#start from the root with Phi held at its limit on that branch
+	phi = B*C - K if branch == 'high' else A - K
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		x0 = np.log(np.maximum(g*phi/np.abs(y) - 1 - g, RHO_MIN))
+	x = np.where((x0 > a) & (x0 < b), x0, (a + b)/2)
+
+	for _ in range(max_iter):
+
+		if not active.any():
+			break
+
+		D, dD = _model(np.exp(x[active]), g[active])
+		f = s*(D - y[active])
+
+		#shrink the bracket around the root; s*f increases with x
+		xa, aa, ba = x[active], a[active], b[active]
+		aa = np.where(f < 0, xa, aa)
+		ba = np.where(f > 0, xa, ba)
+
+		#Newton step, or bisection if it leaves the bracket
+		with np.errstate(divide = 'ignore', invalid = 'ignore'):
+			xn = xa - f/(s*dD)
+
+		bad = ~np.isfinite(xn) | (xn <= aa) | (xn >= ba)
+		xn = np.where(bad, (aa + ba)/2, xn)
+
+		#converged to rounding in D17O (keep x), or in x
+		hit = np.abs(f) <= 8*np.finfo(float).eps*np.abs(y[active])
+		xn = np.where(hit, xa, xn)
+		done = hit | (np.abs(xn - xa) < tol) | (ba - aa < tol)
+
+		x[active], a[active], b[active] = xn, aa, ba
+		idx = np.flatnonzero(active)
+		active[idx[done]] = False
+
+	return np.exp(x).reshape(shape)
+
+def _masked_quantiles(srt, lo, hi, qs):
+	'''
+	Quantiles of each column of a column-sorted array, using only rows
+	lo <= i < hi of that column
+	'''
+
+	k = hi - lo
+	out = []
+
+	for q in qs:
+
+		pos = lo + q*np.maximum(k - 1, 0)
+		i = np.clip(np.floor(pos).astype(np.int64), 0, len(srt) - 1)
+		j = np.clip(i + 1, 0, len(srt) - 1)
+		w = pos - np.floor(pos)
+
+		v = (1 - w)*np.take_along_axis(srt, i[None], axis = 0)[0] + \
+			w*np.take_along_axis(srt, j[None], axis = 0)[0]
+
+		out.append(np.where(k > 0, v, np.nan))
+
+	return out
+
+def invert_so4(res, tms, value = 'Dp17O_5305_corr_mean',
+	std = 'Dp17O_5305_std', n_draws = 0, seed = 0, ci = 0.95,
+	branch = 'high', frac = 1, fill_std = 0, geologic_only = True):
+	'''
+	Inverts corrected sulfate Dp17O for pO2/pCO2 over a grid of tau
+	multipliers
+
+	With Monte Carlo draws, each sample's Dp17O is drawn once from a normal
+	distribution and the draws are shared by every tau multiplier. Because
+	rho is monotonic in Dp17O on a branch, the rho quantiles equal the rho
+	of the Dp17O quantiles of the draws that can be inverted, so only three
+	values per sample and multiplier are inverted.
+
+	Parameters
+	----------
+	res : pd.DataFrame
+		Corrected sulfate compilation, as returned by
+		`analysis_code.correct_so4`
+
+	tms : array-like
+		Multipliers on the modern O2 residence time
+
+	value : str
+		Dp17O column; defaults to 'Dp17O_5305_corr_mean'
+
+	std : str
+		Dp17O uncertainty column; defaults to 'Dp17O_5305_std'
+
+	n_draws : int
+		Number of Monte Carlo draws per sample; if 0, the range is the rho
+		of the normal quantiles of Dp17O. Defaults to 0.
+
+	seed : int
+		Random seed; defaults to 0
+
+	ci : float
+		Confidence interval width; defaults to 0.95
+
+	branch : str
+		Model branch, 'high' or 'low'; see `invert_rho`
+
+	frac : float
+		Fraction of the O2 anomaly carried into sulfate; see `invert_rho`
+
+	fill_std : float
+		Uncertainty used where `std` is missing; defaults to 0
+
+	geologic_only : bool
+		If True, only inverts geologic samples (see `analysis_code.SAM_TYPE`)
+
+	Returns
+	-------
+	inv : pd.DataFrame
+		Table indexed by (sample index, 'tm') with columns 'rho', 'rho_lo',
+		and 'rho_hi', plus 'p_valid' (fraction of draws that could be
+		inverted) when `n_draws` > 0
+	'''
+
+	if geologic_only:
+		res = res[res['lithology'].isin(ac.SAM_TYPE['geologic'])]
+
+	tms = np.atleast_1d(np.asarray(tms, dtype = float))
+
+	mu = res[value].to_numpy(dtype = float)
+	sd = res[std].to_numpy(dtype = float) if std in res.columns \
+		else np.full(len(res), np.nan)
+	sd = np.nan_to_num(sd, nan = fill_std)
+
+	a = (1 - ci)/2
+	mu2, tm2 = mu[:,None], tms[None,:]
+
+	rho = invert_rho(mu2, tm2, branch = branch, frac = frac)
+	out = {'rho': rho}
+
+	if n_draws > 0:
+
+		rng = np.random.default_rng(seed)
+		draws = np.sort(mu + sd*rng.standard_normal((n_draws, len(mu))),
+			axis = 0)
+
+		#attainable Dp17O range of the branch at each multiplier
+		g = _gtt(tms, ac.GAMMA, ac.THETA, ac.TAU_MODERN)
+		Dt = frac*_model(_turnover(g), g)[0]
+		D0 = np.zeros_like(g) if branch == 'high' else \
+			frac*_model(np.full_like(g, RHO_MIN), g)[0]
+
+		qlo, qhi = np.empty((2, len(mu), len(tms)))
+		lo, hi = np.empty((2, len(mu), len(tms)), dtype = np.int64)
+
+		for j in range(len(tms)):
+
+			#invertible draws form a contiguous run of the sorted draws
+			lo[:,j] = (draws < Dt[j]).sum(axis = 0)
+			hi[:,j] = (draws < D0[j]).sum(axis = 0) if branch == 'high' \
+				else (draws <= D0[j]).sum(axis = 0)
+
+			qlo[:,j], qhi[:,j] = _masked_quantiles(draws, lo[:,j], hi[:,j],
+				[a, 1 - a])
+
+		out['p_valid'] = (hi - lo)/n_draws
+
+	else:
+		from scipy.stats import norm
+		z = norm.ppf(1 - a)
+		qlo, qhi = mu2 - z*sd[:,None], mu2 + z*sd[:,None]
+
+	r1 = invert_rho(qlo, tm2, branch = branch, frac = frac)
+	r2 = invert_rho(qhi, tm2, branch = branch, frac = frac)
+
+	#rho increases with Dp17O on the high branch and decreases on the low
+	out['rho_lo'] = np.fmin(r1, r2)
+	out['rho_hi'] = np.fmax(r1, r2)
+
+	idx = pd.MultiIndex.from_product([res.index, tms],
+		names = [res.index.name, 'tm'])
+
+	inv = pd.DataFrame({k: np.ravel(v) for k, v in out.items()}, index = idx)
+
+	return inv[['rho', 'rho_lo', 'rho_hi'] + (['p_valid'] if n_draws else [])]
@@ -0,0 +1,176 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: D17O MODEL PARAMETER SWEEPS
+
+#import packages
+import hashlib
+import os
+
+import numpy as np
+
+import analysis_code as ac
+
+#bump to invalidate stored sweeps if the model changes
+SWEEP_VERSION = 1
+
+#define functions
+def sweep_dir(cache_dir = None):
+	'''
+	Gets the sweep cache directory; defaults to '.model_cache' within the
+	data directory
+	'''
+
+	if cache_dir is None:
+		cache_dir = os.path.join(ac.path, '.model_cache')
+
+	return cache_dir
+
+def sweep_key(*args):
+	'''
+	sha1 key of a set of model inputs (values, shapes, and dtypes)
+	'''
+
+	h = hashlib.sha1(('D17O v%d' % SWEEP_VERSION).encode())
+
+	for a in args:
+		a = np.ascontiguousarray(a, dtype = float)
+		h.update(repr(a.shape).encode())
+		h.update(a.tobytes())
+
+	return h.hexdigest()
+
+def evaluate(rho, tm, gam = ac.GAMMA, th = ac.THETA, mt = ac.TAU_MODERN,
+	chunk = 2**20, out = None):
+	'''
+	Evaluates `analysis_code.D17O` over a broadcast grid in fixed-size chunks
+
+	Inputs are never expanded to the full grid; numpy's buffered iterator
+	hands the model `chunk` broadcast elements at a time, so temporaries
+	stay bounded however large the grid is.
+
+	Parameters
+	----------
+	rho, tm, gam, th, mt : array-like
+		Model inputs, as in `analysis_code.D17O`; must broadcast together,
+		e.g. rho[:,None,None], tm[None,:,None], gam[None,None,:]
+
+	chunk : int
+		Number of grid points evaluated at a time; defaults to 2**20
+
+	out : np.array or None
+		Output array (e.g., a memory map) with the broadcast shape
+
+	Returns
+	-------
+	D : np.array
+		Predicted D17O, with the broadcast shape of the inputs
+	'''
+
+	args = [np.asarray(a, dtype = float) for a in (rho, tm, gam, th, mt)]
+	shape = np.broadcast_shapes(*[a.shape for a in args])
+
+	if out is None:
+		out = np.empty(shape)
+
+	it = np.nditer(args + [out],
+		flags = ['external_loop', 'buffered', 'zerosize_ok'],
+		op_flags = [['readonly']]*5 + [['writeonly']],
+		buffersize = chunk,
+		)
+
+	with it:
+		for r, t, g, h, m, o in it:
+			o[...] = ac.D17O(r, t, gam = g, th = h, mt = m)
+
+	return out
+
+def sweep(rho, tm, gam = ac.GAMMA, th = ac.THETA, mt = ac.TAU_MODERN,
+	chunk = 2**20, cache = True, cache_dir = None, mmap = True):
+	'''
+	Evaluates the D17O model over a broadcast grid, memoized on disk
+
+	Results are stored as .npy files named by the sha1 of the inputs, so any
+	grid is evaluated once; later calls with the same inputs only read (or
+	memory-map) the stored result. Large sweeps are written straight to a
+	memory-mapped file.
+
+	Parameters
+	----------
+	rho, tm, gam, th, mt : array-like
+		Model inputs, as in `analysis_code.D17O`; must broadcast together
+
+	chunk : int
+		Number of grid points evaluated at a time; defaults to 2**20
+
+	cache : bool
+		If True, reads and writes the sweep cache
+
+	cache_dir : str or None
+		Cache directory; defaults to '.model_cache' within the data directory
+
+	mmap : bool
+		If True, returns stored results as read-only memory maps
+
+	Returns
+	-------
+	D : np.array
+		Predicted D17O, with the broadcast shape of the inputs
+	'''
+
+	if not cache:
+		return evaluate(rho, tm, gam, th, mt, chunk = chunk)
+
+	cache_dir = sweep_dir(cache_dir)
+	fname = os.path.join(cache_dir, sweep_key(rho, tm, gam, th, mt) + '.npy')
+
+	if os.path.exists(fname):
+		return np.load(fname, mmap_mode = 'r' if mmap else None)
+
+	os.makedirs(cache_dir, exist_ok = True)
+
+	shape = np.broadcast_shapes(*[np.shape(a) for a in (rho, tm, gam, th, mt)])
+
+	#write to a temporary file, then move into place so readers never see a
+	# partial result
+	tmp = fname + '.%d.tmp' % os.getpid()
+	out = np.lib.format.open_memmap(tmp, mode = 'w+', shape = shape)
+	evaluate(rho, tm, gam, th, mt, chunk = chunk, out = out)
+	out.flush()
+	del out
+
+	os.replace(tmp, fname)
+
+	return np.load(fname, mmap_mode = 'r' if mmap else None)
+
+def surface(rho, tm, chunk = 2**20, cache = True, cache_dir = None, **params):
+	'''
+	D17O sensitivity surface over the outer product of 1-D parameter axes
+
+	Parameters
+	----------
+	rho, tm : array-like
+		1-D pO2/pCO2 and residence-time multiplier axes
+
+	chunk, cache, cache_dir :
+		As in `sweep`
+
+	**params : array-like
+		Optional 1-D axes for 'gam', 'th', and/or 'mt'; omitted constants
+		keep their default values
+
+	Returns
+	-------
+	D : np.array
+		Predicted D17O, shape (len(rho), len(tm), ...) with one trailing
+		axis per entry of `params`, in the order given
+	'''
+
+	axes = [np.ravel(rho), np.ravel(tm)] + [np.ravel(v) for v in params.values()]
+	n = len(axes)
+
+	#one axis per input
+	grid = [a.reshape([-1 if i == j else 1 for j in range(n)])
+		for i, a in enumerate(axes)]
+
+	kw = dict(zip(params, grid[2:]))
+
+	return sweep(grid[0], grid[1], chunk = chunk, cache = cache,
+		cache_dir = cache_dir, **kw)
@@ -0,0 +1,242 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: MONTE CARLO CALIBRATION UNCERTAINTY
+
+#import packages
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from calibration import calibration_system, solve_system, system_cal
+
+#define functions
+def _draw(rng, mu, sd, n):
+	'''
+	Draws n normal samples for each (mu, sd) pair, shape (n, len(mu))
+	'''
+
+	return mu + sd*rng.standard_normal((n, len(mu)))
+
+def _run_chunks(seeds, sizes, system, stds_arr, sam_arr, lab_idx,
+	shift, lo, hi, nbins):
+	'''
+	Processes a list of Monte Carlo chunks and returns summed statistics
+
+	Each chunk draws from its own seeded stream, so results do not depend on
+	how chunks are split among workers.
+	'''
+
+	s_Dp, s_Dp_sd, s_d, s_d_sd = stds_arr
+	Dp, Dp_sd, d, d_sd = sam_arr
+
+	ns = len(Dp)
+	width = (hi - lo)/nbins
+
+	tot = np.zeros(ns)
+	tot2 = np.zeros(ns)
+	hist = np.zeros(ns*nbins, dtype = np.int64)
+
+	for seed, k in zip(seeds, sizes):
+
+		rng = np.random.default_rng(seed)
+
+		#draw standards and solve the calibrations for each draw, (k, labs)
+		M, B = system_cal(system, solve_system(
+			system,
+			_draw(rng, s_Dp, s_Dp_sd, k),
+			_draw(rng, s_d, s_d_sd, k),
+			))
+
+		#draw samples and correct them, (k, ns)
+		corr = _draw(rng, Dp, Dp_sd, k)
+		corr -= M[:,lab_idx]*_draw(rng, d, d_sd, k)
+		corr -= B[:,lab_idx]
+
+		#accumulate shifted sums and histogram counts
+		x = corr - shift
+		tot += x.sum(axis = 0)
+		tot2 += (x*x).sum(axis = 0)
+
+		ib = np.floor((corr - lo)/width).astype(np.int64)
+		np.clip(ib, 0, nbins - 1, out = ib)
+		ib += np.arange(ns)*nbins
+
+		hist += np.bincount(ib.ravel(), minlength = ns*nbins)
+
+	return tot, tot2, hist
+
+def _hist_quantiles(hist, lo, hi, qs):
+	'''
+	Linearly interpolated quantiles from per-sample histograms
+	'''
+
+	ns, nbins = hist.shape
+	width = (hi - lo)/nbins
+
+	cdf = np.cumsum(hist, axis = 1)/hist.sum(axis = 1, keepdims = True)
+	cdf0 = np.concatenate([np.zeros((ns, 1)), cdf[:,:-1]], axis = 1)
+
+	out = []
+	rows = np.arange(ns)
+
+	for q in qs:
+
+		#first bin whose upper cdf reaches q, then interpolate within it
+		i = np.minimum((cdf < q).sum(axis = 1), nbins - 1)
+		p = hist[rows, i]/hist.sum(axis = 1)
+
+		with np.errstate(divide = 'ignore', invalid = 'ignore'):
+			f = np.where(p > 0, (q - cdf0[rows, i])/p, 0.5)
+
+		out.append(lo + (i + np.clip(f, 0, 1))*width)
+
+	return out
+
+def mc_correct_so4(df, stds, n = 100000, chunk = 1000, seed = 0, ci = 0.95,
+	jobs = None, nbins = 2048, fill_std = 0, anchor = 'Sh', min_spread = 5):
+	'''
+	Propagates standard and sample uncertainty through the lab calibrations
+
+	Standard and sample d18O and Dp17O values are drawn from normal
+	distributions given by their '*_mean' and '*_std' columns, the lab
+	calibrations of `analysis_code.calibrate_labs` are re-solved for every
+	draw (see `calibration.solve_system`), and each sample is corrected with
+	its lab's draw. Draws are made in fixed-size chunks, each with its own
+	seeded stream, so memory stays bounded by `chunk` and results are
+	reproducible regardless of `jobs`.
+	Confidence intervals come from per-sample histograms spanning +/- 10
+	standard deviations of a pilot chunk.
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Sulfate compilation
+
+	stds : pd.DataFrame
+		Standards table, indexed by standard name
+
+	n : int
+		Number of Monte Carlo draws; defaults to 100000
+
+	chunk : int
+		Number of draws per chunk; defaults to 1000
+
+	seed : int
+		Seed of the root `np.random.SeedSequence`; defaults to 0
+
+	ci : float
+		Confidence interval width; defaults to 0.95
+
+	jobs : int or None
+		Number of worker processes; defaults to the number of cpus. If 1,
+		chunks are processed in this process.
+
+	nbins : int
+		Number of histogram bins per sample; defaults to 2048
+
+	fill_std : float
+		Standard deviation used where a '*_std' value is missing; defaults
+		to 0 (no uncertainty)
+
+	anchor : str or list
+		Lab(s) whose values are taken as true; defaults to 'Sh'
+
+	min_spread : float
+		Minimum d18O range to fit a lab slope; defaults to 5 permil
+
+	Returns
+	-------
+	mc : pd.DataFrame
+		Table with the same index as `df` and columns 'Dp17O_5305_corr_mean',
+		'Dp17O_5305_corr_std', 'Dp17O_5305_corr_lo', and
+		'Dp17O_5305_corr_hi'. Samples from uncalibrated labs are NaN.
+	'''
+
+	#pull standard means and stds
+	def _cols(t, name):
+		mu = t[name + '_mean'].to_numpy(dtype = float)
+		if name + '_std' in t.columns:
+			sd = t[name + '_std'].to_numpy(dtype = float)
+		else:
+			sd = np.full(len(t), np.nan)
+		return mu, np.nan_to_num(sd, nan = fill_std)
+
+	#the system (which labs and standards, with what weights) is fixed; only
+	# the standard values change between draws
+	system = calibration_system(stds, anchor = anchor,
+		min_spread = min_spread)
+	labs = list(system['labs'].index)
+
+	stds_arr = _cols(stds, 'Dp17O_5305') + _cols(stds, 'd18O')
+
+	#only samples from calibrated labs; NaN d18O is a constant offset, as in
+	# analysis_code.correct_so4
+	ok = df['lab'].isin(labs).to_numpy()
+	sam = df[ok]
+
+	Dp, Dp_sd = _cols(sam, 'Dp17O_5305')
+	d, d_sd = _cols(sam, 'd18O')
+	d_sd[np.isnan(d)] = 0
+	d = np.nan_to_num(d, nan = 0)
+
+	sam_arr = (Dp, Dp_sd, d, d_sd)
+	lab_idx = np.searchsorted(labs, sam['lab'].astype(str).to_numpy())
+
+	#one stream for the pilot chunk, then one per chunk
+	ss = np.random.SeedSequence(seed)
+	pilot_ss, *chunk_ss = ss.spawn(1 + int(np.ceil(n/chunk)))
+	sizes = [chunk]*(len(chunk_ss) - 1) + [n - chunk*(len(chunk_ss) - 1)]
+
+	#pilot to set the histogram range of each sample
+	k = min(chunk, n)
+	pt, pt2, _ = _run_chunks([pilot_ss], [k], system, stds_arr, sam_arr,
+		lab_idx, np.zeros(len(Dp)), np.zeros(len(Dp)) - 1,
+		np.zeros(len(Dp)) + 1, 1)
+	shift = pt/k
+	sd = np.sqrt(np.maximum(pt2/k - shift**2, 0))
+	half = 10*np.maximum(sd, 1e-6)
+	lo, hi = shift - half, shift + half
+
+	args = (system, stds_arr, sam_arr, lab_idx, shift, lo, hi, nbins)
+
+	if jobs is None:
+		jobs = os.cpu_count() or 1
+
+	jobs = max(1, min(jobs, len(chunk_ss)))
+
+	if jobs == 1:
+		parts = [_run_chunks(chunk_ss, sizes, *args)]
+
+	else:
+		with ProcessPoolExecutor(max_workers = jobs) as ex:
+			futs = [
+				ex.submit(_run_chunks, chunk_ss[i::jobs], sizes[i::jobs], *args)
+				for i in range(jobs)
+				]
+			parts = [f.result() for f in futs]
+
+	tot = sum(p[0] for p in parts)
+	tot2 = sum(p[1] for p in parts)
+	hist = sum(p[2] for p in parts).reshape(len(Dp), nbins)
+
+	mean = tot/n
+	std = np.sqrt(np.maximum(tot2/n - mean**2, 0)*n/max(n - 1, 1))
+
+	a = (1 - ci)/2
+	qlo, qhi = _hist_quantiles(hist, lo, hi, [a, 1 - a])
+
+	mc = pd.DataFrame(
+		np.nan,
+		index = df.index,
+		columns = [
+			'Dp17O_5305_corr_mean',
+			'Dp17O_5305_corr_std',
+			'Dp17O_5305_corr_lo',
+			'Dp17O_5305_corr_hi',
+			],
+		)
+
+	mc.loc[ok] = np.column_stack([mean + shift, std, qlo, qhi])
+
+	return mc
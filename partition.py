@@ -0,0 +1,259 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: TABLE PARTITIONS
+
+#import packages
+import fnmatch
+import itertools
+import weakref
+
+import numpy as np
+import pandas as pd
+
+#categorical keys each table is partitioned by
+PARTITION_KEYS = {
+	'O3_rxn_rates': ('sas', 'in_reg'),
+	'exp': ('experiment_type', 'compound'),
+	'atmos': ('species',),
+	'so4': ('lithology', 'lab'),
+	'standards': ('lab',),
+}
+
+#partitions of live tables, keyed by (id(df), keys); entries are dropped when
+# their table is garbage collected
+_cache = {}
+
+#define functions
+def partition(df, keys):
+	'''
+	Partitions a table once by its categorical keys
+
+	Rows are sorted stably by the first key, making each of its groups one
+	contiguous block that is returned as a slice. Groups of any other
+	combination of keys are stored as row positions. Every lookup is then a
+	single dict access, and every group keeps the table's row order.
+	Rows with a missing key value are left out of that key's groups.
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Table to partition
+
+	keys : iterable
+		Key columns, e.g. ('experiment_type', 'compound')
+
+	Returns
+	-------
+	part : dict
+		Partition: 'keys', 'data' (the table sorted by the first key), 'order'
+		(original position of each sorted row), 'values' (sorted unique
+		values of each key), and 'groups' (for each subset of keys, a dict
+		from value tuple to a slice or positions of 'data')
+	'''
+
+	keys = tuple(keys)
+
+	codes, uniques = [], []
+	for k in keys:
+		c, u = pd.factorize(df[k], sort = True)
+		codes.append(c)
+		uniques.append(u)
+
+	#sort by the first key only, so that its groups are contiguous
+	order = np.argsort(codes[0], kind = 'stable') if keys \
+		else np.arange(len(df))
+	codes = [c[order] for c in codes]
+
+	groups = {}
+
+	for r in range(1, len(keys) + 1):
+		for sub in itertools.combinations(range(len(keys)), r):
+
+			#combined code of the subset; any missing value drops the row
+			cs = [codes[i] for i in sub]
+			ok = np.all([c >= 0 for c in cs], axis = 0)
+			comb = np.ravel_multi_index([c[ok] for c in cs],
+				[len(uniques[i]) for i in sub])
+			pos = np.flatnonzero(ok)
+
+			#groups of the first key are already contiguous
+			leading = sub == (0,)
+
+			if not leading:
+				o = np.lexsort((order[pos], comb))
+				pos, comb = pos[o], comb[o]
+
+			starts = np.flatnonzero(np.r_[True, comb[1:] != comb[:-1]]) \
+				if len(comb) else np.zeros(0, dtype = np.int64)
+			ends = np.r_[starts[1:], len(comb)]
+
+			g = {}
+			for a, b in zip(starts, ends):
+
+				idx = np.unravel_index(comb[a], [len(uniques[i]) for i in sub])
+				val = tuple(uniques[i][j] for i, j in zip(sub, idx))
+
+				g[val] = slice(pos[a], pos[b - 1] + 1) if leading \
+					else pos[a:b]
+
+			groups[tuple(keys[i] for i in sub)] = g
+
+	part = {
+		'keys': keys,
+		'data': df.iloc[order],
+		'order': order,
+		'values': {k: list(u) for k, u in zip(keys, uniques)},
+		'groups': groups,
+		}
+
+	return part
+
+def table_partition(df, keys):
+	'''
+	Partition of a table, built on first use and reused while the table
+	object is alive
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Table to partition
+
+	keys : iterable
+		Key columns
+
+	Returns
+	-------
+	part : dict
+		Partition, as returned by `partition`
+	'''
+
+	key = (id(df), tuple(keys))
+	hit = _cache.get(key)
+
+	if hit is not None and hit[0]() is df:
+		return hit[1]
+
+	part = partition(df, keys)
+	ref = weakref.ref(df, lambda _, key = key: _cache.pop(key, None))
+	_cache[key] = (ref, part)
+
+	return part
+
+def dataset(tables):
+	'''
+	Partitions of every loaded table with partition keys
+
+	Parameters
+	----------
+	tables : dict
+		Loaded tables, keyed by table name
+
+	Returns
+	-------
+	parts : dict
+		Partitions, keyed by table name (see `PARTITION_KEYS`)
+	'''
+
+	return {
+		name: table_partition(df, PARTITION_KEYS[name])
+		for name, df in tables.items() if name in PARTITION_KEYS
+		}
+
+def values(part, key):
+	'''
+	Sorted unique values of a key
+	'''
+
+	return part['values'][key]
+
+def match(part, key, pattern):
+	'''
+	Values of a key matching a glob pattern, e.g. '*_decomposition_*' or
+	'ozone_*'
+
+	Parameters
+	----------
+	part : dict
+		Partition, as returned by `partition`
+
+	key : str
+		Key column
+
+	pattern : str
+		Glob pattern (case sensitive)
+
+	Returns
+	-------
+	vals : list
+		Matching values, sorted
+	'''
+
+	return [v for v in part['values'][key]
+		if fnmatch.fnmatchcase(str(v), pattern)]
+
+def _resolve(part, key, crit):
+	'''
+	Values of a key selected by a criterion: a glob pattern, an exact value,
+	or a list of exact values
+	'''
+
+	if isinstance(crit, str) and any(ch in crit for ch in '*?['):
+		return match(part, key, crit)
+
+	if isinstance(crit, (list, tuple, set, np.ndarray, pd.Index)):
+		return [v for v in crit]
+
+	return [crit]
+
+def select(part, **criteria):
+	'''
+	Rows matching criteria on any combination of keys
+
+	Each criterion is an exact value, a list of exact values, or a glob
+	pattern (a string with '*', '?', or '['); e.g.
+	select(part, experiment_type = '*_decomposition_*', compound = 'O3').
+	A single exact value per key is one dict lookup; other criteria take
+	the union of the matching groups, in the table's row order.
+
+	Parameters
+	----------
+	part : dict
+		Partition, as returned by `partition`
+
+	**criteria :
+		Criteria, keyed by key column
+
+	Returns
+	-------
+	df : pd.DataFrame
+		Matching rows
+	'''
+
+	if not criteria:
+		return part['data'].iloc[np.argsort(part['order'], kind = 'stable')]
+
+	#keys in partition order
+	keys = tuple(k for k in part['keys'] if k in criteria)
+
+	if len(keys) != len(criteria):
+		bad = set(criteria) - set(keys)
+		raise KeyError('not a partition key: %s' % ', '.join(sorted(bad)))
+
+	g = part['groups'][keys]
+	vals = [_resolve(part, k, criteria[k]) for k in keys]
+
+	hits = [g[v] for v in itertools.product(*vals) if v in g]
+
+	if len(hits) == 1 and isinstance(hits[0], slice):
+		return part['data'].iloc[hits[0]]
+
+	if not hits:
+		return part['data'].iloc[:0]
+
+	pos = np.concatenate([
+		np.arange(h.start, h.stop) if isinstance(h, slice) else h
+		for h in hits
+		])
+
+	if len(hits) > 1:
+		pos = pos[np.argsort(part['order'][pos], kind = 'stable')]
+
+	return part['data'].iloc[pos]
@@ -0,0 +1,401 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: STAGE PROFILING AND TRACING
+
+#import packages
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+#record stages when True; also switched on by setting TOID_PROFILE
+enabled = bool(os.environ.get('TOID_PROFILE'))
+
+#finished stages, in the order they ended
+_events = []
+
+#open stages of each thread, innermost last
+_local = threading.local()
+
+#returned by `stage` when profiling is off
+_NULL = contextlib.nullcontext()
+
+#define functions
+def _read_status(key):
+	'''
+	Value of a /proc/self/status field in kB, or None off Linux
+	'''
+
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith(key):
+					return int(line.split()[1])
+
+	except OSError:
+		pass
+
+	return None
+
+def _reset_peak():
+	'''
+	Resets the process peak RSS (Linux only); returns whether it worked
+	'''
+
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+		return True
+
+	except OSError:
+		return False
+
+def _peak_rss():
+	'''
+	Peak RSS of the process in MB, since the last reset where supported
+	'''
+
+	kb = _read_status('VmHWM:')
+
+	if kb is None and resource is not None:
+
+		#kB on Linux, bytes on macOS
+		kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		if os.uname().sysname == 'Darwin':
+			kb /= 1024
+
+	return None if kb is None else kb/1024
+
+def _stack():
+	'''
+	Open stages of the current thread
+	'''
+
+	s = getattr(_local, 'stack', None)
+
+	if s is None:
+		s = _local.stack = []
+
+	return s
+
+@contextlib.contextmanager
+def _record(name, args):
+	'''
+	Records one stage: wall and cpu time, time spent in nested stages, and
+	peak RSS
+
+	Peak RSS is per stage where the kernel allows resetting the process
+	peak (Linux): the peak so far is handed to the enclosing stage, then
+	reset, so each stage sees only its own peak and passes it on to its
+	parent when it ends. Elsewhere it is the process peak so far.
+	'''
+
+	stack = _stack()
+	parent = stack[-1] if stack else None
+
+	#labels of enclosing stages carry over, e.g. the figure being drawn
+	if parent is not None:
+		parent['peak'] = max(parent['peak'], _peak_rss() or 0)
+		args = dict(parent['args'], **args)
+
+	reset = _reset_peak()
+
+	frame = {'child': 0.0, 'peak': 0.0, 'args': args}
+	stack.append(frame)
+
+	t0, c0 = time.time(), time.process_time()
+	p0 = time.perf_counter()
+
+	try:
+		yield
+
+	finally:
+
+		wall = time.perf_counter() - p0
+		cpu = time.process_time() - c0
+
+		stack.pop()
+		peak = max(frame['peak'], _peak_rss() or 0)
+
+		if parent is not None:
+			parent['child'] += wall
+			parent['peak'] = max(parent['peak'], peak)
+
+		_events.append({
+			'name': name,
+			'args': args,
+			'start': t0,
+			'wall': wall,
+			'self': wall - frame['child'],
+			'cpu': cpu,
+			'peak_rss_mb': peak,
+			'peak_scope': 'stage' if reset else 'process',
+			'depth': len(stack),
+			'pid': os.getpid(),
+			'tid': threading.get_ident(),
+			})
+
+def stage(name, **args):
+	'''
+	Context manager timing a named stage, e.g.
+
+		with stage('read_csv', table = name):
+			df = pd.read_csv(fname)
+
+	When profiling is off this returns a shared no-op context, so
+	instrumented code pays only for the call.
+
+	Parameters
+	----------
+	name : str
+		Stage name
+
+	**args :
+		Labels stored with the stage (e.g. table or figure name); nested
+		stages also get the labels of the stages around them
+	'''
+
+	return _record(name, args) if enabled else _NULL
+
+def traced(name = None):
+	'''
+	Decorator recording every call of a function as a stage
+
+	Parameters
+	----------
+	name : str or None
+		Stage name; defaults to the function name
+	'''
+
+	def wrap(fn):
+
+		label = fn.__name__ if name is None else name
+
+		@functools.wraps(fn)
+		def inner(*a, **kw):
+			if not enabled:
+				return fn(*a, **kw)
+			with _record(label, {}):
+				return fn(*a, **kw)
+
+		return inner
+
+	return wrap
+
+def enable(on = True):
+	'''
+	Switches profiling on (or off)
+	'''
+
+	global enabled
+	enabled = bool(on)
+
+def reset():
+	'''
+	Drops every recorded stage
+	'''
+
+	del _events[:]
+
+def events():
+	'''
+	Recorded stages, as a list of dicts
+	'''
+
+	return list(_events)
+
+def drain():
+	'''
+	Returns the recorded stages and drops them (e.g., to hand the stages of
+	a worker process back to its parent)
+	'''
+
+	out = list(_events)
+	reset()
+
+	return out
+
+def extend(evts):
+	'''
+	Adds stages recorded elsewhere, e.g. in worker processes
+	'''
+
+	_events.extend(evts)
+
+def summary(evts = None, by = ('name',)):
+	'''
+	Summarizes recorded stages
+
+	Parameters
+	----------
+	evts : list or None
+		Stages; defaults to those recorded so far
+
+	by : tuple
+		Grouping: 'name' and/or any stage label, e.g. ('name', 'figure')
+
+	Returns
+	-------
+	summ : pd.DataFrame
+		Table indexed by `by` with columns 'calls', 'wall' (total s), 'self'
+		(total s excluding nested stages), 'cpu' (total s), 'mean' (mean wall
+		s), and 'peak_rss_mb' (largest peak), sorted by self time
+	'''
+
+	evts = _events if evts is None else evts
+	cols = ['calls', 'wall', 'self', 'cpu', 'mean', 'peak_rss_mb']
+
+	if not evts:
+		return pd.DataFrame(columns = cols)
+
+	df = pd.DataFrame([dict(e['args'], **{k: v for k, v in e.items()
+		if k != 'args'}) for e in evts])
+
+	for b in by:
+		if b not in df.columns:
+			df[b] = None
+
+	g = df.groupby(list(by), dropna = False, sort = False)
+
+	summ = pd.DataFrame({
+		'calls': g.size(),
+		'wall': g['wall'].sum(),
+		'self': g['self'].sum(),
+		'cpu': g['cpu'].sum(),
+		'mean': g['wall'].mean(),
+		'peak_rss_mb': g['peak_rss_mb'].max(),
+		})
+
+	return summ.sort_values('self', ascending = False)
+
+def to_trace(evts = None, meta = None):
+	'''
+	Stages as a Chrome trace (chrome://tracing, Perfetto)
+
+	Each stage is a complete ('X') event; cpu time, self time, peak RSS, and
+	the stage labels are its args. `meta` is stored as 'otherData'.
+	'''
+
+	evts = _events if evts is None else evts
+	t0 = min((e['start'] for e in evts), default = 0)
+
+	trace = []
+
+	for e in evts:
+		trace.append({
+			'name': e['name'],
+			'cat': 'stage',
+			'ph': 'X',
+			'ts': (e['start'] - t0)*1e6,
+			'dur': e['wall']*1e6,
+			'pid': e['pid'],
+			'tid': e['tid'],
+			'args': dict(e['args'],
+				cpu_s = e['cpu'],
+				self_s = e['self'],
+				peak_rss_mb = e['peak_rss_mb'],
+				peak_scope = e['peak_scope'],
+				depth = e['depth'],
+				),
+			})
+
+	return {
+		'traceEvents': trace,
+		'displayTimeUnit': 'ms',
+		'otherData': dict(meta or {}, t0 = t0),
+		}
+
+def save(fname, evts = None, meta = None):
+	'''
+	Writes recorded stages as a Chrome trace json (see `to_trace`), which
+	`load` reads back
+
+	Returns
+	-------
+	fname : str
+		Saved file
+	'''
+
+	with open(fname, 'w') as f:
+		json.dump(to_trace(evts, meta), f, default = str)
+
+	return fname
+
+def load(fname):
+	'''
+	Reads stages saved by `save`
+
+	Returns
+	-------
+	evts : list
+		Stages, as recorded
+
+	meta : dict
+		Metadata stored with them
+	'''
+
+	with open(fname) as f:
+		tr = json.load(f)
+
+	meta = tr.get('otherData', {})
+	t0 = meta.get('t0', 0)
+	keys = ['cpu_s', 'self_s', 'peak_rss_mb', 'peak_scope', 'depth']
+
+	evts = [{
+		'name': e['name'],
+		'args': {k: v for k, v in e['args'].items() if k not in keys},
+		'start': t0 + e['ts']/1e6,
+		'wall': e['dur']/1e6,
+		'self': e['args']['self_s'],
+		'cpu': e['args']['cpu_s'],
+		'peak_rss_mb': e['args']['peak_rss_mb'],
+		'peak_scope': e['args']['peak_scope'],
+		'depth': e['args']['depth'],
+		'pid': e['pid'],
+		'tid': e['tid'],
+		} for e in tr['traceEvents'] if e.get('ph') == 'X']
+
+	return evts, meta
+
+def compare(old, new, by = ('name',), threshold = 1.2):
+	'''
+	Compares two profiles stage by stage, as `benchmarks.compare` does for
+	benchmark runs
+
+	Parameters
+	----------
+	old, new : list
+		Stages, as returned by `events` or `load`
+
+	by : tuple
+		Grouping, as in `summary`
+
+	threshold : float
+		Ratio of new to old self time (or peak RSS) above which a stage is
+		flagged as a slowdown; defaults to 1.2
+
+	Returns
+	-------
+	cmp : pd.DataFrame
+		Table indexed by `by` with old and new self time and peak RSS, their
+		ratios, and a 'regression' flag
+	'''
+
+	a = summary(old, by)[['self', 'peak_rss_mb']]
+	b = summary(new, by)[['self', 'peak_rss_mb']]
+
+	cmp = a.join(b, how = 'inner', lsuffix = '_old', rsuffix = '_new')
+
+	cmp['time_ratio'] = cmp['self_new']/cmp['self_old']
+	cmp['mem_ratio'] = cmp['peak_rss_mb_new']/cmp['peak_rss_mb_old']
+	cmp['regression'] = (cmp['time_ratio'] > threshold) | \
+		(cmp['mem_ratio'] > threshold)
+
+	return cmp.sort_values('time_ratio', ascending = False)
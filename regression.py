@@ -0,0 +1,474 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: BATCHED REGRESSIONS
+
+#import packages
+import warnings
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+#define functions
+def group_bounds(groups):
+	'''
+	Sorts group labels and finds the start of each group
+
+	Parameters
+	----------
+	groups : array-like
+		Group label of each row
+
+	Returns
+	-------
+	order : np.array
+		Stable sort order of the rows, or None if `groups` is already sorted
+
+	keys : np.array
+		Unique group labels, in sorted order
+
+	starts : np.array
+		Index of the first (sorted) row of each group
+	'''
+
+	groups = np.asarray(groups)
+	order = None
+
+	#only sort if needed; exp_nr is already sorted in the compilation
+	if len(groups) > 1 and (groups[1:] < groups[:-1]).any():
+		order = np.argsort(groups, kind = 'stable')
+		groups = groups[order]
+
+	starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+	return order, groups[starts], starts
+
+def _segment_sums(a, starts):
+	'''
+	Sums `a` along its last axis within each segment starting at `starts`
+	'''
+
+	if a.shape[-1] == 0:
+		return np.zeros(a.shape[:-1] + (0,))
+
+	return np.add.reduceat(a, starts, axis = -1)
+
+def _prepare(x, y, groups):
+	'''
+	Drops missing x, y pairs and sorts rows into contiguous groups
+
+	Returns the sorted x and y, the group labels, the start of each group,
+	and the number of rows in each group.
+	'''
+
+	x = np.asarray(x, dtype = float)
+	y = np.asarray(y, dtype = float)
+	groups = np.asarray(groups)
+
+	#drop missing pairs
+	ok = ~(np.isnan(x) | np.isnan(y))
+	if not ok.all():
+		x, y, groups = x[ok], y[ok], groups[ok]
+
+	#sort into contiguous groups
+	order, keys, starts = group_bounds(groups)
+	if order is not None:
+		x, y = x[order], y[order]
+
+	n = np.diff(np.r_[starts, x.shape[-1]])
+
+	return x, y, keys, starts, n
+
+def _centered_sums(x, y, starts, n):
+	'''
+	Group means and centered sums of squares and cross products
+
+	Works along the last axis, so leading axes (e.g., bootstrap replicates)
+	are handled in the same pass.
+	'''
+
+	mx = _segment_sums(x, starts) / n
+	my = _segment_sums(y, starts) / n
+
+	dx = x - np.repeat(mx, n, axis = -1)
+	dy = y - np.repeat(my, n, axis = -1)
+
+	sxx = _segment_sums(dx*dx, starts)
+	sxy = _segment_sums(dx*dy, starts)
+	syy = _segment_sums(dy*dy, starts)
+
+	return mx, my, sxx, sxy, syy
+
+def regress_groups(x, y, groups, screen = False, n_min = 3, r2_min = 0.8):
+	'''
+	Ordinary least-squares regression of y on x within every group at once
+
+	All groups are fit in a single vectorized pass using segmented sums over
+	the group-sorted rows, with sums taken about each group mean for numerical
+	stability. Rows where x or y is NaN are ignored.
+
+	Parameters
+	----------
+	x : array-like
+		Independent variable
+
+	y : array-like
+		Dependent variable
+
+	groups : array-like
+		Group label of each row (e.g., exp_nr)
+
+	screen : bool
+		If True, drops groups with fewer than `n_min` points or r2 below
+		`r2_min`
+
+	n_min : int
+		Minimum number of points when screening; defaults to 3
+
+	r2_min : float
+		Minimum r2 when screening; defaults to 0.8
+
+	Returns
+	-------
+	fits : pd.DataFrame
+		Table indexed by group with columns 'slope', 'intercept', 'r2', 'n',
+		and 'slope_se'. Slopes are NaN for groups with fewer than 2 points or
+		no spread in x; slope standard errors are NaN for fewer than 3 points.
+	'''
+
+	x, y, keys, starts, n = _prepare(x, y, groups)
+
+	#group means, then centered sums of squares and cross products
+	mx, my, sxx, sxy, syy = _centered_sums(x, y, starts, n)
+
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+
+		m = sxy / sxx
+		b = my - m*mx
+		r2 = np.clip(sxy**2 / (sxx*syy), 0, 1)
+
+		#standard error of the slope from the residual variance
+		dof = np.where(n > 2, n - 2, np.nan)
+		sse = np.clip(syy - m*sxy, 0, None)
+		se = np.sqrt(sse / dof / sxx)
+
+	m[n < 2] = np.nan
+	b[n < 2] = np.nan
+
+	fits = pd.DataFrame(
+		{'slope': m, 'intercept': b, 'r2': r2, 'n': n, 'slope_se': se},
+		index = keys,
+		)
+
+	if screen:
+		fits = fits[(fits['n'] >= n_min) & (fits['r2'] >= r2_min)]
+
+	return fits
+
+def _boot_chunks(seeds, sizes, x, y, starts, n):
+	'''
+	Bootstrap slopes for a list of replicate chunks, shape (sum(sizes), G)
+
+	Each chunk draws from its own seeded stream, so results do not depend on
+	how chunks are split among workers.
+	'''
+
+	#group start and size of every row
+	gid = np.repeat(np.arange(len(n)), n)
+	base = starts[gid]
+	nn = n[gid]
+
+	out = []
+
+	for seed, k in zip(seeds, sizes):
+
+		rng = np.random.default_rng(seed)
+
+		#resample rows within each group, for k replicates at once
+		idx = (rng.random((k, len(x)))*nn).astype(np.intp)
+		idx += base
+
+		_, _, sxx, sxy, _ = _centered_sums(x[idx], y[idx], starts, n)
+
+		with np.errstate(divide = 'ignore', invalid = 'ignore'):
+			out.append(sxy / sxx)
+
+	return np.concatenate(out) if out else np.zeros((0, len(n)))
+
+def bootstrap_groups(x, y, groups, n_boot = 10000, ci = 0.95, seed = 0,
+	chunk = None, jobs = 1):
+	'''
+	Bootstrap confidence intervals of the OLS slope of every group at once
+
+	Rows are resampled with replacement within each group and all group
+	slopes are refit for a whole chunk of replicates in one vectorized pass.
+	Each chunk of replicates has its own `np.random.SeedSequence` stream, so
+	results are reproducible and independent of `jobs`.
+
+	Parameters
+	----------
+	x : array-like
+		Independent variable
+
+	y : array-like
+		Dependent variable
+
+	groups : array-like
+		Group label of each row (e.g., exp_nr)
+
+	n_boot : int
+		Number of bootstrap replicates; defaults to 10000
+
+	ci : float
+		Confidence interval width; defaults to 0.95
+
+	seed : int
+		Seed of the root `np.random.SeedSequence`; defaults to 0
+
+	chunk : int or None
+		Replicates per chunk; defaults to about 2 million resampled rows per
+		chunk
+
+	jobs : int
+		Number of worker processes; defaults to 1 (this process)
+
+	Returns
+	-------
+	cis : pd.DataFrame
+		Table indexed by group with columns 'slope' (point estimate),
+		'slope_lo', and 'slope_hi' (percentile interval)
+
+	draws : np.array
+		Bootstrap slopes, shape (n_boot, number of groups); replicates where a
+		resampled group has no spread in x are NaN
+	'''
+
+	x, y, keys, starts, n = _prepare(x, y, groups)
+
+	if chunk is None:
+		chunk = max(1, int(2e6 // max(len(x), 1)))
+
+	nc = int(np.ceil(n_boot/chunk))
+	seeds = np.random.SeedSequence(seed).spawn(nc)
+	sizes = [chunk]*(nc - 1) + [n_boot - chunk*(nc - 1)]
+
+	if jobs <= 1 or nc == 1:
+		draws = _boot_chunks(seeds, sizes, x, y, starts, n)
+
+	else:
+		#contiguous blocks of chunks keep replicate order fixed
+		blocks = np.array_split(np.arange(nc), min(jobs, nc))
+
+		with ProcessPoolExecutor(max_workers = len(blocks)) as ex:
+			futs = [
+				ex.submit(_boot_chunks, [seeds[i] for i in bl],
+					[sizes[i] for i in bl], x, y, starts, n)
+				for bl in blocks
+				]
+			draws = np.concatenate([f.result() for f in futs])
+
+	_, _, sxx, sxy, _ = _centered_sums(x, y, starts, n)
+
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		m = sxy / sxx
+
+	a = 100*(1 - ci)/2
+
+	#groups whose every replicate is NaN (e.g., n = 1) warn here
+	with np.errstate(invalid = 'ignore'), warnings.catch_warnings():
+		warnings.simplefilter('ignore', RuntimeWarning)
+		lo, hi = np.nanpercentile(draws, [a, 100 - a], axis = 0)
+
+	cis = pd.DataFrame(
+		{'slope': m, 'slope_lo': lo, 'slope_hi': hi},
+		index = keys,
+		)
+
+	return cis, draws
+
+def _york_terms(b, n, x, y, wx, wy, r, al):
+	'''
+	York weights W, their group sums, the weighted group means of x and y,
+	the centered x and y (U, V), and beta, for the slope b of each group
+	and its n contiguous rows; r and al are None for uncorrelated errors
+	'''
+
+	starts = np.r_[0, np.cumsum(n)[:-1]]
+	bb = np.repeat(b, n)
+
+	if r is None:
+		W = wx*wy / (wx + bb**2*wy)
+	else:
+		W = wx*wy / (wx + bb**2*wy - 2*bb*r*al)
+
+	sw = _segment_sums(W, starts)
+	xm = _segment_sums(W*x, starts) / sw
+	ym = _segment_sums(W*y, starts) / sw
+
+	U = x - np.repeat(xm, n)
+	V = y - np.repeat(ym, n)
+
+	if r is None:
+		beta = W*(U/wy + bb*V/wx)
+	else:
+		beta = W*(U/wy + bb*V/wx - (bb*U + V)*r/al)
+
+	return W, sw, xm, ym, U, V, beta
+
+def york_groups(x, y, sx, sy, groups, r = 0, tol = 1e-10, max_iter = 100,
+	screen = False, n_min = 3, r2_min = 0.8):
+	'''
+	York (2004) errors-in-variables regression of y on x within every group
+	at once
+
+	Every group starts from its OLS slope. Each iteration then recomputes
+	the York weights, weighted means, and slope of all unconverged groups in
+	one vectorized pass over their rows; groups drop out once their slope
+	changes by less than `tol` (relative), so the iteration runs in lockstep
+	with a per-group convergence mask. Rows where x, y, or either
+	uncertainty is NaN, or an uncertainty is not positive, are ignored.
+
+	Parameters
+	----------
+	x : array-like
+		Independent variable
+
+	y : array-like
+		Dependent variable
+
+	sx, sy : array-like
+		One-sigma uncertainties of x and y
+
+	groups : array-like
+		Group label of each row (e.g., exp_nr)
+
+	r : float or array-like
+		Correlation of the x and y errors of each row; defaults to 0
+
+	tol : float
+		Relative slope change at which a group has converged
+
+	max_iter : int
+		Maximum number of iterations
+
+	screen : bool
+		If True, drops groups with fewer than `n_min` points or r2 below
+		`r2_min`
+
+	n_min : int
+		Minimum number of points when screening; defaults to 3
+
+	r2_min : float
+		Minimum r2 when screening; defaults to 0.8
+
+	Returns
+	-------
+	fits : pd.DataFrame
+		Table indexed by group with columns 'slope', 'intercept',
+		'slope_se' and 'intercept_se' (York's standard errors from the
+		input uncertainties, not scaled by the MSWD), 'mswd', 'r2'
+		(unweighted, as in `regress_groups`), 'n', 'n_iter', and
+		'converged'. Slopes are NaN for groups with fewer than 2 points or
+		no spread in x; MSWDs are NaN for fewer than 3 points.
+	'''
+
+	x, y, sx, sy, r = np.broadcast_arrays(*(np.asarray(a, dtype = float)
+		for a in (x, y, sx, sy, r)))
+	groups = np.asarray(groups)
+
+	#drop missing values and unusable uncertainties
+	with np.errstate(invalid = 'ignore'):
+		ok = np.isfinite(x) & np.isfinite(y) & (sx > 0) & (sy > 0) & \
+			np.isfinite(r)
+	x, y, sx, sy, r, groups = (a[ok] for a in (x, y, sx, sy, r, groups))
+
+	#sort into contiguous groups
+	order, keys, starts = group_bounds(groups)
+	if order is not None:
+		x, y, sx, sy, r = (a[order] for a in (x, y, sx, sy, r))
+
+	n = np.diff(np.r_[starts, x.shape[-1]])
+
+	wx, wy = 1/sx**2, 1/sy**2
+
+	#uncorrelated errors skip the correlation terms
+	if r.any():
+		al = np.sqrt(wx*wy)
+	else:
+		r = al = None
+
+	#OLS starting slopes
+	_, _, sxx, sxy, syy = _centered_sums(x, y, starts, n)
+
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		b = sxy / sxx
+		r2 = np.clip(sxy**2 / (sxx*syy), 0, 1)
+
+	b[n < 2] = np.nan
+
+	n_iter = np.zeros(len(n), dtype = int)
+	conv = ~np.isfinite(b)
+
+	#iterate all unconverged groups together; the working rows are
+	# compacted to the active groups whenever fewer than half remain active
+	cur = np.flatnonzero(np.isfinite(b))
+	act = np.ones(len(cur), dtype = bool)
+	rows = np.repeat(np.isfinite(b), n)
+	wk = [a if a is None else a[rows] for a in (x, y, wx, wy, r, al)]
+	nk = n[cur]
+	st = np.r_[0, np.cumsum(nk)[:-1]]
+
+	for it in range(max_iter):
+
+		if not act.any():
+			break
+
+		W, _, _, _, U, V, beta = _york_terms(b[cur], nk, *wk)
+
+		with np.errstate(divide = 'ignore', invalid = 'ignore'):
+			bn = _segment_sums(W*beta*V, st) / _segment_sums(W*beta*U, st)
+
+		g = cur[act]
+		done = np.abs(bn[act] - b[g]) <= tol*np.abs(bn[act])
+		b[g] = bn[act]
+		n_iter[g] = it + 1
+		conv[g[done]] = True
+
+		#non-finite slopes cannot recover
+		act[act] = ~done & np.isfinite(bn[act])
+
+		if nk[act].sum() < len(wk[0])/2:
+			rows = np.repeat(act, nk)
+			wk = [a if a is None else a[rows] for a in wk]
+			cur, nk = cur[act], nk[act]
+			act = np.ones(len(cur), dtype = bool)
+			st = np.r_[0, np.cumsum(nk)[:-1]]
+
+	#final weights, intercepts, and uncertainties of every group
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+
+		W, sw, xm, ym, U, V, beta = _york_terms(b, n, x, y, wx, wy, r, al)
+		a = ym - b*xm
+
+		#adjusted x values and their weighted spread
+		xa = np.repeat(xm, n) + beta
+		xam = _segment_sums(W*xa, starts) / sw
+		u = xa - np.repeat(xam, n)
+
+		sb = np.sqrt(1 / _segment_sums(W*u**2, starts))
+		sa = np.sqrt(1/sw + xam**2*sb**2)
+
+		res = y - np.repeat(b, n)*x - np.repeat(a, n)
+		dof = np.where(n > 2, n - 2, np.nan)
+		mswd = _segment_sums(W*res**2, starts) / dof
+
+	fits = pd.DataFrame(
+		{'slope': b, 'intercept': a, 'slope_se': sb, 'intercept_se': sa,
+		'mswd': mswd, 'r2': r2, 'n': n, 'n_iter': n_iter,
+		'converged': conv & np.isfinite(b)},
+		index = keys,
+		)
+
+	if screen:
+		fits = fits[(fits['n'] >= n_min) & (fits['r2'] >= r2_min)]
+
+	return fits
@@ -0,0 +1,471 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: GEOSPATIAL INDEX
+
+#import packages
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+#mean Earth radius, km
+R_EARTH = 6371.0088
+
+#define functions
+def haversine(lat1, lon1, lat2, lon2):
+	'''
+	Great-circle distance between points, in km
+
+	Parameters
+	----------
+	lat1, lon1 : array-like
+		Latitude and longitude of the first points, in decimal degrees
+
+	lat2, lon2 : array-like
+		Latitude and longitude of the second points, in decimal degrees
+
+	Returns
+	-------
+	d : np.array
+		Distances, in km
+	'''
+
+	lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+
+	a = np.sin((lat2 - lat1)/2)**2 + \
+		np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+
+	return 2*R_EARTH*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def _cell_ids(lat, lon, res):
+	'''
+	Grid cell of each point; cells are numbered row-major from (-90, -180)
+	'''
+
+	nlon = int(np.ceil(360/res))
+	nlat = int(np.ceil(180/res))
+
+	i = np.clip(((np.asarray(lat) + 90)//res).astype(np.int64), 0, nlat - 1)
+	j = np.clip(((np.asarray(lon) + 180)//res).astype(np.int64), 0, nlon - 1)
+
+	return i*nlon + j, nlon
+
+def build_geo_index(lat, lon, res = 1.0):
+	'''
+	Builds a sparse lat/long grid index over a set of points
+
+	Points are sorted by grid cell, so every run of cells along a row of
+	latitude is one contiguous slice of the sorted rows and can be found
+	with two binary searches. Points with missing coordinates are skipped.
+
+	Parameters
+	----------
+	lat : array-like
+		Latitude of each row (e.g., 'lat_N_dd'), in decimal degrees
+
+	lon : array-like
+		Longitude of each row (e.g., 'long_E_dd'), in decimal degrees
+
+	res : float
+		Grid cell size, in degrees; defaults to 1
+
+	Returns
+	-------
+	index : dict
+		Index arrays: 'lat' and 'lon' (all rows), 'order' (valid rows sorted
+		by cell), 'cells' (sorted cell ids), 'res', and 'nlon'
+	'''
+
+	lat = np.asarray(lat, dtype = float)
+	lon = np.asarray(lon, dtype = float)
+
+	#wrap longitudes into [-180, 180)
+	lon = (lon + 180) % 360 - 180
+
+	rows = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+	cells, nlon = _cell_ids(lat[rows], lon[rows], res)
+
+	o = np.argsort(cells, kind = 'stable')
+
+	index = {
+		'lat': lat,
+		'lon': lon,
+		'order': rows[o],
+		'cells': cells[o],
+		'res': float(res),
+		'nlon': nlon,
+		}
+
+	return index
+
+def _candidates(index, lat_min, lat_max, lon_min, lon_max):
+	'''
+	Rows in every grid cell overlapping a box that does not cross the
+	antimeridian
+	'''
+
+	res, nlon = index['res'], index['nlon']
+	nlat = int(np.ceil(180/res))
+
+	i0 = max(int((lat_min + 90)//res), 0)
+	i1 = min(int((lat_max + 90)//res), nlat - 1)
+	j0 = max(int((lon_min + 180)//res), 0)
+	j1 = min(int((lon_max + 180)//res), nlon - 1)
+
+	if i1 < i0 or j1 < j0:
+		return np.zeros(0, dtype = np.int64)
+
+	#one contiguous slice of sorted rows per row of latitude
+	ii = np.arange(i0, i1 + 1)
+	a = np.searchsorted(index['cells'], ii*nlon + j0, side = 'left')
+	b = np.searchsorted(index['cells'], ii*nlon + j1, side = 'right')
+
+	keep = b > a
+	if not keep.any():
+		return np.zeros(0, dtype = np.int64)
+
+	a, b = a[keep], b[keep]
+
+	#concatenate slices without a Python loop
+	n = b - a
+	pos = np.repeat(a - np.r_[0, np.cumsum(n)[:-1]], n) + np.arange(n.sum())
+
+	return index['order'][pos]
+
+def query_bbox(index, lat_min, lat_max, lon_min, lon_max):
+	'''
+	Rows inside a lat/long bounding box
+
+	Parameters
+	----------
+	index : dict
+		Geospatial index, as returned by `build_geo_index`
+
+	lat_min, lat_max : float
+		Latitude bounds, in decimal degrees
+
+	lon_min, lon_max : float
+		Longitude bounds, in decimal degrees; if lon_min > lon_max, the box
+		crosses the antimeridian
+
+	Returns
+	-------
+	rows : np.array
+		Sorted positional row indices
+	'''
+
+	lon_min = (lon_min + 180) % 360 - 180 if lon_min != 180 else 180
+	lon_max = (lon_max + 180) % 360 - 180 if lon_max != 180 else 180
+
+	if lon_min <= lon_max:
+		boxes = [(lon_min, lon_max)]
+	else:
+		boxes = [(lon_min, 180), (-180, lon_max)]
+
+	out = []
+
+	for lo, hi in boxes:
+
+		c = _candidates(index, lat_min, lat_max, lo, hi)
+		la, ln = index['lat'][c], index['lon'][c]
+
+		out.append(c[(la >= lat_min) & (la <= lat_max) & (ln >= lo) & (ln <= hi)])
+
+	return np.sort(np.concatenate(out))
+
+def _radius_candidates(index, lat, lon, radius):
+	'''
+	Rows in every grid cell overlapping the bounding box of a circle
+	'''
+
+	ang = radius/R_EARTH
+	dlat = np.degrees(ang)
+	lat_min, lat_max = max(lat - dlat, -90), min(lat + dlat, 90)
+
+	#circles reaching a pole (or wider than a hemisphere) span every longitude
+	if lat_min <= -90 or lat_max >= 90 or ang >= np.pi/2 \
+		or np.sin(ang) >= np.cos(np.radians(lat)):
+		return _candidates(index, lat_min, lat_max, -180, 180)
+
+	dlon = np.degrees(np.arcsin(np.sin(ang)/np.cos(np.radians(lat))))
+	lo = (lon - dlon + 180) % 360 - 180
+	hi = (lon + dlon + 180) % 360 - 180
+
+	if lo <= hi:
+		return _candidates(index, lat_min, lat_max, lo, hi)
+
+	return np.concatenate([
+		_candidates(index, lat_min, lat_max, lo, 180),
+		_candidates(index, lat_min, lat_max, -180, hi),
+		])
+
+def query_radius(index, lat, lon, radius, return_distance = False):
+	'''
+	Rows within a great-circle radius of a point
+
+	Parameters
+	----------
+	index : dict
+		Geospatial index, as returned by `build_geo_index`
+
+	lat, lon : float
+		Query point, in decimal degrees
+
+	radius : float
+		Search radius, in km
+
+	return_distance : bool
+		If True, also returns the distance of each row
+
+	Returns
+	-------
+	rows : np.array
+		Positional row indices, sorted by distance
+
+	d : np.array
+		Distances in km (only if `return_distance`)
+	'''
+
+	c = _radius_candidates(index, lat, lon, radius)
+	d = haversine(lat, lon, index['lat'][c], index['lon'][c])
+
+	keep = d <= radius
+	c, d = c[keep], d[keep]
+
+	o = np.argsort(d, kind = 'stable')
+
+	return (c[o], d[o]) if return_distance else c[o]
+
+def query_knn(index, lat, lon, k = 1, sites = False, return_distance = False):
+	'''
+	The k nearest rows (or sites) to a point
+
+	The search radius starts at one grid cell and doubles until it holds k
+	rows (or sites), so the result is exact.
+
+	Parameters
+	----------
+	index : dict
+		Geospatial index, as returned by `build_geo_index`
+
+	lat, lon : float
+		Query point, in decimal degrees
+
+	k : int
+		Number of neighbors; defaults to 1
+
+	sites : bool
+		If True, returns every row at the k nearest distinct coordinates
+		rather than the k nearest rows; defaults to False
+
+	return_distance : bool
+		If True, also returns the distance of each row
+
+	Returns
+	-------
+	rows : np.array
+		Positional row indices, sorted by distance
+
+	d : np.array
+		Distances in km (only if `return_distance`)
+	'''
+
+	n = len(index['order'])
+	radius = index['res']*111.2
+
+	while True:
+
+		rows, d = query_radius(index, lat, lon, radius, return_distance = True)
+
+		if sites:
+			key = index['lat'][rows] + 1j*index['lon'][rows]
+			_, first = np.unique(key, return_index = True)
+			found = len(first)
+		else:
+			found = len(rows)
+
+		if found >= k or len(rows) == n or radius >= np.pi*R_EARTH:
+			break
+
+		radius *= 2
+
+	if sites:
+		#rows at the first k distinct sites in distance order
+		key = index['lat'][rows] + 1j*index['lon'][rows]
+		_, inv = np.unique(key, return_inverse = True)
+		_, first = np.unique(inv, return_index = True)
+		rank = np.empty(len(first), dtype = np.int64)
+		rank[np.argsort(first)] = np.arange(len(first))
+		keep = rank[inv] < k
+	else:
+		keep = np.arange(len(rows)) < k
+
+	rows, d = rows[keep], d[keep]
+
+	return (rows, d) if return_distance else rows
+
+def cell_stats(index, values, res = None):
+	'''
+	Aggregates a value column over grid cells
+
+	Parameters
+	----------
+	index : dict
+		Geospatial index, as returned by `build_geo_index`
+
+	values : array-like
+		Value of each row (e.g., Dp17O), aligned with the indexed table
+
+	res : float or None
+		Cell size, in degrees; defaults to the index resolution. Any
+		resolution can be used, giving coarser or finer summaries.
+
+	Returns
+	-------
+	stats : pd.DataFrame
+		Table indexed by cell id with columns 'lat' and 'lon' (cell centers),
+		'count', 'mean', 'median', 'min', and 'max'; rows with missing values
+		are not counted
+	'''
+
+	res = index['res'] if res is None else float(res)
+	values = np.asarray(values, dtype = float)
+
+	rows = index['order']
+	rows = rows[np.isfinite(values[rows])]
+
+	cells, nlon = _cell_ids(index['lat'][rows], index['lon'][rows], res)
+	v = values[rows]
+
+	#sort by cell, then value within cell, for medians
+	o = np.lexsort((v, cells))
+	cells, v = cells[o], v[o]
+
+	starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+	n = np.diff(np.r_[starts, len(v)])
+
+	if len(v) == 0:
+		starts = np.zeros(0, dtype = np.int64)
+
+	mid = starts + (n - 1)//2
+	med = np.where(n % 2, v[mid], (v[mid] + v[np.minimum(mid + 1, len(v) - 1)])/2)
+
+	ids = cells[starts]
+
+	stats = pd.DataFrame({
+		'lat': (ids // nlon + 0.5)*res - 90,
+		'lon': (ids % nlon + 0.5)*res - 180,
+		'count': n,
+		'mean': np.add.reduceat(v, starts)/n if len(v) else [],
+		'median': med,
+		'min': np.minimum.reduceat(v, starts) if len(v) else [],
+		'max': np.maximum.reduceat(v, starts) if len(v) else [],
+		}, index = pd.Index(ids, name = 'cell'))
+
+	return stats
+
+def save_geo_index(index, fname, meta = None):
+	'''
+	Saves a geospatial index to an npz file
+
+	Parameters
+	----------
+	index : dict
+		Geospatial index, as returned by `build_geo_index`
+
+	fname : str
+		Output file
+
+	meta : dict or None
+		Extra metadata (e.g., the source hash) stored with the index
+	'''
+
+	np.savez(fname,
+		lat = index['lat'],
+		lon = index['lon'],
+		order = index['order'],
+		cells = index['cells'],
+		res = index['res'],
+		nlon = index['nlon'],
+		meta = json.dumps(meta or {}),
+		)
+
+def read_geo_index(fname):
+	'''
+	Reads a geospatial index saved with `save_geo_index`
+
+	Returns
+	-------
+	index : dict
+		Geospatial index
+
+	meta : dict
+		Stored metadata
+	'''
+
+	with np.load(fname) as f:
+		index = {
+			'lat': f['lat'],
+			'lon': f['lon'],
+			'order': f['order'],
+			'cells': f['cells'],
+			'res': float(f['res']),
+			'nlon': int(f['nlon']),
+			}
+		meta = json.loads(str(f['meta']))
+
+	return index, meta
+
+def load_geo_index(name, path = None, cache_dir = None, res = 1.0):
+	'''
+	Loads the geospatial index of a table, rebuilding it if the csv changed
+
+	The index is stored with the table cache (see `table_cache.py`) and is
+	keyed on the same source hash, so it is rebuilt exactly when the cached
+	table is.
+
+	Parameters
+	----------
+	name : str
+		Table name with 'lat_N_dd' and 'long_E_dd' columns: 'atmos' or 'so4'
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	cache_dir : str or None
+		Cache directory; defaults to '.table_cache' within the data directory
+
+	res : float
+		Grid cell size, in degrees; defaults to 1
+
+	Returns
+	-------
+	index : dict
+		Geospatial index
+	'''
+
+	import table_cache
+
+	#bring the table cache up to date; its metadata holds the source hash
+	if not table_cache.is_fresh(name, path = path, cache_dir = cache_dir):
+		table_cache.build_cache(name, path = path, cache_dir = cache_dir)
+
+	_, data, meta = table_cache.cache_paths(name, path = path,
+		cache_dir = cache_dir)
+
+	with open(meta) as f:
+		sha1 = json.load(f)['sha1']
+
+	fname = os.path.join(os.path.dirname(data), name + '.geo.npz')
+
+	if os.path.exists(fname):
+		index, m = read_geo_index(fname)
+		if m.get('sha1') == sha1 and index['res'] == float(res):
+			return index
+
+	df = table_cache.read_cached(name, path = path, cache_dir = cache_dir,
+		columns = ['lat_N_dd', 'long_E_dd'])
+
+	index = build_geo_index(df['lat_N_dd'], df['long_E_dd'], res = res)
+	save_geo_index(index, fname, meta = {'sha1': sha1})
+
+	return index
@@ -0,0 +1,314 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: SYNTHETIC COMPILATIONS
+
+#import packages
+import os
+import shutil
+
+import numpy as np
+
+import analysis_code as ac
+from regression import regress_groups
+
+#tables the generator can make
+SYNTHETIC = ['exp', 'atmos', 'so4', 'standards']
+
+#rows per generated chunk
+CHUNK = 10**6
+
+#define functions
+def _sd(v, sd, rel = 0.01, floor = 0.02):
+	'''
+	Jitter size of each value: its reported std, else a small fraction of it
+	'''
+
+	sd = np.asarray(sd, dtype = float)
+	alt = rel*np.abs(np.nan_to_num(v)) + floor
+
+	return np.where(np.isfinite(sd) & (sd > 0), sd, alt)
+
+def _jitter(rng, out, src, rows, lam):
+	'''
+	Jitters isotope values in place, moving d17O along a line of slope `lam`
+	so that each group's three-isotope slope is kept
+	'''
+
+	if 'd18O_mean' in out.columns:
+
+		d = src['d18O_mean'].to_numpy(dtype = float)[rows]
+		e = rng.standard_normal(len(rows))*_sd(d,
+			src['d18O_std'].to_numpy(dtype = float)[rows])
+		out['d18O_mean'] = d + e
+
+		if 'd17O_mean' in out.columns:
+			d17 = src['d17O_mean'].to_numpy(dtype = float)[rows]
+			out['d17O_mean'] = d17 + lam*e + \
+				0.005*rng.standard_normal(len(rows))
+
+	if 'Dp17O_5305_mean' in out.columns:
+
+		D = src['Dp17O_5305_mean'].to_numpy(dtype = float)[rows]
+		out['Dp17O_5305_mean'] = D + rng.standard_normal(len(rows))*_sd(D,
+			src['Dp17O_5305_std'].to_numpy(dtype = float)[rows], rel = 0,
+			floor = 0.01)
+
+def _jitter_coords(rng, out, spread):
+	'''
+	Jitters lat/long by `spread` degrees, keeping them on the globe
+	'''
+
+	for c in ['lat_N_dd', 'long_E_dd']:
+		if c in out.columns:
+			out[c] = out[c].to_numpy(dtype = float) + \
+				spread*rng.standard_normal(len(out))
+
+	if 'lat_N_dd' in out.columns:
+		out['lat_N_dd'] = out['lat_N_dd'].clip(-90, 90)
+		out['long_E_dd'] = (out['long_E_dd'] + 180) % 360 - 180
+
+def _exp_slopes(src):
+	'''
+	Raw d17O vs. d18O slope of each experiment, 0.5305 where it cannot be fit
+	'''
+
+	fit = regress_groups(
+		src['d18O_mean'].to_numpy(dtype = float),
+		src['d17O_mean'].to_numpy(dtype = float),
+		src['exp_nr'].to_numpy(),
+		)
+
+	return fit['slope'].fillna(0.5305)
+
+def generate(name, n, chunk = CHUNK, seed = 0, source = None, path = None,
+	spread = 0.25):
+	'''
+	Streams a synthetic table with the schema and group structure of a real
+	one
+
+	Rows are resampled from the real table and jittered within their
+	reported uncertainty, so joint frequencies (species, lab x lithology,
+	age, location) are those of the real compilation. Experiments are
+	resampled whole: each synthetic experiment copies the type, compound,
+	wavelength, temperature, and size of a real one and gets a new 'exp_nr',
+	and its rows are jittered along that experiment's own three-isotope
+	slope. Standards are resampled as replicates under their own names.
+
+	Each chunk draws from its own stream of `np.random.SeedSequence(seed)`,
+	so the output is reproducible for a given seed and chunk size. An
+	experiment that does not fit in a chunk continues at the start of the
+	next one.
+
+	Parameters
+	----------
+	name : str
+		Table name: 'exp', 'atmos', 'so4', or 'standards'
+
+	n : int
+		Number of rows; the last experiment is cut short if needed
+
+	chunk : int
+		Rows per chunk; defaults to `CHUNK`
+
+	seed : int
+		Random seed; defaults to 0
+
+	source : pd.DataFrame or None
+		Real table to mimic; defaults to `analysis_code.read_table(name)`
+
+	path : str or None
+		Data directory of the real table; defaults to `analysis_code.path`
+
+	spread : float
+		Standard deviation of the lat/long jitter, in degrees; defaults to
+		0.25
+
+	Yields
+	------
+	df : pd.DataFrame
+		Chunk of at most `chunk` rows, with the columns (and, for
+		'standards', the index) of the real table
+	'''
+
+	if name not in SYNTHETIC:
+		raise ValueError('cannot generate table %r' % name)
+
+	src = ac.read_table(name, path = path) if source is None else source
+	idx_name = src.index.name
+	src = src.reset_index() if name == 'standards' else \
+		src.reset_index(drop = True)
+
+	n_chunks = int(np.ceil(n/chunk))
+	streams = np.random.SeedSequence(seed).spawn(n_chunks)
+
+	if name == 'exp':
+		nr = src['exp_nr'].to_numpy()
+		keys, first, size = np.unique(nr, return_index = True,
+			return_counts = True)
+		order = np.argsort(nr, kind = 'stable')
+		starts = np.r_[0, np.cumsum(size)[:-1]]
+		lam_by_exp = _exp_slopes(src).reindex(keys).to_numpy()
+		next_nr = 1
+
+		#rows, exp_nr, and slope of an experiment continued from one chunk
+		# into the next
+		carry = np.zeros(0, dtype = np.int64)
+		carry_nr = np.zeros(0, dtype = np.int64)
+		carry_lam = np.zeros(0)
+
+	done = 0
+
+	for k, ss in enumerate(streams):
+
+		rng = np.random.default_rng(ss)
+		m = min(chunk, n - done)
+
+		if name == 'exp':
+
+			#rows of the experiment cut at the end of the last chunk come
+			# first, then whole experiments are drawn until the chunk is full
+			need = m - len(carry)
+			picks = []
+			total = 0
+			while total < need:
+				p = rng.integers(len(keys), size = max(8,
+					int(1.2*(need - total)/size.mean())))
+				picks.append(p)
+				total += size[p].sum()
+
+			p = np.concatenate(picks) if picks else np.zeros(0, dtype = int)
+			p = p[:np.searchsorted(np.cumsum(size[p]), need) + 1]
+
+			reps = size[p]
+			rows = order[np.repeat(starts[p], reps) +
+				np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps)]
+			new_nr = np.repeat(np.arange(next_nr, next_nr + len(p)), reps)
+			lam = np.repeat(lam_by_exp[p], reps)
+			next_nr += len(p)
+
+			rows = np.r_[carry, rows]
+			new_nr = np.r_[carry_nr, new_nr]
+			lam = np.r_[carry_lam, lam]
+
+			#the rest of the last experiment goes to the next chunk
+			carry, carry_nr, carry_lam = rows[m:], new_nr[m:], lam[m:]
+			rows, new_nr, lam = rows[:m], new_nr[:m], lam[:m]
+
+			out = src.iloc[rows].reset_index(drop = True)
+			out['exp_nr'] = new_nr
+
+		else:
+			rows = rng.integers(len(src), size = m)
+			out = src.iloc[rows].reset_index(drop = True)
+			lam = 0.5305
+
+		_jitter(rng, out, src, rows, lam)
+		_jitter_coords(rng, out, spread)
+
+		if 'age_Ma' in out.columns:
+			out['age_Ma'] = np.maximum(out['age_Ma'].to_numpy(dtype = float)*
+				(1 + 0.02*rng.standard_normal(m)), 0)
+
+		if 'sample_ID' in out.columns:
+			out['sample_ID'] = ['syn-%d' % i for i in range(done, done + m)]
+
+		if name == 'standards':
+			out = out.set_index(out.columns[0])
+			out.index.name = idx_name
+
+		done += m
+
+		yield out
+
+def write_table(name, n, fname, chunk = CHUNK, seed = 0, source = None,
+	path = None):
+	'''
+	Writes a synthetic table to csv one chunk at a time
+
+	Parameters
+	----------
+	name : str
+		Table name: 'exp', 'atmos', 'so4', or 'standards'
+
+	n : int
+		Number of rows
+
+	fname : str
+		Output csv, written in the encoding of the real table (see
+		`analysis_code.ENCODINGS`)
+
+	chunk, seed, source, path :
+		As in `generate`
+
+	Returns
+	-------
+	fname : str
+		Output csv
+	'''
+
+	with open(fname, 'w', encoding = ac.ENCODINGS[name], newline = '') as f:
+		for i, df in enumerate(generate(name, n, chunk = chunk, seed = seed,
+			source = source, path = path)):
+
+			df.to_csv(f,
+				header = i == 0,
+				index = name == 'standards',
+				lineterminator = '\n',
+				)
+
+	return fname
+
+def write_database(outdir, scale = None, sizes = None, chunk = CHUNK,
+	seed = 0, path = None):
+	'''
+	Writes a complete synthetic data directory
+
+	The result can be used anywhere a data directory is expected (e.g.,
+	`analysis_code.path`). The reaction-rate table is copied as is.
+
+	Parameters
+	----------
+	outdir : str
+		Output directory
+
+	scale : float or None
+		Size of every table as a multiple of the real one
+
+	sizes : dict or None
+		Rows per table, overriding `scale` for the tables it names
+
+	chunk : int
+		Rows per chunk; defaults to `CHUNK`
+
+	seed : int
+		Random seed; each table gets its own stream
+
+	path : str or None
+		Directory of the real compilations; defaults to `analysis_code.path`
+
+	Returns
+	-------
+	sizes : dict
+		Rows written per table
+	'''
+
+	path = ac.path if path is None else path
+	os.makedirs(outdir, exist_ok = True)
+
+	out = {}
+
+	for i, name in enumerate(SYNTHETIC):
+
+		src = ac.read_table(name, path = path)
+
+		if sizes is not None and name in sizes:
+			n = int(sizes[name])
+		else:
+			n = int(round(len(src)*(1 if scale is None else scale)))
+
+		write_table(name, n, os.path.join(outdir, ac.TABLES[name]),
+			chunk = chunk, seed = [seed, i], source = src)
+
+		out[name] = n
+
+	shutil.copy(os.path.join(path, ac.TABLES['O3_rxn_rates']), outdir)
+
+	return out
@@ -0,0 +1,303 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: BINARY TABLE CACHE
+
+#import packages
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from analysis_code import TABLES, read_table
+
+#bump to invalidate every existing cache file
+CACHE_VERSION = 3
+
+#free-text columns that no figure uses; left out of the cached copy
+SKIPPED = ['notes']
+
+#categorical columns, where present in a table
+CATEGORICALS = [
+	'species',
+	'lithology',
+	'lab',
+	'experiment_type',
+	'compound',
+	'reference',
+	]
+
+#define functions
+def file_hash(fname, blocksize = 2**20):
+	'''
+	Calculates the sha1 hash of a file's contents
+
+	Parameters
+	----------
+	fname : str
+		File to hash
+
+	blocksize : int
+		Number of bytes to read at a time
+
+	Returns
+	-------
+	h : str
+		Hex digest of the file contents
+	'''
+
+	h = hashlib.sha1()
+
+	with open(fname, 'rb') as f:
+		for block in iter(lambda: f.read(blocksize), b''):
+			h.update(block)
+
+	return h.hexdigest()
+
+def cache_paths(name, path = None, cache_dir = None):
+	'''
+	Gets the source csv, cache data, and cache metadata file names of a table
+
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `analysis_code.TABLES`
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	cache_dir : str or None
+		Cache directory; defaults to '.table_cache' within the data directory
+
+	Returns
+	-------
+	src : str
+		Source csv file
+
+	data : str
+		Cached binary table
+
+	meta : str
+		Cache metadata (json) file
+	'''
+
+	if path is None:
+		import analysis_code
+		path = analysis_code.path
+
+	if cache_dir is None:
+		cache_dir = os.path.join(path, '.table_cache')
+
+	src = os.path.join(path, TABLES[name])
+	data = os.path.join(cache_dir, name + '.pkl')
+	meta = os.path.join(cache_dir, name + '.json')
+
+	return src, data, meta
+
+def to_typed(df):
+	'''
+	Converts low-cardinality label columns to categorical dtypes
+
+	Parameters
+	----------
+	df : pd.DataFrame
+		Raw table
+
+	Returns
+	-------
+	df : pd.DataFrame
+		Table with categorical label columns
+	'''
+
+	df = df.copy()
+
+	for c in CATEGORICALS:
+		if c in df.columns:
+			df[c] = df[c].astype('category')
+
+	return df
+
+def _write(df, fname):
+	'''
+	Writes a typed table to the cache
+
+	Tables are pickled rather than written to feather: pandas restores its
+	own column blocks and categoricals directly, while converting Arrow
+	columns back costs ~2-4 ms per table, which for tables of a few
+	thousand rows is most of a csv parse.
+	'''
+
+	df.to_pickle(fname, protocol = 5)
+
+def _read(fname, columns = None):
+	'''
+	Reads a table written by `_write`
+	'''
+
+	df = pd.read_pickle(fname)
+
+	return df if columns is None else df[columns]
+
+def _read_meta(meta):
+	'''
+	Reads cache metadata, returning None if missing or unreadable
+	'''
+
+	try:
+		with open(meta) as f:
+			return json.load(f)
+
+	except (OSError, ValueError):
+		return None
+
+def _write_meta(meta, info):
+	'''
+	Writes cache metadata
+	'''
+
+	with open(meta, 'w') as f:
+		json.dump(info, f, indent = 1)
+
+def _fresh_meta(name, path, cache_dir):
+	'''
+	Cache metadata of a table if its cached copy matches the source csv,
+	else None (see `is_fresh`)
+	'''
+
+	src, data, meta = cache_paths(name, path = path, cache_dir = cache_dir)
+	info = _read_meta(meta)
+
+	#pickles are only read back by the pandas version that wrote them
+	if info is None or info.get('version') != CACHE_VERSION \
+		or info.get('pandas') != pd.__version__ or not os.path.exists(data):
+		return None
+
+	st = os.stat(src)
+
+	if st.st_size != info['size']:
+		return None
+
+	if st.st_mtime_ns == info['mtime_ns']:
+		return info
+
+	#touched but maybe not changed; compare contents
+	if file_hash(src) != info['sha1']:
+		return None
+
+	info['mtime_ns'] = st.st_mtime_ns
+
+	try:
+		_write_meta(meta, info)
+	except OSError:
+		pass
+
+	return info
+
+def is_fresh(name, path = None, cache_dir = None):
+	'''
+	Checks whether the cached copy of a table matches its source csv
+
+	The cache is fresh if the csv size and modification time match those
+	stored when the cache was written. If only the modification time
+	differs, the csv is re-hashed and the cache is kept if the content is
+	unchanged.
+
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `analysis_code.TABLES`
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	cache_dir : str or None
+		Cache directory; defaults to '.table_cache' within the data directory
+
+	Returns
+	-------
+	fresh : bool
+		True if the cached table can be used
+	'''
+
+	return _fresh_meta(name, path, cache_dir) is not None
+
+def build_cache(name, path = None, cache_dir = None):
+	'''
+	Parses a source csv and writes its typed binary copy to the cache
+
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `analysis_code.TABLES`
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	cache_dir : str or None
+		Cache directory; defaults to '.table_cache' within the data directory
+
+	Returns
+	-------
+	df : pd.DataFrame
+		Typed raw table, without the columns of `SKIPPED`
+	'''
+
+	src, data, meta = cache_paths(name, path = path, cache_dir = cache_dir)
+
+	#hash first so that an edit during parsing is caught on the next load
+	st = os.stat(src)
+	sha1 = file_hash(src)
+
+	df = to_typed(read_table(name, path = path))
+	df = df.drop(columns = [c for c in SKIPPED if c in df.columns])
+
+	try:
+		os.makedirs(os.path.dirname(data), exist_ok = True)
+		_write(df, data)
+
+		_write_meta(meta, {
+			'version': CACHE_VERSION,
+			'pandas': pd.__version__,
+			'source': os.path.basename(src),
+			'sha1': sha1,
+			'size': st.st_size,
+			'mtime_ns': st.st_mtime_ns,
+			})
+
+	#read-only data directories just don't get a cache
+	except OSError:
+		pass
+
+	return df
+
+def read_cached(name, path = None, cache_dir = None, columns = None):
+	'''
+	Reads a table from the binary cache, rebuilding it if the csv changed
+
+	Parameters
+	----------
+	name : str
+		Table name; must be a key in `analysis_code.TABLES`
+
+	path : str or None
+		Data directory; defaults to `analysis_code.path`
+
+	cache_dir : str or None
+		Cache directory; defaults to '.table_cache' within the data directory
+
+	columns : list or None
+		Columns to return; defaults to all cached columns
+
+	Returns
+	-------
+	df : pd.DataFrame
+		Typed raw table, with the same index as `analysis_code.read_table`
+		but without the columns of `SKIPPED`
+	'''
+
+	src, data, meta = cache_paths(name, path = path, cache_dir = cache_dir)
+
+	#the metadata is read once, by the freshness check
+	if _fresh_meta(name, path, cache_dir) is None:
+		df = build_cache(name, path = path, cache_dir = cache_dir)
+		return df if columns is None else df[columns]
+
+	return _read(data, columns = columns)
@@ -0,0 +1,8 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: TEST CONFIGURATION
+
+#import packages
+import os
+import sys
+
+#the modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
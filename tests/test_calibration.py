@@ -0,0 +1,98 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: INTER-LABORATORY CALIBRATION TESTS
+
+#import packages
+import numpy as np
+import pandas as pd
+import pytest
+
+from calibration import solve_calibration
+
+#"true" Dp17O and d18O of each standard, as measured by the anchor lab
+TRUE = {'S1': -0.10, 'S2': -0.05, 'S3': 0.02, 'S4': -0.08, 'S5': 0.30}
+D18O = {'S1': 0.0, 'S2': 10.0, 'S3': 20.0, 'S4': 11.0, 'S5': 22.0}
+
+#line lab: measured = true + m*d18O + b
+M_B, B_B = 0.01, 0.05
+
+#offset lab: the two standards disagree, so b is their mean difference
+TH_OFFSETS = {'S2': 0.10, 'S4': 0.14}
+
+#chain: JO shares S3 with the anchor and S5 with JN only
+B_JO, B_JN = -0.04, 0.07
+
+#define fixtures and tests
+@pytest.fixture
+def stds():
+	'''
+	Hand-built standards table with one lab of each calibration mode
+	'''
+
+	rows = [(s, 'Sh', D18O[s], TRUE[s]) for s in ['S1', 'S2', 'S3', 'S4']]
+
+	rows += [(s, 'B', D18O[s], TRUE[s] + M_B*D18O[s] + B_B)
+		for s in ['S1', 'S3']]
+
+	rows += [(s, 'Th', D18O[s], TRUE[s] + b) for s, b in TH_OFFSETS.items()]
+
+	rows += [(s, 'JO', D18O[s], TRUE[s] + B_JO) for s in ['S3', 'S5']]
+
+	rows += [('S5', 'JN', D18O['S5'], TRUE['S5'] + B_JN)]
+
+	#a lab sharing no standard with the others
+	rows += [('S9', 'TT', 5.0, 0.5)]
+
+	df = pd.DataFrame(rows,
+		columns = ['standard', 'lab', 'd18O_mean', 'Dp17O_5305_mean'])
+	df['Dp17O_5305_std'] = 0.01
+
+	return df.set_index('standard')
+
+@pytest.fixture
+def cal(stds):
+	cal_df, _ = solve_calibration(stds, cache = False)
+	return cal_df
+
+def test_anchor(cal):
+	assert cal.loc['Sh', 'mode'] == 'anchor'
+	assert cal.loc['Sh', 'hops'] == 0
+	assert cal.loc['Sh', 'm'] == 0 and cal.loc['Sh', 'b'] == 0
+
+def test_direct_line(cal):
+	assert cal.loc['B', 'mode'] == 'line'
+	assert cal.loc['B', 'hops'] == 1
+	np.testing.assert_allclose(cal.loc['B', ['m', 'b']].to_numpy(float),
+		[M_B, B_B], atol = 1e-9)
+
+def test_offset_only(cal):
+	assert cal.loc['Th', 'mode'] == 'offset'
+	assert cal.loc['Th', 'm'] == 0
+	np.testing.assert_allclose(cal.loc['Th', 'b'],
+		np.mean(list(TH_OFFSETS.values())), atol = 1e-9)
+
+def test_two_hop_chain(cal):
+	assert cal.loc['JO', 'hops'] == 1
+	assert cal.loc['JN', 'hops'] == 2
+	assert cal.loc['JN', 'mode'] == 'offset'
+
+	#JO's offset is fixed by S3; S5's true value then follows from JO, and
+	# JN's offset from S5
+	np.testing.assert_allclose(cal.loc['JO', 'b'], B_JO, atol = 1e-9)
+	np.testing.assert_allclose(cal.loc['JN', 'b'], B_JN, atol = 1e-9)
+
+def test_true_values(stds):
+	_, true = solve_calibration(stds, cache = False)
+
+	np.testing.assert_allclose(true[['S1', 'S3', 'S5']],
+		[TRUE['S1'], TRUE['S3'], TRUE['S5']], atol = 1e-9)
+
+def test_unconnected_lab(cal):
+	assert cal.loc['TT', ['m', 'b']].isna().all()
+
+def test_correction_recovers_true_values(stds, cal):
+	m = cal['m'].reindex(stds['lab']).to_numpy()
+	b = cal['b'].reindex(stds['lab']).to_numpy()
+	corr = stds['Dp17O_5305_mean'].to_numpy() - m*stds['d18O_mean'] - b
+
+	ok = stds['lab'].isin(['Sh', 'B', 'JO', 'JN']).to_numpy()
+	np.testing.assert_allclose(corr[ok],
+		stds.index[ok].map(TRUE).to_numpy(float), atol = 1e-9)
@@ -0,0 +1,150 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: ISOTOPE CONVERSION TESTS
+
+#import packages
+import numpy as np
+import pytest
+
+import analysis_code as ac
+
+#round-trip tolerances (permil) by dtype
+ATOL = {np.float64: 1e-9, np.float32: 5e-4}
+
+#define fixtures and tests
+@pytest.fixture(params = [np.float64, np.float32])
+def dtype(request):
+	return request.param
+
+@pytest.fixture
+def values(dtype):
+	'''
+	d18O and Dp17O values spanning the compilations, including O-MIF
+	'''
+
+	rng = np.random.default_rng(0)
+	d18O = rng.uniform(-50, 150, 10000).astype(dtype)
+	Dp17O = rng.uniform(-1, 40, 10000).astype(dtype)
+
+	return d18O, Dp17O
+
+def test_d_dp_round_trip(values, dtype):
+	d18O, _ = values
+
+	dp = ac.d_to_dp(d18O)
+	d = ac.dp_to_d(dp)
+
+	assert dp.dtype == dtype and d.dtype == dtype
+	np.testing.assert_allclose(d, d18O, rtol = 0, atol = ATOL[dtype])
+
+def test_R_round_trip(values, dtype):
+	d18O, Dp17O = values
+
+	R17, R18 = ac.Dp_d_to_R(Dp17O, d18O)
+	Dp, d = ac.R_to_Dp_d(R17, R18)
+
+	assert R17.dtype == dtype and Dp.dtype == dtype
+	np.testing.assert_allclose(d, d18O, rtol = 0, atol = ATOL[dtype])
+	np.testing.assert_allclose(Dp, Dp17O, rtol = 0, atol = ATOL[dtype])
+
+def test_R_round_trip_other_theta(values, dtype):
+	d18O, Dp17O = values
+
+	R17, R18 = ac.Dp_d_to_R(Dp17O, d18O, th = 0.528)
+	Dp, d = ac.R_to_Dp_d(R17, R18, th = 0.528)
+
+	np.testing.assert_allclose(Dp, Dp17O, rtol = 0, atol = ATOL[dtype])
+
+def test_R_to_Dp_d_uses_ln_R18():
+	#R17 on the reference line has Dp17O = 0 whatever R18 is; the old
+	# ln(R17) - th*ln(R17) gave 1000*(1 - th)*ln(R17) instead
+	th = 0.5305
+	R18 = np.array([0.98, 1.0, 1.02, 1.1])
+	R17 = R18**th * np.exp(np.array([0, 1e-3, -2e-3, 5e-3]))
+
+	Dp, d = ac.R_to_Dp_d(R17, R18, th = th)
+
+	np.testing.assert_allclose(Dp, [0, 1, -2, 5], atol = 1e-10)
+	np.testing.assert_allclose(d, 1000*(R18 - 1), atol = 1e-10)
+
+def test_Dp_d_to_R_out_aliases_d18O(values, dtype):
+	d18O, Dp17O = values
+	R17_ref, R18_ref = ac.Dp_d_to_R(Dp17O, d18O)
+
+	#R18 written over d18O
+	buf = d18O.copy()
+	R17 = np.empty_like(buf)
+	R17, R18 = ac.Dp_d_to_R(Dp17O, buf, out = (R17, buf))
+
+	assert R18 is buf
+	np.testing.assert_array_equal(R17, R17_ref)
+	np.testing.assert_array_equal(R18, R18_ref)
+
+def test_R_to_Dp_d_preallocated_out(values):
+	d18O, Dp17O = values
+	R17, R18 = ac.Dp_d_to_R(Dp17O, d18O)
+
+	out = (np.empty_like(R17), np.empty_like(R18))
+	Dp, d = ac.R_to_Dp_d(R17, R18, out = out)
+
+	assert Dp is out[0] and d is out[1]
+	np.testing.assert_array_equal((Dp, d), ac.R_to_Dp_d(R17, R18))
+
+def test_d_to_dp_in_place(values, dtype):
+	d18O, _ = values
+	ref = ac.d_to_dp(d18O)
+
+	buf = d18O.copy()
+	assert ac.d_to_dp(buf, out = buf) is buf
+	np.testing.assert_array_equal(buf, ref)
+
+	assert ac.dp_to_d(buf, out = buf) is buf
+	np.testing.assert_allclose(buf, d18O, rtol = 0, atol = ATOL[dtype])
+
+@pytest.mark.parametrize('alias', ['dp17O', 'dp18O'])
+def test_dp_to_Dp_out_aliases(values, dtype, alias):
+	d18O, Dp17O = values
+	dp18O = ac.d_to_dp(d18O)
+	dp17O = Dp17O + dtype(0.5305)*dp18O
+	ref = ac.dp_to_Dp(dp17O, dp18O)
+
+	bufs = {'dp17O': dp17O.copy(), 'dp18O': dp18O.copy()}
+	out = ac.dp_to_Dp(bufs['dp17O'], bufs['dp18O'], out = bufs[alias])
+
+	assert out is bufs[alias]
+	np.testing.assert_allclose(out, ref, rtol = 0,
+		atol = 10*ATOL[dtype])
+
+def test_convert_th(values, dtype):
+	d18O, Dp17O = values
+	dp18O = ac.d_to_dp(d18O.astype(np.float64))
+
+	Dp = ac.convert_th(Dp17O, d18O, 0.5305, 0.528)
+
+	#same dp17O on both reference lines
+	expect = Dp17O.astype(np.float64) + (0.5305 - 0.528)*dp18O
+	np.testing.assert_allclose(Dp, expect, rtol = 0, atol = ATOL[dtype])
+
+	#and back
+	back = ac.convert_th(Dp, d18O, 0.528, 0.5305)
+	np.testing.assert_allclose(back, Dp17O, rtol = 0, atol = ATOL[dtype])
+
+def test_convert_th_matches_R_path(values):
+	d18O, Dp17O = values
+
+	R17, R18 = ac.Dp_d_to_R(Dp17O, d18O, th = 0.5305)
+	Dp_528, _ = ac.R_to_Dp_d(R17, R18, th = 0.528)
+
+	np.testing.assert_allclose(ac.convert_th(Dp17O, d18O, 0.5305, 0.528),
+		Dp_528, rtol = 0, atol = ATOL[Dp17O.dtype.type])
+
+def test_convert_th_out(values):
+	d18O, Dp17O = values
+	ref = ac.convert_th(Dp17O, d18O, 0.5305, 0.52)
+
+	#out may be d18O
+	buf = d18O.copy()
+	assert ac.convert_th(Dp17O, buf, 0.5305, 0.52, out = buf) is buf
+	np.testing.assert_array_equal(buf, ref)
+
+	#but not Dp17O
+	with pytest.raises(ValueError):
+		ac.convert_th(Dp17O, d18O, 0.5305, 0.52, out = Dp17O)
@@ -0,0 +1,68 @@
+### TRIPLE-OXYGEN ISOTOPE DATABASE: SUBMISSION INGEST TESTS
+
+#import packages
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+
+#define fixtures and tests
+def _exp_csv(tmp_path, exp_nr):
+	'''
+	Writes a valid experiment submission with the given exp_nr of each row
+	'''
+
+	n = len(exp_nr)
+	df = pd.DataFrame({
+		'sample_ID': ['s%d' % i for i in range(n)],
+		'experiment_type': 'ozone_generation_electrical',
+		'exp_nr': exp_nr,
+		'wavelength': '',
+		'T_C': 25.0,
+		'compound': 'O3',
+		'd18O_mean': np.linspace(10, 50, n),
+		'd18O_std': '',
+		'd17O_mean': np.linspace(10, 50, n),
+		'd17O_std': '',
+		'reference': 'Test et al. (2020) GCA',
+		'notes': '',
+		})
+
+	fname = tmp_path / 'sub.csv'
+	df.to_csv(fname, index = False)
+
+	return str(fname)
+
+def _store(summary):
+	return pd.read_feather(summary['store'])
+
+@pytest.mark.parametrize('chunk', [3, 5, ingest.CHUNK])
+def test_contiguous_experiments_are_clean(tmp_path, chunk):
+	fname = _exp_csv(tmp_path, [2]*4 + [5]*3 + [9]*2)
+
+	s = ingest.ingest('exp', fname, chunk = chunk, exp_start = None)
+
+	assert s['rejected'] == 0
+	assert _store(s)['exp_nr'].tolist() == [2]*4 + [5]*3 + [9]*2
+
+@pytest.mark.parametrize('chunk', [3, 5, ingest.CHUNK])
+def test_interleaved_experiment_is_rejected_whole(tmp_path, chunk):
+	fname = _exp_csv(tmp_path, [2]*2 + [5]*8 + [2]*6)
+
+	s = ingest.ingest('exp', fname, chunk = chunk, exp_start = None)
+
+	assert _store(s)['exp_nr'].tolist() == [5]*8
+	assert s['rejected'] == 8
+	assert s['errors'] == {'rows of experiment 2 are not contiguous': 8}
+
+	report = pd.read_csv(s['report'])
+	assert report['line'].tolist() == [2, 3] + list(range(12, 18))
+
+def test_exp_nr_below_start_is_rejected(tmp_path):
+	fname = _exp_csv(tmp_path, [3]*2 + [7]*2)
+
+	s = ingest.ingest('exp', fname, exp_start = 5)
+
+	assert _store(s)['exp_nr'].tolist() == [7]*2
+	assert s['errors'] == {'exp_nr must be at least 5': 2}